@@ -5,6 +5,13 @@ import plotly.express as px
 import plotly.graph_objects as go
 from sktime.performance_metrics.forecasting import mean_absolute_error
 import os
+import pyarrow.dataset as ds
+
+def read_station_swaps(path, station_id):
+    # Dataset particionado por mês e ordenado por estação: o filtro lê apenas os row groups da estação
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    columns = [c for c in dataset.schema.names if c != 'period']
+    return dataset.to_table(columns=columns, filter=ds.field('swap_station_id') == int(station_id)).to_pandas()
 
 def analytics_page():
     cols = st.columns([1, 1, 15])
@@ -24,17 +31,15 @@ def analytics_page():
     }
 
     for key, path in arquivos.items():
-        if key not in st.session_state:
+        if key != 'swaps' and key not in st.session_state:
             st.session_state[key] = pd.read_parquet(path, engine='pyarrow')
 
     df_cabs_h = st.session_state['preds_cabinets_hourly']
     df_cabs_d = st.session_state['preds_cabinets_daily']
     df_sta_h = st.session_state['preds_stations_hourly']
     df_sta_d = st.session_state['preds_stations_daily']
-    df_all = st.session_state['swaps']
     df_sta_all = st.session_state['stations']
     
-    df = df_all[df_all['swap_station_id'].isin(df_sta_h.swap_station_id.unique())][:].reset_index(drop=True)
     df_sta = df_sta_all[df_sta_all['swap_station_id'].isin(df_sta_h.swap_station_id.unique())][:].reset_index(drop=True)
 
     # ------------ Seleções ------------
@@ -47,7 +52,10 @@ def analytics_page():
 
     sta_select = df_sta[df_sta['swap_station_name']==nome][:].reset_index(drop=True)
     id = sta_select.swap_station_id[0]
-    swaps_select = df[df['swap_station_id']==id][:].reset_index(drop=True)
+    if st.session_state.get('swaps_station_id') != id:
+        st.session_state['swaps'] = read_station_swaps(arquivos['swaps'], id)
+        st.session_state['swaps_station_id'] = id
+    swaps_select = st.session_state['swaps']
 
     st.write(f'## {nome} - ID {sta_select.swap_station_id[0]}')
     st.caption(f'{sta_select.address[0]}')
@@ -97,6 +105,7 @@ def analytics_page():
     )
 
     temp = swaps_select.dropna(subset=['status']).status.value_counts()
+    temp = temp[temp > 0]  # status é categórico: remove categorias sem ocorrência
     completed = temp.get('completed', 0)
     swap_success = temp.get('swap_success_door_left_opened', 0)
     success = round(((completed + swap_success) / temp.sum()) * 100, 2)     
@@ -188,6 +197,7 @@ def analytics_page():
     tile.metric('Média de Swaps/Dia', df_cabinet_d.counts[0].mean(), diff)
  
     temp = df_cabinet.dropna(subset=['status']).status.value_counts()
+    temp = temp[temp > 0]  # status é categórico: remove categorias sem ocorrência
     completed = temp.get('completed', 0)
     swap_success = temp.get('swap_success_door_left_opened', 0)
     success = round(((completed + swap_success) / temp.sum()) * 100, 2) 
@@ -0,0 +1,57 @@
+# Benchmark: motores de previsão (Prophet por id vs. LightGBM global) em tempo de ajuste e erro.
+# Os últimos 7 dias de cada série ficam de fora do treino e são comparados com a previsão (MAE e
+# cobertura do intervalo de 95%, sobre a saída final de make_predictions, com a margem de 10% incluída).
+# Uso (a partir de src/): python -m benchmarks.bench_forecasters --stations 10
+import argparse
+import logging
+import time
+import pandas as pd
+
+from modeling.global_forecaster import HORIZONS
+from modeling.make_predictions import make_predictions
+from modeling.transform_model_data import transform_model_data, MODEL_COLUMNS
+from preprocessing.storage import read_dataset
+
+SERIES = [('cabinets_hourly', 'datetime', 'cabinet_id'), ('cabinets_daily', 'date', 'cabinet_id'),
+          ('stations_hourly', 'datetime', 'swap_station_id'), ('stations_daily', 'date', 'swap_station_id')]
+
+
+def holdout(df_pred, df_test, time_col, id_col):
+    # MAE e cobertura do intervalo nos instantes de teste
+    df_eval = df_test[[id_col, time_col, 'counts']].merge(
+        df_pred[[id_col, 'ds', 'predicted', 'lower_interval', 'upper_interval']],
+        left_on=[id_col, time_col], right_on=[id_col, 'ds']
+    )
+    mae = (df_eval['counts'] - df_eval['predicted']).abs().mean()
+    coverage = df_eval['counts'].between(df_eval['lower_interval'], df_eval['upper_interval']).mean()
+    return mae, coverage
+
+
+def main(swaps_path, top_stations=10, engines=('prophet', 'global'), workers=1):
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    df = read_dataset(swaps_path, columns=MODEL_COLUMNS)
+    series = dict(zip([name for name, _, _ in SERIES], transform_model_data(df, top_stations=top_stations)))
+
+    print(f"{'series':>16} {'ids':>5} {'engine':>8} {'fit+predict (s)':>16} {'MAE':>8} {'coverage':>9}")
+    for name, time_col, id_col in SERIES:
+        df_series = series[name]
+        freq, horizon = HORIZONS[time_col]
+        cutoff = df_series[time_col].max() - pd.Timedelta(horizon, unit=freq)
+        df_train = df_series[df_series[time_col] <= cutoff].reset_index(drop=True)
+        df_test = df_series[df_series[time_col] > cutoff]
+        for engine in engines:
+            t0 = time.perf_counter()
+            df_pred = make_predictions(df_train, time_col, id_col, workers=workers, engine=engine)
+            elapsed = time.perf_counter() - t0
+            mae, coverage = holdout(df_pred, df_test, time_col, id_col)
+            print(f'{name:>16} {df_series[id_col].nunique():>5} {engine:>8} {elapsed:>16.2f} {mae:>8.2f} {coverage:>9.1%}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--swaps', default='../data/processed/swaps_processed.parquet', help='processed swaps dataset')
+    parser.add_argument('--stations', type=int, default=10, help='top stations to forecast (0 = all)')
+    parser.add_argument('--engines', nargs='+', choices=['prophet', 'global'], default=['prophet', 'global'])
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    main(args.swaps, args.stations, args.engines, args.workers)
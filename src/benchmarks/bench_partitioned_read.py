@@ -0,0 +1,56 @@
+# Benchmark: leitura de uma estação / janela de tempo em parquet único vs. dataset particionado por mês
+# Uso (a partir de src/): python -m benchmarks.bench_partitioned_read
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_schema import make_compact
+from preprocessing.storage import read_dataset, write_dataset
+from preprocessing.swaps_transform import SORT_COLUMNS
+
+
+def timeit(fn, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, len(result)
+
+
+def main(n_rows=5_000_000):
+    df = make_compact(n_rows).sort_values(SORT_COLUMNS).reset_index(drop=True)
+    station = int(df['swap_station_id'].iloc[len(df) // 2])
+    start, end = pd.Timestamp('2025-02-10'), pd.Timestamp('2025-02-16 23:59:59')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single_path = os.path.join(tmp, 'swaps_single.parquet')
+        dataset_path = os.path.join(tmp, 'swaps_dataset.parquet')
+        df.to_parquet(single_path, index=False, engine='pyarrow', compression='snappy')
+        write_dataset(df, dataset_path, sort_columns=SORT_COLUMNS)
+
+        # Antes: lê tudo e filtra no pandas (como o app fazia)
+        def before_station():
+            d = pd.read_parquet(single_path, engine='pyarrow')
+            return d[d['swap_station_id'] == station]
+
+        def before_window():
+            d = pd.read_parquet(single_path, engine='pyarrow')
+            return d[(d['swap_station_id'] == station) & d['created_at'].between(start, end)]
+
+        cases = [
+            ('station', before_station, lambda: read_dataset(dataset_path, ids=[station])),
+            ('station+week', before_window, lambda: read_dataset(dataset_path, ids=[station], start=start, end=end))
+        ]
+        print(f"{'query':>14} {'rows':>8} {'full read (ms)':>15} {'dataset (ms)':>13} {'speedup':>8}")
+        for name, before, after in cases:
+            t_old, n_old = timeit(before)
+            t_new, n_new = timeit(after)
+            assert n_old == n_new
+            print(f'{name:>14} {n_new:>8,} {t_old * 1e3:>15.1f} {t_new * 1e3:>13.1f} {t_old / t_new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
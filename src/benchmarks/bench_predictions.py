@@ -0,0 +1,96 @@
+# Benchmark: estrutura do loop por id de make_predictions (máscara por id + concat a cada id vs. partição única
+# com concat no final ou gravação direta no dataset), com um modelo trivial no lugar do Prophet para isolar
+# o custo do loop. O custo do loop antigo cresce com ids x linhas; o novo, com as linhas.
+# Uso (a partir de src/): python -m benchmarks.bench_predictions --ids 500 1000 2000 4000
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from modeling.make_predictions import partition_ids
+from modeling.transform_model_data import group_data
+from preprocessing.storage import dataset_writer, read_dataset
+
+
+def make_series(n_ids, hours=168, seed=0):
+    # Séries horárias de n_ids cabinets (mesmas colunas de transform_model_data)
+    rng = np.random.default_rng(seed)
+    n = n_ids * hours * 2
+    df = pd.DataFrame({
+        'cabinet_id': rng.integers(0, n_ids, n).astype('int32'),
+        'datetime': pd.Timestamp('2025-03-01') + pd.to_timedelta(rng.integers(0, hours, n), unit='h')
+    })
+    return group_data(df, 'datetime', 'cabinet_id')
+
+
+def naive_forecast(df_sub, id):
+    # Modelo trivial (média móvel) com a mesma saída de predict_id: uma linha por instante, ordenada por ds
+    df_pred = df_sub.rename(columns={'datetime': 'ds'})
+    df_pred['predicted'] = df_pred['rolling_mean_24'].round()
+    df_pred['id'] = id
+    return df_pred
+
+
+def mask_concat(df):
+    # Estrutura anterior de make_predictions
+    df_preds = pd.DataFrame()
+    for id in df['cabinet_id'].unique():
+        df_sub = df[df['cabinet_id'] == id].copy().reset_index(drop=True)
+        df_preds = pd.concat([df_preds, naive_forecast(df_sub, id)])
+    return df_preds
+
+
+def partition_concat(df):
+    return pd.concat([naive_forecast(df_sub, id) for id, df_sub in partition_ids(df, 'cabinet_id')])
+
+
+def partition_stream(df, path):
+    with dataset_writer(path, time_col='ds') as append:
+        for id, df_sub in partition_ids(df, 'cabinet_id', sort=True):
+            append(naive_forecast(df_sub, id))
+    return path
+
+
+def run(fn):
+    # Tempo sem o tracemalloc (que deixa as alocações bem mais lentas); pico de memória numa segunda execução
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main(sizes, hours=168):
+    print(f"{'ids':>7} {'rows':>11} {'case':>20} {'time (s)':>9} {'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory(prefix='bench_predictions_') as tmp:
+        for n_ids in sizes:
+            df = make_series(n_ids, hours)
+            reference = None
+            for name, fn in [
+                ('mask + concat loop', lambda: mask_concat(df)),
+                ('partition + concat', lambda: partition_concat(df)),
+                ('partition + stream', lambda: partition_stream(df, os.path.join(tmp, f'pred_{n_ids}.parquet')))
+            ]:
+                elapsed, peak, result = run(fn)
+                if isinstance(result, str):
+                    result = read_dataset(result, columns=list(reference.columns), time_col='ds')
+                result = result.sort_values(['id', 'ds'], ignore_index=True)
+                if reference is None:
+                    reference = result
+                else:
+                    pd.testing.assert_frame_equal(reference, result, check_dtype=False, check_categorical=False)
+                print(f'{n_ids:>7,} {len(df):>11,} {name:>20} {elapsed:>9.2f} {peak:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ids', type=int, nargs='+', default=[500, 1_000, 2_000])
+    parser.add_argument('--hours', type=int, default=168, help='length of each hourly series')
+    args = parser.parse_args()
+    main(args.ids, args.hours)
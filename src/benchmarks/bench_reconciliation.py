@@ -0,0 +1,77 @@
+# Benchmark: previsões independentes por nível vs. reconciliação hierárquica cabinet → estação.
+# Os dois níveis são ajustados uma vez com os últimos 7 dias fora do treino; cada método usa só os níveis de que
+# precisa (o tempo soma os ajustes desses níveis e a reconciliação). Mostra o MAE nos 7 dias de teste e a maior
+# diferença entre a previsão de uma estação e a soma das de seus cabinets.
+# Uso (a partir de src/): python -m benchmarks.bench_reconciliation --stations 10
+import argparse
+import logging
+import time
+import pandas as pd
+
+from benchmarks.bench_forecasters import holdout
+from modeling.global_forecaster import HORIZONS
+from modeling.make_predictions import make_predictions
+from modeling.reconciliation import reconcile, METHODS, FITTED_LEVELS
+from modeling.transform_model_data import transform_model_data, MODEL_COLUMNS
+from preprocessing.storage import read_dataset
+
+GRAINS = [('hourly', 'datetime', 0, 2), ('daily', 'date', 1, 3)]
+
+
+def split(df_series, time_col):
+    freq, horizon = HORIZONS[time_col]
+    cutoff = df_series[time_col].max() - pd.Timedelta(horizon, unit=freq)
+    return df_series[df_series[time_col] <= cutoff].reset_index(drop=True), df_series[df_series[time_col] > cutoff]
+
+
+def coherence_gap(pred_cabinets, pred_stations, hierarchy):
+    # Maior |estação - soma dos cabinets| entre as previsões
+    cabinets = pred_cabinets.merge(hierarchy, on='cabinet_id').groupby(['swap_station_id', 'ds'])['predicted'].sum()
+    stations = pred_stations.set_index(['swap_station_id', 'ds'])['predicted']
+    return (stations - cabinets).abs().max()
+
+
+def main(swaps_path, top_stations=10, engine='prophet', workers=1):
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    df = read_dataset(swaps_path, columns=MODEL_COLUMNS)
+    *series, hierarchy = transform_model_data(df, top_stations=top_stations, hierarchy=True)
+
+    print(f"{'grain':>7} {'method':>10} {'time (s)':>9} {'cabinet MAE':>12} {'station MAE':>12} {'max gap':>8}")
+    for grain, time_col, cabinets, stations in GRAINS:
+        (train_cab, test_cab), (train_sta, test_sta) = split(series[cabinets], time_col), split(series[stations], time_col)
+        base, fit_time = {}, {}
+        for id_col, df_train in [('cabinet_id', train_cab), ('swap_station_id', train_sta)]:
+            t0 = time.perf_counter()
+            base[id_col] = make_predictions(df_train, time_col, id_col, workers=workers, engine=engine, rounded=False)
+            fit_time[id_col] = time.perf_counter() - t0
+
+        # Independentes: cada nível arredondado por conta própria, como sem reconciliação
+        rounded = {level: preds.copy() for level, preds in base.items()}
+        for preds in rounded.values():
+            preds[['predicted', 'upper_interval', 'lower_interval']] = preds[['predicted', 'upper_interval', 'lower_interval']].round()
+
+        for method in ['independent', *METHODS]:
+            levels = ['cabinet_id', 'swap_station_id'] if method == 'independent' else FITTED_LEVELS[method]
+            elapsed = sum(fit_time[level] for level in levels)
+            pred_cab, pred_sta = rounded['cabinet_id'], rounded['swap_station_id']
+            if method != 'independent':
+                t0 = time.perf_counter()
+                pred_cab, pred_sta = reconcile(
+                    method, hierarchy, time_col, train_cab, train_sta,
+                    *[base[level] if level in levels else None for level in ['cabinet_id', 'swap_station_id']]
+                )
+                elapsed += time.perf_counter() - t0
+            mae_cab, _ = holdout(pred_cab, test_cab, time_col, 'cabinet_id')
+            mae_sta, _ = holdout(pred_sta, test_sta, time_col, 'swap_station_id')
+            gap = coherence_gap(pred_cab, pred_sta, hierarchy)
+            print(f'{grain:>7} {method:>10} {elapsed:>9.2f} {mae_cab:>12.3f} {mae_sta:>12.3f} {gap:>8.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--swaps', default='../data/processed/swaps_processed.parquet', help='processed swaps dataset')
+    parser.add_argument('--stations', type=int, default=10, help='top stations to forecast (0 = all)')
+    parser.add_argument('--engine', choices=['prophet', 'global'], default='prophet')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    main(args.swaps, args.stations, args.engine, args.workers)
@@ -0,0 +1,144 @@
+# Benchmark de escala: roda cada estágio do pipeline em tamanhos crescentes de dados sintéticos e
+# reporta throughput e memória; o expoente de escala entre tamanhos consecutivos (1.0 = linear)
+# aponta onde o custo cresce mais rápido que os dados.
+# Uso (a partir de src/):
+#   python -m benchmarks.bench_scale --sizes 100000 300000 1000000 3000000 --stages swaps traffic merge group
+import argparse
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from instrumentation import start_run, measure, run_records
+
+STAGES = ['swaps', 'stations', 'traffic', 'merge', 'group', 'predict']
+CLIFF_EXPONENT = 1.3
+
+
+def scale_inputs(n_swaps):
+    # Proporções do cenário alvo: 100M swaps, 10k estações, 1M pontos de tráfego
+    return {'n_swaps': n_swaps, 'n_stations': max(10, n_swaps // 10_000), 'n_traffic': max(1_000, n_swaps // 100)}
+
+
+def prepare_inputs(n_swaps, data_dir, seed=0):
+    # Gera os parquets brutos e as versões processadas de uma escala (num processo separado,
+    # para que o pico de memória da geração não entre nas medições)
+    from benchmarks.synthetic_data import write_raw_files
+    from preprocessing.swaps_transform import transform_swaps_data
+    from preprocessing.stations_transform import transform_stations_data
+    from preprocessing.traffic_transform_v3 import transform_traffic_data
+    from preprocessing.schema import write_parquet
+
+    sizes = scale_inputs(n_swaps)
+    out_dir = os.path.join(data_dir, f'n{n_swaps}')
+    paths = write_raw_files(out_dir, sizes['n_stations'], sizes['n_traffic'], n_swaps, seed=seed)
+    for name, transform in [
+        ('swaps', transform_swaps_data), ('stations', transform_stations_data), ('traffic', transform_traffic_data)
+    ]:
+        paths[f'{name}_processed'] = os.path.join(out_dir, f'{name}_processed.parquet')
+        write_parquet(transform(pd.read_parquet(paths[name])), paths[f'{name}_processed'])
+    return paths
+
+
+def run_stage(stage, n_swaps, paths, metrics_path=None):
+    # Executado num processo novo: o pico de RSS e os caches não carregam medições anteriores
+    from preprocessing.swaps_transform import transform_swaps_data
+    from preprocessing.stations_transform import transform_stations_data
+    from preprocessing.traffic_transform_v3 import transform_traffic_data
+    from preprocessing.merge_data_v2 import merge_data
+    from modeling.transform_model_data import group_data
+
+    start_run(metrics_path)
+    tags = {'kind': 'scale', **scale_inputs(n_swaps)}
+    transforms = {'swaps': transform_swaps_data, 'stations': transform_stations_data, 'traffic': transform_traffic_data}
+
+    if stage in transforms:
+        df = pd.read_parquet(paths[stage])
+        with measure(stage, inputs=df, **tags) as m:
+            m['outputs'] = transforms[stage](df)
+        return run_records().to_dict('records')
+
+    df_swaps = pd.read_parquet(paths['swaps_processed'])
+    if stage == 'merge':
+        df_stations = pd.read_parquet(paths['stations_processed'])
+        df_traffic = pd.read_parquet(paths['traffic_processed'])
+        with measure(stage, inputs=df_swaps, **tags) as m:
+            m['outputs'] = merge_data(df_swaps, df_stations, df_traffic)
+        return run_records().to_dict('records')
+
+    # Séries horárias por cabinet (todas as cabinets: o produto cabinets x horas é o que cresce)
+    df_swaps['datetime'] = df_swaps['created_at'].dt.floor('h')
+    df_swaps['date'] = df_swaps['created_at'].dt.floor('D')
+    if stage == 'group':
+        with measure(stage, inputs=df_swaps, **tags) as m:
+            m['outputs'] = group_data(df_swaps, 'datetime', 'cabinet_id')
+        return run_records().to_dict('records')
+
+    if stage == 'predict':
+        try:
+            from modeling.make_predictions import make_predictions
+        except ImportError as e:
+            return [{'name': stage, 'status': f'skipped ({e})', **tags}]
+        # Uma série diária por estação, para as estações com mais swaps (mais séries quanto maior a escala)
+        n_series = max(2, n_swaps // 250_000)
+        top = df_swaps['swap_station_id'].value_counts().index[:n_series]
+        df_daily = group_data(df_swaps[df_swaps['swap_station_id'].isin(top)], 'date', 'swap_station_id')
+        with measure(stage, inputs=df_daily, n_series=n_series, **tags) as m:
+            m['outputs'] = make_predictions(df_daily, 'date', 'swap_station_id')
+        return run_records().to_dict('records')
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def scaling_report(records):
+    df = pd.DataFrame(records)
+    df['rows_per_s'] = (df['rows_in'] / df['wall_s']).round()
+    df = df.sort_values(['name', 'n_swaps'])
+    # Expoente local: log(t2/t1) / log(n2/n1) entre tamanhos consecutivos do mesmo estágio
+    grouped = df.groupby('name')
+    size_ratio = (df['rows_in'] / grouped['rows_in'].shift()).where(lambda r: r > 1)
+    df['scaling_exponent'] = (np.log(df['wall_s'] / grouped['wall_s'].shift()) / np.log(size_ratio)).round(2)
+    df['cliff'] = np.where(df['scaling_exponent'] > CLIFF_EXPONENT, '<<', '')
+    columns = ['name', 'n_swaps', 'n_stations', 'n_traffic', 'rows_in', 'rows_out', 'wall_s', 'rows_per_s',
+               'peak_rss_mb', 'peak_rss_delta_mb', 'scaling_exponent', 'cliff']
+    return df[[c for c in columns if c in df.columns]]
+
+
+def main(sizes, stages, seed=0, metrics_path=None, data_dir=None):
+    records = []
+    skipped = set()
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='bench_scale_') as tmp:
+        for n_swaps in sizes:
+            # Um processo novo para gerar os dados e outro para cada medição
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                paths = pool.submit(prepare_inputs, n_swaps, data_dir or tmp, seed).result()
+            for stage in stages:
+                if stage in skipped:
+                    continue
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    stage_records = pool.submit(run_stage, stage, n_swaps, paths, metrics_path).result()
+                r = stage_records[-1]
+                if str(r.get('status', '')).startswith('skipped'):
+                    print(f"{stage}: {r['status']}")
+                    skipped.add(stage)
+                    continue
+                records += stage_records
+                print(f"{stage:>9} n_swaps={n_swaps:>12,} wall={r['wall_s']:>8.2f}s peak_rss={r['peak_rss_mb']:>8.1f} MB")
+
+    if records:
+        print()
+        print(scaling_report(records).to_string(index=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 300_000, 1_000_000])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--metrics', default=None, help='also append the raw measurements to this JSON-lines file')
+    parser.add_argument('--data-dir', default=None, help='keep the generated inputs here instead of a temporary directory')
+    args = parser.parse_args()
+    main(args.sizes, args.stages, args.seed, args.metrics, args.data_dir)
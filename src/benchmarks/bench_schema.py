@@ -0,0 +1,72 @@
+# Benchmark: memória e leitura do swaps_processed no schema antigo (object/int64) vs. schema compacto
+# Uso (a partir de src/): python -m benchmarks.bench_schema
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from preprocessing.schema import compact, memory_report, write_parquet, SWAPS_DTYPES
+from preprocessing.time_features import add_time_features
+
+STATUS = ['completed', 'swap_success_door_left_opened', 'cancelled', 'failed']
+
+
+def make_compact(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01').value
+    created_at = pd.to_datetime(start + rng.integers(0, 60 * 24 * 120, n_rows) * 60 * 10**9)
+    df = pd.DataFrame({
+        'created_at': created_at,
+        'ended_at': created_at + pd.to_timedelta(rng.integers(0, 30, n_rows), unit='min'),
+        'cabinet_id': rng.integers(1, 5_000, n_rows),
+        'swap_station_id': rng.integers(1, 2_000, n_rows),
+        'rider_id': rng.integers(1, 200_000, n_rows),
+        'status': rng.choice(STATUS, n_rows),
+        'battery_in_level': rng.integers(0, 100, n_rows),
+        'battery_out_level': rng.integers(0, 100, n_rows)
+    })
+    df['battery_charged'] = df['battery_out_level'] - df['battery_in_level']
+    return compact(add_time_features(df), SWAPS_DTYPES)
+
+
+def to_legacy(df):
+    # Tipos do pipeline original: strings Python, datas como objetos date e inteiros int64
+    legacy = df.copy()
+    for col in ['status', 'day_period', 'day_of_week', 'rush_period']:
+        legacy[col] = legacy[col].astype(object)
+    for col in ['cabinet_id', 'swap_station_id', 'rider_id', 'battery_in_level', 'battery_out_level',
+                'battery_charged', 'month', 'hour', 'is_weekend']:
+        legacy[col] = legacy[col].astype('int64')
+    legacy['day'] = legacy['day'].dt.date
+    legacy['charging_duration_min'] = legacy['charging_duration_min'].astype('float64')
+    return legacy
+
+
+def read_time(path, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        pd.read_parquet(path, engine='pyarrow')
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n_rows=2_000_000):
+    df_new = make_compact(n_rows)
+    df_old = to_legacy(df_new)
+    print(memory_report(df_old, df_new).round(2).to_string())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, 'legacy.parquet')
+        new_path = os.path.join(tmp, 'compact.parquet')
+        df_old.to_parquet(old_path, index=False, engine='pyarrow', compression='snappy')
+        write_parquet(df_new, new_path)
+
+        print(f"\n{'schema':>10} {'file (MB)':>10} {'read (s)':>10}")
+        for name, path in [('legacy', old_path), ('compact', new_path)]:
+            print(f'{name:>10} {os.path.getsize(path) / 2**20:>10.1f} {read_time(path):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
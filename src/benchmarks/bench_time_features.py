@@ -0,0 +1,61 @@
+# Benchmark: features de tempo vetorizadas vs. caminho original com .apply
+# Uso (a partir de src/): python -m benchmarks.bench_time_features
+import time
+import numpy as np
+import pandas as pd
+
+from preprocessing.swaps_transform import get_period, rush_hour
+from preprocessing.time_features import add_time_features
+
+
+def legacy_time_features(df):
+    df['day'] = df['created_at'].dt.date
+    df['month'] = df['created_at'].dt.month
+    df['hour'] = df['created_at'].dt.hour
+    df['day_period'] = df['hour'].apply(get_period)
+    df['charging_duration_min'] = (df['ended_at'] - df['created_at']).dt.total_seconds() / 60
+    df['day_of_week'] = df['created_at'].dt.strftime('%a').str.lower()
+    df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
+    df['rush_period'] = df['hour'].apply(rush_hour)
+    return df
+
+
+def make_sample(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01').value
+    minutes = rng.integers(0, 60 * 24 * 120, n_rows)
+    created_at = pd.to_datetime(start + minutes * 60 * 10**9)
+    ended_at = created_at + pd.to_timedelta(rng.integers(0, 30, n_rows), unit='min')
+    return pd.DataFrame({'created_at': created_at, 'ended_at': ended_at})
+
+
+def timeit(fn, df, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        sample = df.copy()
+        t0 = time.perf_counter()
+        fn(sample)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_equal(df):
+    old = legacy_time_features(df.copy())
+    new = add_time_features(df.copy())
+    new['day'] = new['day'].dt.date
+    for col in ['day', 'month', 'hour', 'day_period', 'charging_duration_min', 'day_of_week', 'rush_period']:
+        pd.testing.assert_series_equal(old[col], new[col].astype(old[col].dtype), check_names=False, check_exact=False, rtol=1e-6)
+
+
+def main():
+    check_equal(make_sample(10_000))
+    print(f"{'rows':>12} {'apply (rows/s)':>16} {'vectorized (rows/s)':>20} {'speedup':>8}")
+    for n_rows in [100_000, 1_000_000, 5_000_000]:
+        df = make_sample(n_rows)
+        t_old = timeit(legacy_time_features, df)
+        t_new = timeit(add_time_features, df)
+        print(f'{n_rows:>12,} {n_rows / t_old:>16,.0f} {n_rows / t_new:>20,.0f} {t_old / t_new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Benchmark: dedup dos pontos de tráfego (sort + drop_duplicates vs. groupby por hash, exato e em grade)
+# e efeito do número de pontos na consulta espacial do merge (traffic_summary)
+# Uso (a partir de src/): python -m benchmarks.bench_traffic_dedup
+import time
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_stations, make_traffic
+from preprocessing.merge_data_v2 import traffic_summary
+from preprocessing.parsing import parse_int_column
+from preprocessing.spatial_index import dedup_points
+from preprocessing.stations_transform import transform_stations_data
+
+
+def timeit(fn, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def sort_dedup(df):
+    # Versão anterior dos traffic_transform_v*
+    df = df.sort_values('observations', ascending=False)
+    return df.drop_duplicates(subset=['lat', 'lng'], keep='first')[:].reset_index(drop=True)
+
+
+def main(n_points=1_000_000, n_stations=2_000, cells_m=(5, 10, 25)):
+    df_stations = transform_stations_data(make_stations(n_stations))
+    df = make_traffic(n_points, df_stations.rename(columns={'lat': 'latitude', 'lng': 'longitude'}))
+    # Coordenadas com mais casas (como no dado real), para ter pontos quase duplicados
+    df['lat'] = df['lat'] + np.random.default_rng(0).normal(0, 2e-5, len(df)).round(6)
+    df['observations'] = parse_int_column(df['observations'], min_dtype='int32')
+
+    cases = [('sort + drop_duplicates', lambda: sort_dedup(df)), ('hash (exact)', lambda: dedup_points(df, 'observations'))]
+    cases += [(f'hash grid {cell} m', lambda cell=cell: dedup_points(df, 'observations', cell)) for cell in cells_m]
+
+    reference = None
+    print(f"{'dedup':>24} {'points':>10} {'dedup (ms)':>11} {'traffic_summary (ms)':>21}")
+    for name, fn in cases:
+        t_dedup, df_traffic = timeit(fn)
+        df_traffic['traffic_point_id'] = np.arange(len(df_traffic))
+        t_summary, _ = timeit(lambda: traffic_summary(df_stations, df_traffic, radii_km=[0.3, 1.0]))
+        if reference is None:
+            reference = df_traffic
+        elif name == 'hash (exact)':
+            # Mesmos pontos mantidos (a ordem só muda entre empates de observations)
+            cols = ['lat', 'lng', 'observations']
+            pd.testing.assert_frame_equal(
+                reference[cols].sort_values(cols, ignore_index=True), df_traffic[cols].sort_values(cols, ignore_index=True)
+            )
+        print(f'{name:>24} {len(df_traffic):>10,} {t_dedup * 1e3:>11.1f} {t_summary * 1e3:>21.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Verificação: swaps com valores inválidos (id 'abc', nível 'n/a', nível fora de int16) passam pelos caminhos
+# em memória, --stream, --backend duckdb (se instalado) e incremental sem erro e com o mesmo resultado: linhas sem id válido saem, battery_charged
+# fica <NA> onde falta um nível e não dá a volta quando os níveis alargam para int32. No incremental, uma execução
+# só com um swap atrasado no minuto do watermark acrescenta a linha ao dataset sem substituir partes anteriores.
+# Uso (a partir de src/): python -m benchmarks.check_bad_rows --swaps 20000
+import argparse
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_stations, make_swaps
+from preprocessing.duckdb_backend import transform_swaps_duckdb, duckdb
+from preprocessing.incremental import (
+    build_swaps_state, merge_swaps_state, state_station_metrics, new_swaps, track_open_rows, part_name
+)
+from preprocessing.merge_data_v2 import swaps_stats
+from preprocessing.parsing import parse_datetime_column
+from preprocessing.schema import SWAPS_DTYPES
+from preprocessing.storage import read_dataset, write_dataset
+from preprocessing.swaps_stream import transform_swaps_stream
+from preprocessing.swaps_transform import transform_swaps_data, SORT_COLUMNS, DATETIME_FORMAT
+
+
+def expected_charged(df):
+    # battery_out_level - battery_in_level em float (NaN onde algum nível não é número)
+    levels = {col: pd.to_numeric(df[col], errors='coerce') for col in ['battery_in_level', 'battery_out_level']}
+    return levels['battery_out_level'] - levels['battery_in_level']
+
+
+def incremental_run(df_raw, state, path, run_id):
+    # Mesmos passos de main_incremental para os swaps: linhas novas, estado e um part por execução
+    created_at = parse_datetime_column(df_raw['created_at'], DATETIME_FORMAT)
+    df_new, created_at = new_swaps(df_raw, created_at, state)
+    df_processed = transform_swaps_data(df_new)
+    previous = state
+    if not df_processed.empty:
+        state = merge_swaps_state(state, build_swaps_state(df_processed))
+        write_dataset(
+            df_processed, path, sort_columns=SORT_COLUMNS, dtypes=SWAPS_DTYPES,
+            part_name=part_name(state, run_id), overwrite=previous is None
+        )
+    return track_open_rows(state, previous, df_new, created_at)
+
+
+def main(n_swaps=20_000, bad_frac=0.001, batch_size=5_000):
+    df_raw = make_swaps(n_swaps, make_stations(50), days=30, bad_frac=bad_frac)
+    tmp_dir = tempfile.mkdtemp(prefix='bad_rows_')
+    try:
+        raw_path = os.path.join(tmp_dir, 'swaps.parquet')
+        df_raw.to_parquet(raw_path, index=False)
+
+        # Em memória (o transform do modo incremental é o mesmo) e gravado no schema compacto
+        df_memory = transform_swaps_data(pd.read_parquet(raw_path))
+        write_dataset(df_memory, os.path.join(tmp_dir, 'memory'), sort_columns=SORT_COLUMNS, dtypes=SWAPS_DTYPES)
+        df_memory = read_dataset(os.path.join(tmp_dir, 'memory'))
+
+        # --stream, também com batches pequenos (batches em que os níveis não alargam antes e depois de batches que alargam)
+        for size in [batch_size, max(1, batch_size // 10)]:
+            transform_swaps_stream(raw_path, os.path.join(tmp_dir, 'stream'), batch_size=size)
+            df_stream = read_dataset(os.path.join(tmp_dir, 'stream'))
+            pd.testing.assert_frame_equal(df_memory, df_stream)
+
+        # --backend duckdb, gravado no mesmo schema
+        if duckdb is not None:
+            write_dataset(transform_swaps_duckdb(raw_path), os.path.join(tmp_dir, 'duckdb'), sort_columns=SORT_COLUMNS, dtypes=SWAPS_DTYPES)
+            pd.testing.assert_frame_equal(df_memory, read_dataset(os.path.join(tmp_dir, 'duckdb')))
+
+        # Estado incremental em dois lotes = estatísticas do histórico completo
+        by_time = df_memory.sort_values('created_at')
+        half = len(by_time) // 2
+        state = merge_swaps_state(merge_swaps_state(None, build_swaps_state(by_time[:half])), build_swaps_state(by_time[half:]))
+        _, daily_stats, _, _ = state_station_metrics(state)
+        daily_ref, _ = swaps_stats(df_memory)
+        assert np.allclose(
+            daily_stats.sort_values('swap_station_id')['swaps_per_day_mean'].to_numpy(),
+            daily_ref.sort_values('swap_station_id')['swaps_per_day_mean'].to_numpy()
+        )
+
+        # Incremental: histórico completo, depois um swap atrasado no minuto do watermark (que não avança),
+        # depois nenhum swap novo; o dataset só cresce
+        incremental_path = os.path.join(tmp_dir, 'incremental')
+        state = incremental_run(df_raw, None, incremental_path, 'run1')
+        n_rows = [len(read_dataset(incremental_path))]
+        late = df_raw[pd.to_datetime(df_raw['created_at'], format=DATETIME_FORMAT) == state['watermark']]
+        late = late[late['swap_station_id'] != 'abc'].dropna(subset=['swap_station_id', 'cabinet_id']).head(1).assign(rider_id='999999')
+        df_late = pd.concat([df_raw, late], ignore_index=True)
+        watermark = state['watermark']
+        state = incremental_run(df_late, state, incremental_path, 'run2')
+        assert state['watermark'] == watermark
+        n_rows.append(len(read_dataset(incremental_path)))
+        state = incremental_run(df_late, state, incremental_path, 'run3')
+        n_rows.append(len(read_dataset(incremental_path)))
+        assert n_rows == [len(df_memory), len(df_memory) + 1, len(df_memory) + 1], n_rows
+        df_incremental = read_dataset(incremental_path)
+        try:
+            write_dataset(df_incremental[df_incremental['created_at'] == watermark], incremental_path,
+                          part_name=part_name(state, 'run2'), overwrite=False)
+            raise AssertionError('write_dataset replaced an existing part')
+        except ValueError as e:
+            assert 'refusing to overwrite' in str(e)
+
+        bad_ids = (df_raw['swap_station_id'] == 'abc').sum()
+        charged = df_memory['battery_charged'].astype('float64')
+        raw = df_raw.drop_duplicates().dropna(subset=['swap_station_id', 'cabinet_id'])
+        raw = raw[raw['swap_station_id'] != 'abc']
+        expected = expected_charged(raw)
+        assert charged.isna().sum() == expected.isna().sum()
+        assert np.array_equal(np.sort(charged.dropna().to_numpy()), np.sort(expected.dropna().to_numpy()))
+        print(f"rows: {len(df_raw):,} raw, {len(df_memory):,} processed (memory = stream{' = duckdb' if duckdb is not None else ''}), {bad_ids} invalid station ids dropped")
+        print(f"incremental rows per run (late swap at the watermark, then nothing new): {n_rows}")
+        print(f"battery_charged: {charged.isna().sum()} <NA>, max {charged.max():.0f} ({df_memory['battery_charged'].dtype})")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--swaps', type=int, default=20_000)
+    parser.add_argument('--bad-frac', type=float, default=0.001, help='fraction of rows with each kind of invalid value')
+    parser.add_argument('--batch-size', type=int, default=5_000, help='rows per batch in the stream path')
+    args = parser.parse_args()
+    main(args.swaps, args.bad_frac, args.batch_size)
@@ -0,0 +1,182 @@
+# Gerador de dados sintéticos nos formatos brutos (ids com vírgula, datas '%B %d, %Y, %I:%M %p',
+# endereços 'Rua, número - Bairro, Cidade - UF, CEP'), em escala configurável e gravado em batches.
+# Uso (a partir de src/):
+#   python -m benchmarks.synthetic_data --out ../data/synthetic --stations 10000 --traffic 1000000 --swaps 100000000
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from preprocessing.swaps_transform import DATETIME_FORMAT
+
+TRAFFIC_WEEK = 'February 10, 2025'
+NEIGHBORHOODS = [
+    'Pinheiros', 'Vila Olímpia', 'Centro', 'Moema', 'Santana', 'Ipiranga', 'Mooca', 'Lapa',
+    'Butantã', 'Tatuapé', 'Itaim Bibi', 'Liberdade', 'Perdizes', 'Vila Mariana', 'Consolação', 'Brooklin'
+]
+STREETS = ['R. Augusta', 'Av. Paulista', 'R. dos Pinheiros', 'Av. Rebouças', 'R. Vergueiro', 'Av. Ibirapuera', 'R. da Consolação']
+# Endereços fora de São Paulo que o transform de estações descarta
+OUTLIER_ADDRESSES = [
+    'Av. das Nações, 2851, Ourilândia do Norte - PA, 68390-000',
+    'Av. Providencia 1234, Providencia, Santiago Metropolitan Region, Chile'
+]
+STATUS = ['completed', 'swap_success_door_left_opened', 'TIMEOUT', 'ERROR', 'cancelled']
+STATUS_P = [0.86, 0.06, 0.04, 0.03, 0.01]
+# Perfil diário de swaps (pesos por hora, com picos às 8-9h e 17-19h)
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 7, 10, 9, 6, 5, 6, 6, 5, 5, 6, 9, 10, 9, 6, 4, 3, 2], dtype='float64')
+SAO_PAULO = (-23.60, -46.65)
+
+
+def _comma(values):
+    # Formata só os valores distintos ('12,345') e propaga
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.array([f'{v:,}' for v in uniques], dtype=object)[inverse]
+
+
+def make_stations(n_stations, duplicate_frac=0.03, outlier_frac=0.01, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(np.arange(1, n_stations * 5 + 1), n_stations, replace=False)
+    hoods = rng.choice(NEIGHBORHOODS, n_stations)
+    addresses = np.array([
+        f'{rng.choice(STREETS)}, {rng.integers(10, 4000)} - {hood}, São Paulo - SP, 0{rng.integers(1000, 9999)}-{rng.integers(100, 999)}'
+        for hood in hoods
+    ], dtype=object)
+    # Estações espalhadas em ~30 km ao redor do centro
+    lat = SAO_PAULO[0] + rng.normal(0, 0.08, n_stations)
+    lng = SAO_PAULO[1] + rng.normal(0, 0.09, n_stations)
+
+    n_outliers = int(n_stations * outlier_frac)
+    if n_outliers:
+        addresses[:n_outliers] = rng.choice(OUTLIER_ADDRESSES, n_outliers)
+
+    df = pd.DataFrame({
+        'swap_station_id': _comma(ids),
+        'Endereço': addresses,
+        'latitude': lat.round(6),
+        'longitude': lng.round(6)
+    })
+    dup = df.sample(frac=duplicate_frac, random_state=seed)
+    return pd.concat([df, dup], ignore_index=True)
+
+
+def make_traffic(n_points, df_stations, near_station_frac=0.6, duplicate_frac=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    n_near = int(n_points * near_station_frac)
+    # Parte dos pontos concentrada perto das estações (ruas movimentadas), o resto espalhado pela cidade
+    anchor = rng.integers(0, len(df_stations), n_near)
+    lat = np.concatenate([
+        df_stations['latitude'].to_numpy()[anchor] + rng.normal(0, 0.004, n_near),
+        SAO_PAULO[0] + rng.normal(0, 0.1, n_points - n_near)
+    ])
+    lng = np.concatenate([
+        df_stations['longitude'].to_numpy()[anchor] + rng.normal(0, 0.004, n_near),
+        SAO_PAULO[1] + rng.normal(0, 0.11, n_points - n_near)
+    ])
+    observations = np.clip(rng.lognormal(4.5, 1.4, n_points), 9, 20_000).astype('int64')
+
+    df = pd.DataFrame({
+        'lat': lat.round(4),
+        'lng': lng.round(4),
+        'week_observed': TRAFFIC_WEEK,
+        'observations': _comma(observations)
+    })
+    dup = df.sample(frac=duplicate_frac, random_state=seed)
+    return pd.concat([df, dup], ignore_index=True)
+
+
+def _cabinets(df_stations, rng):
+    # 1 a 6 cabinets por estação, com ids globais
+    station_ids = pd.unique(df_stations['swap_station_id'].str.replace(',', '').astype('int64'))
+    per_station = rng.integers(1, 7, len(station_ids))
+    return np.repeat(station_ids, per_station), np.arange(1, per_station.sum() + 1)
+
+
+def iter_swaps(n_swaps, df_stations, start='2025-01-01', days=120, batch_size=1_000_000,
+               duplicate_frac=0.002, null_frac=0.001, bad_frac=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    cabinet_station, cabinet_ids = _cabinets(df_stations, rng)
+    # Popularidade das estações ~ Zipf (poucas estações concentram muitos swaps)
+    station_weight = 1 / np.arange(1, len(np.unique(cabinet_station)) + 1) ** 0.8
+    station_weight = rng.permutation(station_weight)
+    station_of = {s: i for i, s in enumerate(np.unique(cabinet_station))}
+    cabinet_p = station_weight[[station_of[s] for s in cabinet_station]]
+    cabinet_p /= cabinet_p.sum()
+
+    # Minutos possíveis formatados uma vez; cada batch só indexa
+    n_minutes = days * 24 * 60
+    minute_p = np.tile(np.repeat(HOUR_WEIGHTS / HOUR_WEIGHTS.sum(), 60), days)
+    minute_p /= minute_p.sum()
+    # ended_at usa o mesmo índice + duração; 30 minutos extras cobrem swaps no fim do período
+    minute_text = pd.date_range(start, periods=n_minutes + 30, freq='min').strftime(DATETIME_FORMAT).to_numpy(dtype=object)
+
+    n_riders = max(1000, n_swaps // 50)
+    n_batteries = max(1000, len(cabinet_ids) * 12)
+    emitted = 0
+    while emitted < n_swaps:
+        n = min(batch_size, n_swaps - emitted)
+        minute = rng.choice(n_minutes, n, p=minute_p)
+        cabinet = rng.choice(len(cabinet_ids), n, p=cabinet_p)
+        df = pd.DataFrame({
+            'created_at': minute_text[minute],
+            'ended_at': minute_text[minute + rng.integers(0, 8, n)],
+            'cabinet_id': _comma(cabinet_ids[cabinet]),
+            'swap_station_id': _comma(cabinet_station[cabinet]),
+            'battery_out_id': _comma(rng.integers(1, n_batteries, n)),
+            'battery_in_id': _comma(rng.integers(1, n_batteries, n)),
+            'rider_id': _comma(rng.integers(1, n_riders, n)),
+            'status': rng.choice(STATUS, n, p=STATUS_P),
+            'battery_in_level': rng.integers(3, 45, n),
+            'battery_out_level': rng.integers(80, 101, n)
+        })
+        # Ruído dos dados reais: ended_at/cabinet_id nulos e linhas duplicadas
+        nulls = rng.random(n) < null_frac
+        df.loc[nulls, 'ended_at'] = None
+        df.loc[rng.random(n) < null_frac, 'cabinet_id'] = None
+        if bad_frac:
+            # Valores que o parsing não converte e níveis fora da faixa de int16 (os níveis viram texto)
+            for col, value in [('swap_station_id', 'abc'), ('battery_in_level', 'n/a'), ('battery_out_level', '40000')]:
+                df[col] = df[col].astype(str)
+                df.loc[rng.random(n) < bad_frac, col] = value
+        df = pd.concat([df, df.sample(frac=duplicate_frac, random_state=int(rng.integers(1 << 31)))], ignore_index=True)
+        emitted += n
+        yield df
+
+
+def make_swaps(n_swaps, df_stations, **kwargs):
+    return pd.concat(iter_swaps(n_swaps, df_stations, **kwargs), ignore_index=True)
+
+
+def write_raw_files(out_dir, n_stations=500, n_traffic=50_000, n_swaps=1_000_000, batch_size=1_000_000, seed=0):
+    # Grava os três parquets brutos; os swaps vão em batches (memória limitada mesmo com 100M linhas)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {name: os.path.join(out_dir, f'{name}.parquet') for name in ['swaps', 'stations', 'traffic']}
+
+    df_stations = make_stations(n_stations, seed=seed)
+    df_stations.to_parquet(paths['stations'], index=False, engine='pyarrow', compression='snappy')
+    make_traffic(n_traffic, df_stations, seed=seed).to_parquet(paths['traffic'], index=False, engine='pyarrow', compression='snappy')
+
+    writer = None
+    try:
+        for df in iter_swaps(n_swaps, df_stations, batch_size=batch_size, seed=seed):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(paths['swaps'], table.schema, compression='snappy')
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out', default='../data/synthetic')
+    parser.add_argument('--stations', type=int, default=500)
+    parser.add_argument('--traffic', type=int, default=50_000)
+    parser.add_argument('--swaps', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(write_raw_files(args.out, args.stations, args.traffic, args.swaps, args.batch_size, args.seed))
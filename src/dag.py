@@ -0,0 +1,282 @@
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import logging
+import os
+import pickle
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import pandas as pd
+
+from instrumentation import current_config, measure, use_config
+
+# -----------------------
+# Executor de DAG com cache por conteúdo.
+# Cada step declara entradas (fontes ou saídas de steps anteriores), parâmetros e saídas.
+# A chave de um step combina: código (módulos do projeto alcançáveis pelos imports da função), parâmetros
+# e chaves das entradas. Steps com chave já em cache (e arquivos gerados presentes e inalterados) não rodam,
+# e fontes/saídas só são carregadas quando algum step que precisa delas roda.
+# -----------------------
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def step(name, fn, inputs=(), outputs=(), params=None, files=(), after=()):
+    # files: arquivos/diretórios que o step grava; se algum sumir ou for alterado fora do DAG o step roda de novo
+    # after: steps que precisam terminar antes (só ordem de execução, não entra na chave)
+    return {
+        'name': name,
+        'fn': fn,
+        'inputs': list(inputs),
+        'outputs': list(outputs),
+        'params': params or {},
+        'files': list(files),
+        'after': list(after)
+    }
+
+
+def _sha1(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _file_hash(path, memo):
+    # Hash do conteúdo, memorizado por (tamanho, mtime) para não reler arquivos grandes inalterados
+    stat = os.stat(path)
+    memo_key = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    if memo_key not in memo:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        memo[memo_key] = h.hexdigest()
+    return memo[memo_key]
+
+
+def source_fingerprint(path, memo):
+    if not os.path.isdir(path):
+        return _file_hash(path, memo)
+    # Diretório (dataset particionado): caminhos relativos + conteúdo de cada arquivo
+    parts = []
+    for root, _, names in sorted(os.walk(path)):
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            parts += [os.path.relpath(file_path, path), _file_hash(file_path, memo)]
+    return _sha1(*parts)
+
+
+def files_fingerprint(paths):
+    # Tamanho e mtime de cada arquivo gerado (diretórios percorridos); None se algum não existir
+    parts = []
+    for path in paths:
+        if not os.path.exists(path):
+            return None
+        file_paths = [path] if not os.path.isdir(path) else [
+            os.path.join(root, name) for root, _, names in sorted(os.walk(path)) for name in sorted(names)
+        ]
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            parts += [os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns]
+    return _sha1(*parts)
+
+
+def _module_file(name):
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    origin = getattr(spec, 'origin', None)
+    if origin and origin.endswith('.py') and os.path.abspath(origin).startswith(SRC_DIR):
+        return os.path.abspath(origin)
+    return None
+
+
+def _project_modules(path):
+    # Arquivos do projeto alcançáveis pelos imports (diretos e transitivos) do arquivo dado
+    seen = set()
+    stack = [os.path.abspath(path)]
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        with open(current) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+            stack += [f for f in map(_module_file, names) if f]
+    return sorted(seen)
+
+
+def code_fingerprint(fn):
+    # Fontes de todos os módulos do projeto alcançáveis a partir do arquivo da função
+    parts = [getattr(fn, '__qualname__', repr(fn))]
+    for path in _project_modules(inspect.getsourcefile(fn)):
+        with open(path, 'rb') as f:
+            parts += [os.path.relpath(path, SRC_DIR), hashlib.sha1(f.read()).hexdigest()]
+    return _sha1(*parts)
+
+
+def _load_memo(cache_dir):
+    path = os.path.join(cache_dir, 'sources.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_memo(cache_dir, memo):
+    with open(os.path.join(cache_dir, 'sources.json'), 'w') as f:
+        json.dump(memo, f)
+
+
+def step_keys(steps, sources, cache_dir):
+    # sources: {nome: caminho} ou {nome: (caminho, loader)}
+    memo = _load_memo(cache_dir)
+    keys = {}
+    for name, source in sources.items():
+        path = source[0] if isinstance(source, tuple) else source
+        keys[name] = source_fingerprint(path, memo)
+    _save_memo(cache_dir, memo)
+
+    for s in steps:
+        missing = [i for i in s['inputs'] if i not in keys]
+        if missing:
+            raise ValueError(f"Step '{s['name']}' depends on unknown inputs: {missing}")
+        key = _sha1(
+            s['name'],
+            code_fingerprint(s['fn']),
+            repr(sorted(s['params'].items())),
+            *[keys[i] for i in s['inputs']]
+        )
+        keys[s['name']] = key
+        for output in s['outputs']:
+            keys[output] = _sha1(key, output)
+    return keys
+
+
+def _load_input(spec):
+    kind, payload = spec
+    if kind == 'value':
+        return payload
+    if kind == 'cached':
+        pkl_path, name = payload
+        with open(pkl_path, 'rb') as f:
+            return pickle.load(f)[name]
+    name, path, loader = payload
+    logging.info(f'↓ Loading {name}...')
+    with measure(f'load_{name}', kind='load') as m:
+        value = loader(path)
+        m['outputs'] = value
+    return value
+
+
+def _execute(s, specs, entry, metrics_config=None):
+    # Roda um step (no processo principal ou num worker) e grava a entrada de cache
+    if metrics_config is not None:
+        use_config(metrics_config)
+    args = [_load_input(spec) for spec in specs]
+    logging.info(f"☼ {s['name']}: running...")
+    with measure(s['name'], inputs=args, kind='step') as m:
+        result = s['fn'](*args, **s['params'])
+        m['outputs'] = result
+    if len(s['outputs']) == 1:
+        result = (result,)
+    outputs = dict(zip(s['outputs'], result)) if s['outputs'] else {}
+
+    # Mantém apenas a entrada mais recente de cada step
+    step_dir = os.path.dirname(entry)
+    if os.path.isdir(step_dir):
+        shutil.rmtree(step_dir)
+    os.makedirs(entry)
+    with open(os.path.join(entry, 'outputs.pkl'), 'wb') as f:
+        pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(entry, 'files.json'), 'w') as f:
+        json.dump(files_fingerprint(s['files']), f)
+    return outputs
+
+
+def run_dag(steps, sources, cache_dir, force=False, workers=1, executor='thread'):
+    # workers > 1: steps independentes rodam ao mesmo tempo num pool de threads ou processos
+    # (executor='process' exige funções, parâmetros e loaders serializáveis com pickle)
+    cache_dir = os.path.join(cache_dir, 'dag')
+    os.makedirs(cache_dir, exist_ok=True)
+    keys = step_keys(steps, sources, cache_dir)
+
+    producer = {output: s for s in steps for output in s['outputs']}
+    values = {}
+    ran = []
+
+    def entry_dir(s):
+        return os.path.join(cache_dir, s['name'], keys[s['name']])
+
+    def input_spec(name):
+        if name in values:
+            return ('value', values[name])
+        if name in producer:
+            return ('cached', (os.path.join(entry_dir(producer[name]), 'outputs.pkl'), name))
+        source = sources[name]
+        path, loader = source if isinstance(source, tuple) else (source, pd.read_parquet)
+        return ('source', (name, path, loader))
+
+    def valid(s):
+        # Entrada em cache e arquivos gerados iguais aos da última execução (não regravados por fora, ex.: --incremental)
+        entry = entry_dir(s)
+        if not os.path.exists(os.path.join(entry, 'outputs.pkl')):
+            return False
+        if not s['files']:
+            return True
+        fingerprint_path = os.path.join(entry, 'files.json')
+        if not os.path.exists(fingerprint_path):
+            return False
+        with open(fingerprint_path) as f:
+            recorded = json.load(f)
+        return recorded is not None and recorded == files_fingerprint(s['files'])
+
+    todo = []
+    done = set()
+    for s in steps:
+        if not force and valid(s):
+            logging.info(f"✓ {s['name']}: up to date")
+            done.add(s['name'])
+        else:
+            todo.append(s)
+
+    def ready(s):
+        upstream = [producer[i]['name'] for i in s['inputs'] if i in producer] + s['after']
+        return all(name in done for name in upstream)
+
+    def finish(s, outputs):
+        values.update(outputs)
+        done.add(s['name'])
+        ran.append(s['name'])
+
+    if workers <= 1:
+        # Ordem declarada (já topológica)
+        for s in todo:
+            finish(s, _execute(s, [input_spec(i) for i in s['inputs']], entry_dir(s)))
+        return ran
+
+    pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        running = {}
+        while todo or running:
+            for s in [s for s in todo if ready(s)]:
+                todo.remove(s)
+                specs = [input_spec(i) for i in s['inputs']]
+                running[pool.submit(_execute, s, specs, entry_dir(s), current_config())] = s
+            if not running:
+                raise ValueError(f"Steps with unsatisfiable dependencies: {[s['name'] for s in todo]}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                finish(running.pop(future), future.result())
+    return ran
@@ -0,0 +1,202 @@
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import pandas as pd
+
+# -----------------------
+# Métricas por step: tempo de parede, tempo de CPU, pico de RSS durante o step (acima do RSS no início) e
+# linhas/colunas de entrada e saída. Cada medição vira uma linha JSON em metrics_path (append, então workers de
+# threads e processos escrevem no mesmo arquivo). CPU e RSS são do processo inteiro: com steps em paralelo, se sobrepõem.
+# -----------------------
+_CONFIG = {'run_id': None, 'metrics_path': None, 'profile': set(), 'profile_dir': None, 'pid': None}
+_RECORDS = []
+_LOCK = threading.Lock()
+# Intervalo de amostragem do RSS atual durante cada medição
+RSS_SAMPLE_S = 0.01
+# Um cProfile por nome, acumulado entre as chamadas (ex.: todos os fits de prophet_fit no mesmo arquivo)
+_PROFILES = {}
+_PROFILING = set()
+
+
+def start_run(metrics_path=None, profile=(), profile_dir=None):
+    # profile: nomes de steps/medições que recebem um dump do cProfile em profile_dir/<nome>.prof
+    _CONFIG.update({
+        'run_id': uuid.uuid4().hex[:12],
+        'metrics_path': metrics_path,
+        'profile': set(profile or ()),
+        'profile_dir': profile_dir or (os.path.dirname(metrics_path) if metrics_path else '.'),
+        'pid': os.getpid()
+    })
+    _RECORDS.clear()
+    _PROFILES.clear()
+    if metrics_path:
+        os.makedirs(os.path.dirname(metrics_path) or '.', exist_ok=True)
+    return _CONFIG['run_id']
+
+
+def current_config():
+    return dict(_CONFIG)
+
+
+def use_config(config):
+    # Workers de processo (spawn) não herdam a configuração do processo principal
+    if config['run_id'] != _CONFIG['run_id']:
+        _CONFIG.update(config)
+
+
+def _peak_rss_mb():
+    # Pico de RSS desde o início do processo
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes no macOS, KB no Linux
+
+
+def _current_rss_mb():
+    # RSS atual (Linux); sem /proc cai no pico do processo
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_mb()
+
+
+def _start_rss_sampler():
+    # Thread que guarda o maior RSS atual visto a cada RSS_SAMPLE_S até _stop_rss_sampler
+    sampler = {'start': _current_rss_mb(), 'stop': threading.Event()}
+    sampler['max'] = sampler['start']
+
+    def sample():
+        while not sampler['stop'].wait(RSS_SAMPLE_S):
+            sampler['max'] = max(sampler['max'], _current_rss_mb())
+
+    sampler['thread'] = threading.Thread(target=sample, daemon=True)
+    sampler['thread'].start()
+    return sampler
+
+
+def _stop_rss_sampler(sampler):
+    sampler['stop'].set()
+    sampler['thread'].join()
+    return max(sampler['max'], _current_rss_mb())
+
+
+def _profiler(name):
+    # Profiler acumulado do nome; None se o nome não é perfilado ou já está ativo em outra thread
+    if name not in _CONFIG['profile']:
+        return None
+    with _LOCK:
+        if name in _PROFILING:
+            return None
+        _PROFILING.add(name)
+        return _PROFILES.setdefault(name, cProfile.Profile())
+
+
+def _dump_profile(name, profiler):
+    # Workers de processo gravam um arquivo próprio (<nome>.<pid>.prof) em vez de sobrescrever o do processo principal
+    os.makedirs(_CONFIG['profile_dir'], exist_ok=True)
+    suffix = '' if os.getpid() == _CONFIG['pid'] else f'.{os.getpid()}'
+    profile_path = os.path.join(_CONFIG['profile_dir'], f'{name}{suffix}.prof')
+    profiler.dump_stats(profile_path)
+    with _LOCK:
+        _PROFILING.discard(name)
+    return profile_path
+
+
+def _shape(obj):
+    # (linhas, colunas) de um DataFrame/Series/matriz, somando as linhas de tuplas/listas/dicts de objetos
+    if obj is None:
+        return None, None
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if isinstance(obj, (list, tuple)):
+        shapes = [_shape(o) for o in obj]
+        rows = [r for r, _ in shapes if r is not None]
+        cols = [c for _, c in shapes if c is not None]
+        return (sum(rows) if rows else None), (sum(cols) if cols else None)
+    shape = getattr(obj, 'shape', None)
+    if shape is None or len(shape) == 0:
+        return None, None
+    return int(shape[0]), (int(shape[1]) if len(shape) > 1 else 1)
+
+
+def _write(record):
+    with _LOCK:
+        _RECORDS.append(record)
+        if _CONFIG['metrics_path']:
+            with open(_CONFIG['metrics_path'], 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+
+@contextmanager
+def measure(name, inputs=None, **tags):
+    # Uso: with measure('step', inputs=df) as m: ...; m['outputs'] = resultado
+    record = {'run_id': _CONFIG['run_id'], 'name': name, **tags}
+    record['rows_in'], record['cols_in'] = _shape(inputs)
+    profiler = _profiler(name)
+
+    rss = _start_rss_sampler()
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+    record['started_at'] = pd.Timestamp.now().isoformat()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+        record['status'] = 'ok'
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            record['profile'] = _dump_profile(name, profiler)
+        record['wall_s'] = round(time.perf_counter() - wall_before, 4)
+        record['cpu_s'] = round(time.process_time() - cpu_before, 4)
+        rss_peak = _stop_rss_sampler(rss)
+        record['rss_start_mb'] = round(rss['start'], 1)
+        record['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+        record['peak_rss_delta_mb'] = max(0.0, round(rss_peak - rss['start'], 1))
+        record['rows_out'], record['cols_out'] = _shape(record.pop('outputs', None))
+        _write(record)
+
+
+def run_records(run_id=None):
+    run_id = run_id or _CONFIG['run_id']
+    records = list(_RECORDS)
+    if _CONFIG['metrics_path'] and os.path.exists(_CONFIG['metrics_path']):
+        with open(_CONFIG['metrics_path']) as f:
+            records = [r for r in map(json.loads, f) if r.get('run_id') == run_id]
+    return pd.DataFrame(records)
+
+
+def summary(run_id=None):
+    # Uma linha por nome (medições repetidas, ex. um fit por série, são agregadas)
+    df = run_records(run_id)
+    if df.empty:
+        return df
+    table = df.groupby('name', sort=False).agg(
+        calls=('name', 'size'),
+        wall_s=('wall_s', 'sum'),
+        cpu_s=('cpu_s', 'sum'),
+        max_wall_s=('wall_s', 'max'),
+        peak_rss_delta_mb=('peak_rss_delta_mb', 'max'),
+        rows_in=('rows_in', lambda x: x.sum(min_count=1)),
+        rows_out=('rows_out', lambda x: x.sum(min_count=1))
+    )
+    table['rows_per_s'] = table['rows_in'] / table['wall_s'].replace(0, float('nan'))
+    for col in ['rows_in', 'rows_out', 'rows_per_s']:
+        table[col] = table[col].round().astype('Int64')
+    return table.sort_values('wall_s', ascending=False)
+
+
+def log_summary(run_id=None):
+    table = summary(run_id)
+    if not table.empty:
+        logging.info('Step metrics:\n' + table.to_string(float_format=lambda x: f'{x:,.2f}'))
+    return table
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import measure
+
+try:
+    import lightgbm as lgb
+except ImportError:
+    lgb = None
+
+# -----------------------
+# Motor "global": um único LightGBM por granularidade, treinado com todas as séries (cabinets ou estações)
+# juntas, com as features de group_data (lags, médias móveis, calendário) mais o id como categórica.
+# A previsão é recursiva: cada passo do horizonte é previsto para todas as séries de uma vez e entra
+# nos lags do passo seguinte. Intervalos de 95% vêm de dois modelos de regressão quantílica.
+# -----------------------
+# Frequência e horizonte (7 dias) por coluna de tempo, para os dois motores
+HORIZONS = {'datetime': ('h', 24*7), 'date': ('D', 7)}
+LAGS = [1, 2, 3, 7, 24, 30, 48]
+ROLLING_WINDOWS = [3, 7, 24, 30]
+QUANTILES = {'lower_interval': 0.025, 'upper_interval': 0.975}
+PARAMS = {
+    'learning_rate': 0.075,
+    'num_leaves': 31,
+    'min_data_in_leaf': 20,
+    'feature_fraction': 0.9,
+    'verbosity': -1,
+    'seed': 0,
+    'deterministic': True
+}
+N_ROUNDS = 200
+
+
+def adjust_forecast(df_pred, last_ds, rounded=True):
+    # Pós-processamento comum aos motores: margem de 10% no horizonte futuro, arredondamento e nada negativo
+    # (rounded=False: valores contínuos, para a reconciliação arredondar só depois de somar os cabinets)
+    for col in ['predicted', 'upper_interval', 'lower_interval']:
+        df_pred.loc[df_pred['ds']>last_ds, col] = df_pred[col]*1.1
+        df_pred[col] = df_pred[col].fillna(np.nan)
+        if rounded:
+            df_pred[col] = df_pred[col].round()
+
+        df_pred.loc[df_pred[col]<0, col] = 0
+    return df_pred
+
+
+def prediction_frame(df, forecast, time_col, id_col):
+    # Saída de make_predictions para todos os ids de uma vez: previsões (id_col, ds, predicted e intervalos) junto
+    # das séries de group_data, ids na ordem de aparição, cada id ordenado por tempo e com índice próprio,
+    # como na concatenação do loop por id
+    df_pred = pd.merge(
+        df,
+        forecast[['ds', id_col, 'predicted', 'upper_interval', 'lower_interval']],
+        left_on=[id_col, time_col],
+        right_on=[id_col, 'ds'],
+        how='outer'
+    ).drop(columns=[time_col])
+    df_pred['id'] = df_pred[id_col]
+
+    order = pd.Index(df[id_col].dropna().unique()).get_indexer(df_pred[id_col])
+    df_pred = df_pred.iloc[np.lexsort((df_pred['ds'].to_numpy(), order))]
+    df_pred.index = df_pred.groupby(id_col, sort=False).cumcount().to_numpy()
+    return df_pred
+
+
+def _features(Y, start, stop, times, codes):
+    # Features dos instantes [start, stop) de Y (séries x tempo, NaN = sem dado), uma linha por (série, instante),
+    # usando só instantes anteriores a cada um (o mesmo código serve ao treino e a cada passo da recursão)
+    n_series = Y.shape[0]
+    lo = start - max(LAGS + ROLLING_WINDOWS)
+    region = Y[:, max(lo, 0):stop]
+    if lo < 0:
+        region = np.hstack([np.full((n_series, -lo), np.nan), region])
+    j = np.arange(start, stop) - lo  # coluna de cada instante em region
+
+    columns = {f'lag_{lag}': region[:, j - lag] for lag in LAGS}
+    # Médias móveis das w observações anteriores por somas acumuladas (NaN sem histórico)
+    valid = ~np.isnan(region)
+    sums = np.hstack([np.zeros((n_series, 1)), np.cumsum(np.where(valid, region, 0), axis=1)])
+    counts = np.hstack([np.zeros((n_series, 1)), np.cumsum(valid, axis=1)])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for w in ROLLING_WINDOWS:
+            columns[f'rolling_mean_{w}'] = (sums[:, j] - sums[:, j - w]) / (counts[:, j] - counts[:, j - w])
+
+    ts = times[start:stop]
+    columns['hour'] = ts.hour.to_numpy()[None, :]
+    columns['day_of_week'] = ts.dayofweek.to_numpy()[None, :]
+    columns['is_weekend'] = (ts.dayofweek >= 5).astype(int)[None, :]
+    columns['month'] = ts.month.to_numpy()[None, :]
+    columns['series'] = codes[:, None]
+    shape = (n_series, stop - start)
+    return pd.DataFrame({name: np.broadcast_to(values, shape).ravel() for name, values in columns.items()})
+
+
+def _train(X, y, objective, threads, alpha=None):
+    params = {**PARAMS, 'objective': objective, 'num_threads': threads or 0}
+    if alpha is not None:
+        params['alpha'] = alpha
+    dataset = lgb.Dataset(X, y, categorical_feature=['series'], free_raw_data=False)
+    return lgb.train(params, dataset, num_boost_round=N_ROUNDS)
+
+
+def global_forecast(df, time_col, id_col, threads=None, rounded=True):
+    # Mesmo formato de saída de make_predictions (uma linha por id e instante, histórico + 7 dias à frente)
+    if lgb is None:
+        raise ImportError("The global forecasting engine requires the 'lightgbm' package (pip install lightgbm)")
+    freq, horizon = HORIZONS[time_col]
+
+    # Matriz séries x tempo numa grade completa (ids na ordem de aparição)
+    ids = df[id_col].dropna().unique()
+    times = pd.date_range(df[time_col].min(), df[time_col].max(), freq=freq)
+    Y = (
+        df.pivot_table(index=id_col, columns=time_col, values='counts', aggfunc='sum')
+        .reindex(index=ids, columns=times)
+        .to_numpy(dtype='float64')
+    )
+    n_series, n_times = Y.shape
+    codes = np.arange(n_series)
+    all_times = times.append(pd.date_range(times[-1], periods=horizon + 1, freq=freq)[1:])
+
+    X = _features(Y, 0, n_times, times, codes)
+    y = Y.ravel()
+    fit = ~np.isnan(y)
+    with measure('global_fit', inputs=X, kind='model', series=f'{id_col}/{time_col}', n_series=n_series) as m:
+        models = {'predicted': _train(X[fit], y[fit], 'poisson', threads)}
+        for col, alpha in QUANTILES.items():
+            models[col] = _train(X[fit], y[fit], 'quantile', threads, alpha)
+        m['outputs'] = models
+
+    # Histórico: previsões um passo à frente; horizonte: recursão com a previsão pontual nos lags
+    preds = {col: np.full((n_series, n_times + horizon), np.nan) for col in models}
+    for col, model in models.items():
+        preds[col][:, :n_times] = model.predict(X, num_threads=threads or 0).reshape(n_series, n_times)
+    Y = np.hstack([Y, np.full((n_series, horizon), np.nan)])
+    with measure('global_predict', kind='model', series=f'{id_col}/{time_col}', n_series=n_series, horizon=horizon):
+        for t in range(n_times, n_times + horizon):
+            X_t = _features(Y, t, t + 1, all_times, codes)
+            for col, model in models.items():
+                preds[col][:, t] = model.predict(X_t, num_threads=threads or 0)
+            Y[:, t] = np.maximum(preds['predicted'][:, t], 0)
+
+    # Quantis estimados separadamente podem cruzar a previsão pontual
+    preds['lower_interval'] = np.minimum(preds['lower_interval'], preds['predicted'])
+    preds['upper_interval'] = np.maximum(preds['upper_interval'], preds['predicted'])
+
+    forecast = pd.DataFrame({
+        id_col: np.repeat(ids, len(all_times)),
+        'ds': np.tile(all_times, n_series),
+        **{col: values.ravel() for col, values in preds.items()}
+    })
+    return prediction_frame(df, adjust_forecast(forecast, times[-1], rounded), time_col, id_col)
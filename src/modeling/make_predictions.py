@@ -1,68 +1,241 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
 import pandas as pd
 import numpy as np
-from prophet import Prophet
-
-# Função de previsão: Prophet
-def make_predictions(df, time_col, id_col):
-    df_preds = pd.DataFrame()
-    for id in df[id_col].unique():
-        df_sub = df[df[id_col] == id].copy().reset_index(drop=True)
-
-        freq = 'D'
-        horizon = 7
-        if time_col == 'datetime':
-            freq = 'h'
-            horizon = 24*7
-
-        prophet_df = df_sub[[time_col, 'counts']].rename(columns={time_col:'ds', 'counts':'y'})
-
-        model = Prophet(
-            daily_seasonality=True,
-            weekly_seasonality=True,
-            yearly_seasonality=False,
-            interval_width=0.95
+
+from instrumentation import measure, current_config, use_config
+from modeling.global_forecaster import global_forecast, adjust_forecast, HORIZONS
+from modeling.model_store import series_fingerprint, load_entry, save_entry, evict
+from modeling.reconciliation import reconcile, FITTED_LEVELS
+from preprocessing.storage import dataset_writer, write_dataset
+
+try:
+    import prophet
+    from prophet import Prophet
+    from prophet.utilities import warm_start_params
+except ImportError:
+    prophet = Prophet = None
+
+PROPHET_PARAMS = {
+    'daily_seasonality': True,
+    'weekly_seasonality': True,
+    'yearly_seasonality': False,
+    'interval_width': 0.95
+}
+# Semente do amostrador de incerteza do Prophet, reiniciada por série: intervalos reprodutíveis
+# e iguais no modo serial e no paralelo (não dependem de quais séries rodaram antes no mesmo processo)
+SEED = 0
+# Bibliotecas que abrem threads próprias em cada worker (BLAS, OpenMP, Stan)
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'STAN_NUM_THREADS']
+# Tarefas em andamento por worker (limita as séries e previsões retidas à espera da vez de serem coletadas)
+WINDOW_PER_WORKER = 4
+
+
+@contextmanager
+def forecast_pool(workers=1, threads_per_worker=1):
+    # Pool de processos para os ajustes por id (None se workers <= 1). Os workers (spawn) herdam o ambiente
+    # do momento em que são criados, então os limites de threads valem enquanto o pool estiver aberto
+    if workers <= 1:
+        yield None
+        return
+    previous = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update({var: str(threads_per_worker) for var in THREAD_ENV_VARS})
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            yield pool
+    finally:
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def predict_id(df_sub, time_col, id_col, id, metrics_config=None, store_dir=None, rounded=True):
+    # Previsão de uma série (um id); roda no processo principal ou num worker do pool.
+    # store_dir: reaproveita a previsão guardada se a série não mudou, ou parte dos parâmetros do modelo se mudou
+    if metrics_config is not None:
+        use_config(metrics_config)
+    if Prophet is None:
+        raise ImportError("The prophet engine requires the 'prophet' package (pip install prophet)")
+
+    freq, horizon = HORIZONS[time_col]
+
+    prophet_df = df_sub[[time_col, 'counts']].rename(columns={time_col:'ds', 'counts':'y'})
+
+    forecast, fit_kwargs, mode = None, {}, 'cold'
+    if store_dir is not None:
+        # Versão do Prophet na configuração: outra versão pode ajustar/prever diferente com os mesmos dados
+        config = {**PROPHET_PARAMS, 'freq': freq, 'horizon': horizon, 'seed': SEED, 'prophet': prophet.__version__}
+        fingerprint = series_fingerprint(prophet_df, config)
+        entry = load_entry(store_dir, id_col, time_col, id)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            forecast, mode = entry['forecast'], 'cached'
+        elif entry is not None:
+            fit_kwargs, mode = {'init': warm_start_params(entry['model'])}, 'warm'
+
+    with measure('prophet_fit', inputs=prophet_df, kind='model', series=f'{id_col}/{time_col}', id=id, mode=mode) as m:
+        if forecast is None:
+            model = Prophet(**PROPHET_PARAMS)
+            model.fit(prophet_df, **fit_kwargs)
+
+            future = model.make_future_dataframe(periods=horizon, freq=freq)
+
+            np.random.seed(SEED)
+            forecast = model.predict(future)
+            if store_dir is not None:
+                save_entry(store_dir, id_col, time_col, id, fingerprint, model, forecast)
+        m['outputs'] = forecast
+
+    forecast['predicted'] = forecast['yhat']
+    forecast['upper_interval'] = forecast['yhat_upper']
+    forecast['lower_interval'] = forecast['yhat_lower']
+
+    df_pred = pd.merge(
+        df_sub,
+        forecast[['ds','predicted', 'upper_interval', 'lower_interval']],
+        left_on=time_col,
+        right_on='ds',
+        how='outer'
+    ).drop(columns=[time_col])
+
+    df_pred = adjust_forecast(df_pred, prophet_df['ds'].max(), rounded)
+
+    df_pred[id_col] = id
+    df_pred['id'] = id
+
+    # Ordenar por tempo
+    return df_pred.sort_values('ds').reset_index(drop=True)
+
+
+def partition_ids(df, id_col, sort=False):
+    # (id, linhas do id) numa única passada: ordenação estável pelos códigos do id e fatias contíguas das
+    # posições, em vez de uma máscara booleana por id (sem copiar o DataFrame inteiro ordenado).
+    # sort=False: ids na ordem de aparição (a do loop original)
+    codes, ids = pd.factorize(df[id_col].to_numpy(), sort=sort)
+    order = np.argsort(codes, kind='stable')[np.count_nonzero(codes < 0):]  # nulos (código -1) ficam de fora
+    ends = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(ids)))
+    start = 0
+    for id, end in zip(ids, ends):
+        yield id, df.iloc[order[start:end]].reset_index(drop=True)
+        start = end
+
+
+def _forecasts(pool, tasks, window, store_dir=None, rounded=True):
+    # tasks: (destino, argumentos de predict_id). Resultados na ordem das tarefas (não na de conclusão),
+    # com no máximo `window` tarefas em andamento no pool: a memória não cresce com o número de ids
+    if pool is None:
+        for name, args in tasks:
+            yield name, predict_id(*args, store_dir=store_dir, rounded=rounded)
+        return
+    config = current_config()
+    pending = deque()
+    for name, args in tasks:
+        pending.append((name, pool.submit(predict_id, *args, config, store_dir, rounded)))
+        if len(pending) >= window:
+            name, future = pending.popleft()
+            yield name, future.result()
+    while pending:
+        name, future = pending.popleft()
+        yield name, future.result()
+
+
+def run_forecasts(series, workers=1, output_paths=None, store_dir=None, store_max_mb=None, rounded=True):
+    # series: {nome: (df, time_col, id_col)}. Sem output_paths, retorna {nome: previsões concatenadas};
+    # com output_paths ({nome: caminho}), cada previsão vai direto para um dataset particionado por mês,
+    # ordenado por id e ds (mesmo layout de write_dataset), e nada é acumulado em memória.
+    # store_dir: modelos guardados por id (ver model_store), limitados a store_max_mb no final
+    streaming = output_paths is not None
+    tasks = (
+        (name, (df_sub, time_col, id_col, id))
+        for name, (df, time_col, id_col) in series.items()
+        for id, df_sub in partition_ids(df, id_col, sort=streaming)
+    )
+    with forecast_pool(workers) as pool, ExitStack() as stack:
+        # Todas as séries dividem o mesmo pool: a próxima granularidade começa sem esperar o fim da anterior
+        results = _forecasts(pool, tasks, max(1, workers) * WINDOW_PER_WORKER, store_dir, rounded)
+        if streaming:
+            sinks = {name: stack.enter_context(dataset_writer(output_paths[name], time_col='ds')) for name in series}
+            for name, df_pred in results:
+                sinks[name](df_pred)
+        else:
+            preds = {name: [] for name in series}
+            for name, df_pred in results:
+                preds[name].append(df_pred)
+
+    if store_dir is not None and store_max_mb is not None:
+        evict(store_dir, max_mb=store_max_mb)
+    if streaming:
+        return output_paths
+    # Uma única concatenação por série (não uma a cada id)
+    return {name: pd.concat(frames) if frames else pd.DataFrame() for name, frames in preds.items()}
+
+
+def global_forecasts(series, workers=1, output_paths=None, store_dir=None, store_max_mb=None, rounded=True):
+    # Motor global: um modelo por granularidade (workers = threads do LightGBM); mesma interface de run_forecasts
+    # (o store de modelos é só do motor Prophet: o modelo global é retreinado a cada execução)
+    preds = {name: global_forecast(df, time_col, id_col, workers, rounded) for name, (df, time_col, id_col) in series.items()}
+    if output_paths is None:
+        return preds
+    for name, df_pred in preds.items():
+        write_dataset(df_pred, output_paths[name], time_col='ds', sort_columns=['id', 'ds'])
+    return output_paths
+
+
+ENGINES = {'prophet': run_forecasts, 'global': global_forecasts}
+
+
+# Função de previsão: Prophet (engine='prophet', um modelo por id) ou LightGBM (engine='global', um modelo para todos os ids)
+def make_predictions(df, time_col, id_col, workers=1, output_path=None, engine='prophet', store_dir=None, store_max_mb=None,
+                     rounded=True):
+    # output_path: grava as previsões direto num dataset (ver run_forecasts) e retorna o caminho
+    output_paths = None if output_path is None else {'pred': output_path}
+    return ENGINES[engine]({'pred': (df, time_col, id_col)}, workers, output_paths, store_dir, store_max_mb, rounded)['pred']
+
+
+def reconciled_forecasts(series, hierarchy, method, workers=1, output_paths=None, engine='prophet', store_dir=None, store_max_mb=None):
+    # Só as séries dos níveis de FITTED_LEVELS[method] passam pelo motor; o resto vem da reconciliação
+    # (ver reconciliation.py), com as previsões ainda sem arredondar. Cabinets e estações de cada granularidade
+    # são reconciliados juntos, então as previsões ficam em memória mesmo com output_paths
+    fitted = {name: s for name, s in series.items() if s[2] in FITTED_LEVELS[method]}
+    preds = ENGINES[engine](fitted, workers, None, store_dir, store_max_mb, rounded=False)
+    for cabinets, stations in [('pred_cabinets_hourly', 'pred_stations_hourly'), ('pred_cabinets_daily', 'pred_stations_daily')]:
+        df_cabinets, time_col, _ = series[cabinets]
+        preds[cabinets], preds[stations] = reconcile(
+            method, hierarchy, time_col, df_cabinets, series[stations][0], preds.get(cabinets), preds.get(stations)
         )
-        
-        model.fit(prophet_df)
-
-        future = model.make_future_dataframe(periods=horizon, freq=freq)
-
-        forecast = model.predict(future)
-
-        forecast['predicted'] = forecast['yhat']
-        forecast['upper_interval'] = forecast['yhat_upper']
-        forecast['lower_interval'] = forecast['yhat_lower']
-
-        df_pred = pd.merge(
-            df_sub,
-            forecast[['ds','predicted', 'upper_interval', 'lower_interval']],
-            left_on=time_col,
-            right_on='ds',
-            how='outer'
-        ).drop(columns=[time_col])
-
-        for col in ['predicted', 'upper_interval', 'lower_interval']:
-            df_pred.loc[df_pred['ds']>prophet_df['ds'].max(), col] = df_pred[col]*1.1
-            df_pred[col] = df_pred[col].fillna(np.nan).round()
-    
-            df_pred.loc[df_pred[col]<0, col] = 0
-    
-        df_pred[id_col] = id
-        df_pred['id'] = id
-        
-        # Ordenar por tempo
-        df_pred = df_pred.sort_values('ds').reset_index(drop=True)
-        
-        df_preds = pd.concat([df_preds, df_pred])
-
-    return df_preds
-
-def predict_ids(df_cabinets_hourly, df_cabinets_daily, df_stations_hourly, df_stations_daily):
-    pred_cabinets_hourly = make_predictions(df_cabinets_hourly, 'datetime', 'cabinet_id')
-    pred_cabinets_daily = make_predictions(df_cabinets_daily, 'date', 'cabinet_id')
-    pred_stations_hourly = make_predictions(df_stations_hourly, 'datetime', 'swap_station_id')
-    pred_stations_daily = make_predictions(df_stations_daily, 'date', 'swap_station_id')
+    if output_paths is None:
+        return {name: preds[name] for name in series}
+    for name in series:
+        write_dataset(preds[name], output_paths[name], time_col='ds', sort_columns=['id', 'ds'])
+    return output_paths
+
+
+def predict_ids(df_cabinets_hourly, df_cabinets_daily, df_stations_hourly, df_stations_daily, hierarchy=None, workers=1,
+                model_dir=None, engine='prophet', store_dir=None, store_max_mb=None, reconciliation=None):
+    # model_dir: previsões gravadas direto em <model_dir>/pred_*.parquet (streaming) em vez de retornadas
+    # store_dir: modelos do Prophet guardados entre execuções (só reajusta as séries que mudaram)
+    # reconciliation (com hierarchy, de transform_model_data(..., hierarchy=True)): previsões coerentes entre
+    # cabinets e estações, ajustando só os níveis necessários ao método
+    series = {
+        'pred_cabinets_hourly': (df_cabinets_hourly, 'datetime', 'cabinet_id'),
+        'pred_cabinets_daily': (df_cabinets_daily, 'date', 'cabinet_id'),
+        'pred_stations_hourly': (df_stations_hourly, 'datetime', 'swap_station_id'),
+        'pred_stations_daily': (df_stations_daily, 'date', 'swap_station_id')
+    }
+    output_paths = None
+    if model_dir is not None:
+        output_paths = {name: os.path.join(model_dir, f'{name}.parquet') for name in series}
+    if reconciliation is not None:
+        preds = reconciled_forecasts(series, hierarchy, reconciliation, workers, output_paths, engine, store_dir, store_max_mb)
+    else:
+        preds = ENGINES[engine](series, workers, output_paths, store_dir, store_max_mb)
+    if model_dir is not None:
+        return preds
+    pred_cabinets_hourly, pred_cabinets_daily, pred_stations_hourly, pred_stations_daily = preds.values()
 
     return pred_cabinets_hourly, pred_cabinets_daily, pred_stations_hourly, pred_stations_daily
-    
-    
\ No newline at end of file
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+try:
+    from prophet.serialize import model_to_json, model_from_json
+except ImportError:
+    model_to_json = model_from_json = None
+
+# -----------------------
+# Modelos ajustados por série: <store_dir>/<id_col>-<time_col>/<id>.json, com o fingerprint dos dados
+# (e da configuração) com que foram ajustados e a previsão que produziram. Na execução seguinte, o mesmo
+# fingerprint reaproveita a previsão sem reajustar nem prever; dados novos reajustam partindo dos
+# parâmetros guardados. Cada leitura atualiza o mtime do arquivo, que ordena a remoção (LRU).
+# -----------------------
+FORECAST_COLUMNS = ['yhat', 'yhat_lower', 'yhat_upper']
+
+
+def series_fingerprint(prophet_df, config):
+    # Conteúdo da série (ds, y) e parâmetros do modelo/previsão
+    h = hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode())
+    h.update(prophet_df['ds'].to_numpy(dtype='datetime64[ns]').tobytes())
+    h.update(prophet_df['y'].to_numpy(dtype='float64').tobytes())
+    return h.hexdigest()
+
+
+def model_path(store_dir, id_col, time_col, id):
+    return os.path.join(store_dir, f'{id_col}-{time_col}', f'{id}.json')
+
+
+def load_entry(store_dir, id_col, time_col, id):
+    # {'fingerprint', 'model', 'forecast'} guardados para a série, ou None
+    path = model_path(store_dir, id_col, time_col, id)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        entry = json.load(f)
+    os.utime(path)
+    forecast = pd.DataFrame(entry['forecast'])
+    forecast['ds'] = pd.to_datetime(forecast['ds'].astype('int64'))
+    return {'fingerprint': entry['fingerprint'], 'model': model_from_json(entry['model']), 'forecast': forecast}
+
+
+def save_entry(store_dir, id_col, time_col, id, fingerprint, model, forecast):
+    # Escrita atômica: workers em paralelo gravam ids diferentes, e leitores nunca veem um arquivo pela metade.
+    # Floats do json.dump são exatos (repr), então a previsão lida é idêntica à gravada
+    path = model_path(store_dir, id_col, time_col, id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {
+        'fingerprint': fingerprint,
+        'model': model_to_json(model),
+        'forecast': {
+            'ds': forecast['ds'].to_numpy(dtype='datetime64[ns]').astype('int64').tolist(),
+            **{col: forecast[col].to_numpy(dtype='float64').tolist() for col in FORECAST_COLUMNS}
+        }
+    }
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp, path)
+
+
+def evict(store_dir, max_mb=None, max_models=None):
+    # Remove os modelos usados há mais tempo até o store caber nos limites; retorna quantos saíram
+    if not os.path.isdir(store_dir):
+        return 0
+    entries = []
+    for root, _, files in os.walk(store_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(reverse=True)
+
+    kept_models, kept_bytes, removed = 0, 0, 0
+    for _, size, path in entries:
+        over_count = max_models is not None and kept_models >= max_models
+        over_size = max_mb is not None and kept_bytes + size > max_mb * 2**20
+        if over_count or over_size or path.endswith('.tmp'):
+            os.remove(path)
+            removed += 1
+        else:
+            kept_models += 1
+            kept_bytes += size
+    return removed
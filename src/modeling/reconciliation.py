@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import measure
+from modeling.global_forecaster import prediction_frame
+
+# -----------------------
+# Reconciliação hierárquica cabinet → estação. As contagens de uma estação são a soma das de seus cabinets,
+# então basta ajustar um nível e derivar o outro (bottom_up: soma dos cabinets; top_down: previsão da estação
+# dividida pelas proporções recentes dos cabinets), ou ajustar os dois e projetar as previsões numa hierarquia
+# coerente (ols: MinT com pesos iguais; mint: MinT com covariância diagonal, pesos pela variância dos resíduos
+# de cada série no histórico). Em todos os métodos a previsão de cada estação é exatamente a soma das previsões
+# dos seus cabinets, já arredondadas (arredondamento pelo maior resto dentro de cada estação e instante).
+# -----------------------
+METHODS = ['bottom_up', 'top_down', 'ols', 'mint']
+# Níveis com modelos ajustados em cada método (o outro nível vem da reconciliação)
+FITTED_LEVELS = {
+    'bottom_up': ['cabinet_id'],
+    'top_down': ['swap_station_id'],
+    'ols': ['cabinet_id', 'swap_station_id'],
+    'mint': ['cabinet_id', 'swap_station_id']
+}
+# Dias de histórico das proporções dos cabinets no top_down (cabinets novos não ficam sub-representados)
+SHARE_WINDOW_DAYS = 28
+# Variância mínima dos resíduos no mint (séries constantes não zeram os pesos)
+MIN_VARIANCE = 1e-6
+COLUMNS = ['predicted', 'lower_interval', 'upper_interval']
+KEYS = ['swap_station_id', 'ds']
+
+
+def _shares(df_cabinets, time_col, hierarchy):
+    # Proporção de cada cabinet nos swaps da estação nos últimos SHARE_WINDOW_DAYS dias (iguais se a estação não teve swaps)
+    last = df_cabinets[time_col].max()
+    recent = df_cabinets[df_cabinets[time_col] > last - pd.Timedelta(days=SHARE_WINDOW_DAYS)]
+    shares = hierarchy.assign(counts=hierarchy['cabinet_id'].map(recent.groupby('cabinet_id')['counts'].sum()).fillna(0))
+    station = shares.groupby('swap_station_id')['counts']
+    total, size = station.transform('sum'), station.transform('size')
+    shares['share'] = np.where(total > 0, shares['counts'] / total.where(total > 0, 1), 1 / size)
+    return shares[['cabinet_id', 'swap_station_id', 'share']]
+
+
+def _variances(df_pred, id_col):
+    # Variância dos resíduos no histórico (instantes com contagem observada) de cada id
+    residuals = df_pred['counts'] - df_pred['predicted']
+    return residuals.groupby(df_pred[id_col]).var().fillna(0).clip(lower=MIN_VARIANCE)
+
+
+def _apportion(values, groups):
+    # Inteiros que somam o total arredondado de cada grupo: a parte inteira de cada valor, mais uma unidade
+    # para os maiores restos do grupo
+    floor = np.floor(values)
+    missing = values.groupby(groups).transform('sum').round() - floor.groupby(groups).transform('sum')
+    rank = (values - floor).groupby(groups).rank(method='first', ascending=False)
+    return floor + (rank <= missing)
+
+
+def reconcile(method, hierarchy, time_col, df_cabinets, df_stations, pred_cabinets=None, pred_stations=None):
+    # Previsões coerentes (pred_cabinets, pred_stations), no formato de make_predictions, a partir das previsões
+    # dos níveis ajustados (FITTED_LEVELS[method]) e das séries de group_data dos dois níveis
+    if method not in METHODS:
+        raise ValueError(f"Unknown reconciliation method '{method}' (expected one of {METHODS})")
+
+    with measure('reconcile', kind='model', series=time_col, method=method) as m:
+        base = None if pred_stations is None else pred_stations[['swap_station_id', 'ds', *COLUMNS]]
+        if method == 'top_down':
+            bottom = _shares(df_cabinets, time_col, hierarchy).merge(base, on='swap_station_id')
+            bottom[COLUMNS] = bottom[COLUMNS].mul(bottom['share'], axis=0)
+        else:
+            bottom = pred_cabinets[['cabinet_id', 'ds', *COLUMNS]].merge(hierarchy, on='cabinet_id')
+        groups = bottom.groupby(KEYS, sort=False).ngroup()
+
+        if method in ('ols', 'mint'):
+            # Projeção na hierarquia: a diferença entre a previsão da estação e a soma dos cabinets é distribuída entre
+            # os cabinets e a estação na proporção dos pesos (variâncias); os intervalos acompanham a previsão
+            bottom = bottom.merge(base[[*KEYS, 'predicted']].rename(columns={'predicted': 'station_predicted'}), on=KEYS)
+            if method == 'ols':
+                bottom['weight'], bottom['station_weight'] = 1.0, 1.0
+            else:
+                bottom['weight'] = bottom['cabinet_id'].map(_variances(pred_cabinets, 'cabinet_id'))
+                bottom['station_weight'] = bottom['swap_station_id'].map(_variances(pred_stations, 'swap_station_id'))
+            gap = bottom['station_predicted'] - bottom['predicted'].groupby(groups).transform('sum')
+            total_weight = bottom['weight'].groupby(groups).transform('sum') + bottom['station_weight']
+            bottom[COLUMNS] = bottom[COLUMNS].add(bottom['weight'] * gap / total_weight, axis=0)
+
+        bottom[COLUMNS] = bottom[COLUMNS].clip(lower=0)
+        top = bottom.groupby(KEYS, sort=False)['predicted'].sum().reset_index()
+        if base is None:
+            # bottom_up: cabinets independentes, as margens dos intervalos se somam em quadratura
+            margins = pd.DataFrame({
+                'lower_interval': (bottom['predicted'] - bottom['lower_interval'])**2,
+                'upper_interval': (bottom['upper_interval'] - bottom['predicted'])**2
+            }).groupby(groups).sum()**0.5
+            top['lower_interval'] = top['predicted'] - margins['lower_interval'].to_numpy()
+            top['upper_interval'] = top['predicted'] + margins['upper_interval'].to_numpy()
+        else:
+            # Intervalos da estação deslocados junto com a previsão reconciliada
+            top = top.merge(base, on=KEYS, suffixes=('', '_base'))
+            shift = top['predicted'] - top['predicted_base']
+            top['lower_interval'] = top['lower_interval'] + shift
+            top['upper_interval'] = top['upper_interval'] + shift
+
+        # Arredondamento só no final: cabinets pelo maior resto, estação = soma dos cabinets arredondados
+        bottom['predicted'] = _apportion(bottom['predicted'], groups)
+        top['predicted'] = bottom['predicted'].groupby(groups).sum().to_numpy()
+        for level in (bottom, top):
+            level['lower_interval'] = np.minimum(level['lower_interval'].clip(lower=0).round(), level['predicted'])
+            level['upper_interval'] = np.maximum(level['upper_interval'].round(), level['predicted'])
+
+        preds = (
+            prediction_frame(df_cabinets, bottom, time_col, 'cabinet_id'),
+            prediction_frame(df_stations, top, time_col, 'swap_station_id')
+        )
+        m['outputs'] = preds
+    return preds
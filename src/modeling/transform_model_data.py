@@ -1,5 +1,9 @@
+import logging
 import pandas as pd
 
+# Colunas da tabela de swaps usadas na modelagem
+MODEL_COLUMNS = ['swap_station_id', 'cabinet_id', 'created_at']
+
 def group_data(df, time_col, id_col):
     # Agora agrupar por gabinete e hora
     df_model = (
@@ -55,14 +59,34 @@ def group_data(df, time_col, id_col):
     return df_model
 
 
-def transform_model_data(df):    
+def select_stations(df, top_stations=5):
+    # top_stations: só as estações com mais swaps (None/0 = todas)
+    if not top_stations:
+        return df.reset_index(drop=True)
     station_counts = (
         df['swap_station_id']
         .value_counts()
         .reset_index()
         .rename(columns={'index': 'swap_station_id'})
     )
-    df = df[df['swap_station_id'].isin(station_counts[:5].swap_station_id)][:].reset_index(drop=True)
+    return df[df['swap_station_id'].isin(station_counts[:top_stations].swap_station_id)][:].reset_index(drop=True)
+
+
+def cabinet_hierarchy(df):
+    # Estação de cada cabinet (as contagens de uma estação são a soma das de seus cabinets), para a reconciliação.
+    # Cabinets mudam de estação: um cabinet visto em mais de uma fica na do swap mais recente
+    last_seen = df.groupby(['cabinet_id', 'swap_station_id'], observed=True)['created_at'].max().reset_index()
+    moved = last_seen['cabinet_id'].duplicated(keep=False)
+    if moved.any():
+        logging.warning(f"{last_seen.loc[moved, 'cabinet_id'].nunique()} cabinets seen in more than one station; "
+                        f"assigned to the station of their latest swap")
+    last_seen = last_seen.sort_values(['cabinet_id', 'created_at'], kind='stable').drop_duplicates('cabinet_id', keep='last')
+    return last_seen[['cabinet_id', 'swap_station_id']].sort_values('cabinet_id').reset_index(drop=True)
+
+
+def transform_model_data(df, top_stations=5, hierarchy=False):
+    # hierarchy: devolve também cabinet_hierarchy das estações selecionadas (sem carregar os swaps de novo)
+    df = select_stations(df, top_stations)
 
     df['created_at'] = pd.to_datetime(df['created_at'])
     df['datetime'] = pd.to_datetime(df['created_at']).dt.floor('h')
@@ -73,4 +97,6 @@ def transform_model_data(df):
     df_stations_hourly = group_data(df, 'datetime', 'swap_station_id')
     df_stations_daily = group_data(df, 'date', 'swap_station_id')
 
+    if hierarchy:
+        return df_cabinets_hourly, df_cabinets_daily, df_stations_hourly, df_stations_daily, cabinet_hierarchy(df)
     return df_cabinets_hourly, df_cabinets_daily, df_stations_hourly, df_stations_daily
\ No newline at end of file
@@ -0,0 +1,181 @@
+import pandas as pd
+
+from preprocessing.parsing import parse_int_column
+from preprocessing.swaps_transform import DATETIME_FORMAT, ID_COLUMNS, LEVEL_COLUMNS, SORT_COLUMNS, DROP_COLUMNS, KEY_COLUMNS
+from preprocessing.time_features import PERIOD_LABELS, RUSH_LABELS, DAY_LABELS
+from preprocessing.merge_data_v2 import OBS_WEEK_START, OBS_WEEK_END, add_station_metrics, traffic_summary
+from preprocessing.schema import compact, SWAPS_DTYPES, ID_DTYPE, LEVEL_DTYPE
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# -----------------------
+# Backend DuckDB (opcional): o transform dos swaps e as agregações do merge viram um plano de consulta
+# lazy sobre o parquet/DataFrame, com projeção e filtros empurrados para a leitura e execução multi-thread.
+# Produz as mesmas tabelas que o backend pandas (mesma ordem de linhas, colunas e dtypes).
+# -----------------------
+
+
+def _connect(threads=None):
+    if duckdb is None:
+        raise ImportError("The duckdb backend requires the 'duckdb' package (pip install duckdb)")
+    con = duckdb.connect()
+    if threads:
+        con.execute(f'SET threads = {int(threads)}')
+    return con
+
+
+def _quote(col):
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _int_expr(col, sql_type):
+    # Mesmas regras de parse_int_column: separador de milhar, espaços e até 18 dígitos; inválidos viram NULL
+    q = _quote(col)
+    if sql_type in ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT'):
+        return f'CAST({q} AS BIGINT)'
+    if sql_type in ('FLOAT', 'DOUBLE') or sql_type.startswith('DECIMAL'):
+        return f'CASE WHEN isfinite({q}) AND {q} = floor({q}) THEN CAST({q} AS BIGINT) END'
+    s = f"trim(replace(CAST({q} AS VARCHAR), ',', ''))"
+    return f"CASE WHEN regexp_full_match({s}, '-?[0-9]{{1,18}}') THEN CAST({s} AS BIGINT) END"
+
+
+def _datetime_expr(col, sql_type):
+    q = _quote(col)
+    if sql_type.startswith('TIMESTAMP'):
+        return f'CAST({q} AS TIMESTAMP)'
+    return f"strptime({q}, '{DATETIME_FORMAT}')"
+
+
+def _categorical(values, labels):
+    return pd.Categorical(values, categories=labels)
+
+
+def transform_swaps_duckdb(path, threads=None):
+    # Equivalente a transform_swaps_data lendo direto do parquet bruto
+    con = _connect(threads)
+    raw = con.read_parquet(path, file_row_number=True)
+    types = dict(zip(raw.columns, map(str, raw.types)))
+    raw_columns = [c for c in raw.columns if c != 'file_row_number']
+    kept = [c for c in raw_columns if c not in DROP_COLUMNS]
+
+    parsed = []
+    for col in kept:
+        if col in ('created_at', 'ended_at'):
+            parsed.append(f'{_datetime_expr(col, types[col])} AS {_quote(col)}')
+        elif col in ID_COLUMNS + LEVEL_COLUMNS:
+            parsed.append(f'{_int_expr(col, types[col])} AS {_quote(col)}')
+        elif col == 'status':
+            parsed.append('lower(status) AS status')
+        else:
+            parsed.append(_quote(col))
+    all_columns = ', '.join(map(_quote, raw_columns))
+
+    # 1. Dedup (primeira ocorrência de cada linha), parsing, chaves nulas ou inválidas (filtradas já parseadas, como
+    # drop_invalid_keys) e features; 2. Ordenação estável como no pandas
+    query = f'''
+        WITH dedup AS (
+            SELECT {all_columns}, min(file_row_number) AS _row
+            FROM raw
+            GROUP BY ALL
+        ),
+        parsed AS (
+            SELECT {', '.join(parsed)}, _row
+            FROM dedup
+        )
+        SELECT
+            * EXCLUDE (_row),
+            battery_out_level - battery_in_level AS battery_charged,
+            date_trunc('day', created_at) AS day,
+            month(created_at) AS month,
+            hour(created_at) AS hour,
+            CASE WHEN hour(created_at) < 5 THEN 0 WHEN hour(created_at) < 12 THEN 1
+                 WHEN hour(created_at) < 18 THEN 2 ELSE 3 END AS day_period,
+            (epoch_us(ended_at) - epoch_us(created_at)) / 60e6 AS charging_duration_min,
+            isodow(created_at) - 1 AS day_of_week,
+            coalesce(isodow(created_at) >= 6, false)::TINYINT AS is_weekend,
+            hour(created_at) IN (8, 9, 17, 18, 19) AS rush_period
+        FROM parsed
+        WHERE {' AND '.join(f'{_quote(col)} IS NOT NULL' for col in KEY_COLUMNS)}
+        ORDER BY {', '.join(map(_quote, SORT_COLUMNS))}, _row
+    '''
+    df = raw.query('raw', query).df()
+    con.close()
+
+    # Categóricas com as mesmas categorias do pandas
+    df['status'] = df['status'].astype('category')
+    df['day_period'] = _categorical(pd.Series(PERIOD_LABELS + [None])[df['day_period'].fillna(4).astype(int)].to_numpy(), PERIOD_LABELS)
+    df['day_of_week'] = _categorical(pd.Series(DAY_LABELS + [None])[df['day_of_week'].fillna(7).astype(int)].to_numpy(), DAY_LABELS)
+    df['rush_period'] = _categorical(df['rush_period'].map({False: 'off_peak', True: 'rush'}), RUSH_LABELS)
+    df['charging_duration_min'] = df['charging_duration_min'].astype('float32')
+    # Inteiros (BIGINT, ou float com NULL) dimensionados como em parse_int_column: <NA> onde o valor é inválido e
+    # dtype alargado só se os valores não couberem
+    int_dtypes = {**dict.fromkeys(ID_COLUMNS, ID_DTYPE), **dict.fromkeys(LEVEL_COLUMNS + ['battery_charged'], LEVEL_DTYPE)}
+    for col, dtype in int_dtypes.items():
+        df[col] = parse_int_column(df[col].astype('Int64'), min_dtype=dtype, errors='coerce')
+    return compact(df, SWAPS_DTYPES)
+
+
+def swaps_aggregates(df_swaps, threads=None):
+    # cabinet_counts, swaps_stats e week_swaps_count (merge_data_v2) numa única conexão, lendo só as colunas usadas
+    con = _connect(threads)
+    con.register('swaps', df_swaps[['swap_station_id', 'cabinet_id', 'created_at', 'day', 'hour']])
+
+    df_cabinet_counts = con.execute('''
+        WITH iso AS (
+            SELECT swap_station_id, cabinet_id, isoyear(created_at) * 100 + week(created_at) AS week_key
+            FROM swaps
+            WHERE swap_station_id IS NOT NULL AND created_at IS NOT NULL
+        )
+        SELECT swap_station_id, count(DISTINCT cabinet_id) AS cabinet_number
+        FROM iso
+        WHERE week_key = (SELECT max(week_key) FROM iso)
+        GROUP BY swap_station_id
+        ORDER BY swap_station_id
+    ''').df()
+
+    stats = []
+    for keys, prefix in [('day', 'swaps_per_day'), ('day, hour', 'swaps_per_hour')]:
+        stats.append(con.execute(f'''
+            WITH counts AS (
+                SELECT swap_station_id, {keys}, count(*) AS swaps_count
+                FROM swaps
+                WHERE swap_station_id IS NOT NULL AND {' AND '.join(f'{k.strip()} IS NOT NULL' for k in keys.split(','))}
+                GROUP BY ALL
+            )
+            SELECT
+                swap_station_id,
+                avg(swaps_count) AS {prefix}_mean,
+                median(swaps_count)::DOUBLE AS {prefix}_median,
+                max(swaps_count) AS {prefix}_max
+            FROM counts
+            GROUP BY swap_station_id
+            ORDER BY swap_station_id
+        ''').df())
+
+    df_swaps_count_week = con.execute('''
+        SELECT swap_station_id, count(*) AS swaps_count
+        FROM swaps
+        WHERE swap_station_id IS NOT NULL AND created_at >= ? AND created_at <= ?
+        GROUP BY swap_station_id
+        ORDER BY swap_station_id
+    ''', [OBS_WEEK_START.to_pydatetime(), OBS_WEEK_END.to_pydatetime()]).df()
+    con.close()
+
+    daily_stats, hourly_stats = stats
+    return df_cabinet_counts, daily_stats, hourly_stats, df_swaps_count_week
+
+
+def merge_data_duckdb(df_swaps, df_stations, df_traffic, radius_km=0.3, cache_dir=None, radii_km=None, threads=None):
+    # Mesmo resultado de merge_data_v2.merge_data; as features de tráfego continuam na árvore espacial
+    df_cabinet_counts, daily_stats, hourly_stats, df_swaps_count_week = swaps_aggregates(df_swaps, threads)
+    return add_station_metrics(
+        df_stations,
+        df_cabinet_counts,
+        daily_stats,
+        hourly_stats,
+        traffic_summary(df_stations, df_traffic, radius_km, cache_dir=cache_dir, radii_km=radii_km),
+        df_swaps_count_week
+    )
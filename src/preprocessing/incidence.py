@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from preprocessing.spatial_index import build_tree, query_radius
+
+TRAFFIC_LEVELS = ['low', 'medium', 'high', 'intense', 'very_intense']
+
+
+def _weights(dist_km, radius_km, weight):
+    if weight is None:
+        return np.ones(len(dist_km))
+    if weight == 'linear':
+        return np.clip(1 - dist_km / radius_km, 0, 1)
+    if weight == 'gaussian':
+        return np.exp(-0.5 * (dist_km / (radius_km / 2)) ** 2)
+    if callable(weight):
+        return np.asarray(weight(dist_km), dtype='float64')
+    raise ValueError(f"Unknown weight: {weight}")
+
+
+def build_incidence(df_stations, df_traffic, radius_km=0.3, weight=None, cache_dir=None):
+    # Matriz esparsa estações x pontos de tráfego: a linha i tem os pontos a até radius_km da estação i.
+    # weight: None (0/1), 'linear', 'gaussian' ou função da distância em km
+    tree = build_tree(df_traffic['lat'].values, df_traffic['lng'].values, cache_dir)
+    indptr, indices, dist_km = query_radius(
+        tree, df_stations['lat'].values, df_stations['lng'].values, radius_km, return_distance=True
+    )
+    data = _weights(dist_km, radius_km, weight)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(df_stations), len(df_traffic)))
+
+
+def _segment_max(values, indptr, fill=np.nan):
+    counts = np.diff(indptr)
+    result = np.full(len(counts), fill, dtype='float64')
+    has = counts > 0
+    if has.any():
+        result[has] = np.maximum.reduceat(values, indptr[:-1][has])
+    return result
+
+
+def station_traffic_metrics(incidence, df_traffic):
+    # Métricas de tráfego por estação via produtos matriz-vetor e reduções por segmento
+    incidence = incidence.tocsr()
+    binary = incidence.copy()
+    binary.data = np.ones_like(binary.data)
+
+    observations = df_traffic['observations'].to_numpy(dtype='float64')
+    level_codes = pd.Categorical(df_traffic['traffic_level'], categories=TRAFFIC_LEVELS).codes
+    levels = sp.csr_matrix(
+        (np.ones(len(level_codes)), (np.arange(len(level_codes)), level_codes)),
+        shape=(len(level_codes), len(TRAFFIC_LEVELS))
+    )
+
+    metrics = pd.DataFrame({
+        'observations': _segment_max(observations[incidence.indices], incidence.indptr),
+        'obs_sum': binary @ observations,
+        'obs_weighted_sum': incidence @ observations,
+        'n_traffic_points': np.diff(incidence.indptr)
+    })
+
+    # Maior nível de tráfego (pela ordem dos níveis) e contagem de pontos por nível
+    top_level = _segment_max(level_codes[incidence.indices].astype('float64'), incidence.indptr, fill=-1)
+    metrics['traffic_level'] = np.array(TRAFFIC_LEVELS + [None], dtype=object)[top_level.astype(int)]  # -1 (sem pontos) -> None
+    level_counts = (binary @ levels).toarray().astype('int64')
+    for i, level in enumerate(TRAFFIC_LEVELS):
+        metrics[f'n_points_{level}'] = level_counts[:, i]
+
+    return metrics
@@ -0,0 +1,195 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from preprocessing.merge_data_v2 import OBS_WEEK_START, OBS_WEEK_END
+
+# -----------------------
+# Estado agregado por estação, combinável entre execuções:
+# - histogramas (valor -> frequência) das contagens diárias e horárias fechadas,
+#   que dão contagem, soma, máximo e quantis exatos (as contagens são inteiras);
+# - contagens do dia/hora ainda aberto (o do watermark), que podem receber novos swaps;
+# - pares (estação, cabinet) da semana ISO mais recente;
+# - contagem de swaps na semana de observação do tráfego;
+# - hashes das linhas brutas já processadas no minuto do watermark (as datas brutas não têm segundos,
+#   então swaps desse minuto ainda podem chegar no próximo export).
+# -----------------------
+STATE_FILES = ['daily_open', 'daily_hist', 'hourly_open', 'hourly_hist', 'recent_cabinets', 'week_swaps', 'open_rows']
+DAILY_KEYS = ['swap_station_id', 'day']
+HOURLY_KEYS = ['swap_station_id', 'day', 'hour']
+HIST_KEYS = ['swap_station_id', 'swaps_count']
+
+
+def _latest_week(recent):
+    # Semana ISO mais recente = maior par (ano, semana), a mesma regra de merge_data_v2.cabinet_counts
+    key = recent['year'].astype(int) * 100 + recent['week'].astype(int)
+    return recent[key == key.max()].drop_duplicates().reset_index(drop=True)
+
+
+def row_hashes(df_raw):
+    # Identidade de cada linha bruta (todas as colunas): linhas idênticas já são duplicatas para o transform
+    return pd.util.hash_pandas_object(df_raw, index=False).to_numpy()
+
+
+def new_swaps(df_raw, created_at, state):
+    # Swaps brutos ainda não processados: o minuto do watermark entra de novo (>=), menos as linhas dele
+    # que já foram processadas. Retorna as linhas e os created_at correspondentes
+    if state is None:
+        return df_raw, created_at
+    keep = (created_at >= state['watermark']).to_numpy()
+    df_raw, created_at = df_raw[keep], created_at[keep]
+    at_watermark = (created_at == state['watermark']).to_numpy()
+    seen = np.zeros(len(df_raw), dtype=bool)
+    seen[at_watermark] = np.isin(row_hashes(df_raw[at_watermark]), state['open_rows']['row_hash'].to_numpy())
+    return df_raw[~seen], created_at[~seen]
+
+
+def track_open_rows(state, previous, df_raw, created_at):
+    # Linhas brutas processadas no minuto do watermark atual (as desta execução, mais as anteriores se o
+    # watermark não avançou), para new_swaps na próxima execução
+    hashes = [row_hashes(df_raw[(created_at == state['watermark']).to_numpy()])]
+    if previous is not None and previous['watermark'] == state['watermark']:
+        hashes.append(previous['open_rows']['row_hash'].to_numpy())
+    state['open_rows'] = pd.DataFrame({'row_hash': np.unique(np.concatenate(hashes)).astype('uint64')})
+    return state
+
+
+def part_name(state, run_id):
+    # Arquivo dos swaps de uma execução nas partições mensais: o watermark não basta como nome, porque uma
+    # execução só com swaps atrasados no minuto do watermark não o avança
+    return f"part-{state['watermark']:%Y%m%dT%H%M}-{run_id}"
+
+
+def _histogram(counts):
+    return counts.groupby(HIST_KEYS).size().reset_index(name='freq')
+
+
+def build_swaps_state(df_swaps):
+    # Estado parcial a partir de um lote de swaps processados (tudo ainda "aberto":
+    # o fechamento acontece em merge_swaps_state, depois de somar com o estado anterior)
+    iso = df_swaps['created_at'].dt.isocalendar()
+    recent = pd.DataFrame({
+        'swap_station_id': df_swaps['swap_station_id'].to_numpy(),
+        'cabinet_id': df_swaps['cabinet_id'].to_numpy(),
+        'year': iso.year.astype('int32').to_numpy(),
+        'week': iso.week.astype('int32').to_numpy()
+    })
+    in_week = (df_swaps['created_at'] >= OBS_WEEK_START) & (df_swaps['created_at'] <= OBS_WEEK_END)
+    days = pd.to_datetime(df_swaps['day'])
+
+    state = {
+        'watermark': df_swaps['created_at'].max(),
+        'daily_open': df_swaps.assign(day=days).groupby(DAILY_KEYS).size().reset_index(name='swaps_count'),
+        'daily_hist': pd.DataFrame(columns=HIST_KEYS + ['freq']),
+        'hourly_open': df_swaps.assign(day=days).groupby(HOURLY_KEYS).size().reset_index(name='swaps_count'),
+        'hourly_hist': pd.DataFrame(columns=HIST_KEYS + ['freq']),
+        'recent_cabinets': _latest_week(recent),
+        'week_swaps': df_swaps[in_week].groupby('swap_station_id').size().reset_index(name='swaps_count')
+    }
+    return state
+
+
+def _close_periods(state):
+    # Dias/horas anteriores ao do watermark não recebem mais swaps: vão para o histograma
+    watermark = state['watermark']
+    for name, keys, is_open in [
+        ('daily', DAILY_KEYS, lambda df: df['day'] == watermark.normalize()),
+        ('hourly', HOURLY_KEYS, lambda df: (df['day'] == watermark.normalize()) & (df['hour'] == watermark.hour))
+    ]:
+        counts = state[f'{name}_open']
+        open_mask = is_open(counts)
+        hist = pd.concat([state[f'{name}_hist'], _histogram(counts[~open_mask])])
+        state[f'{name}_hist'] = hist.groupby(HIST_KEYS, as_index=False)['freq'].sum()
+        state[f'{name}_open'] = counts[open_mask].reset_index(drop=True)
+    return state
+
+
+def merge_swaps_state(state, new):
+    if state is None:
+        return _close_periods(new)
+    merged = {'watermark': max(state['watermark'], new['watermark'])}
+
+    for name, keys in [('daily', DAILY_KEYS), ('hourly', HOURLY_KEYS)]:
+        merged[f'{name}_open'] = (
+            pd.concat([state[f'{name}_open'], new[f'{name}_open']])
+            .groupby(keys, as_index=False)['swaps_count'].sum()
+        )
+        merged[f'{name}_hist'] = (
+            pd.concat([state[f'{name}_hist'], new[f'{name}_hist']])
+            .groupby(HIST_KEYS, as_index=False)['freq'].sum()
+        )
+
+    merged['recent_cabinets'] = _latest_week(pd.concat([state['recent_cabinets'], new['recent_cabinets']]))
+
+    merged['week_swaps'] = (
+        pd.concat([state['week_swaps'], new['week_swaps']])
+        .groupby('swap_station_id', as_index=False)['swaps_count'].sum()
+    )
+    return _close_periods(merged)
+
+
+def histogram_stats(hist, open_counts, prefix):
+    # Estatísticas exatas (média, mediana, máximo) a partir do histograma de contagens (hist=None: só as contagens)
+    hist = _histogram(open_counts) if hist is None else pd.concat([hist, _histogram(open_counts)])
+    hist = hist.groupby(HIST_KEYS, as_index=False)['freq'].sum().sort_values(HIST_KEYS)
+    hist['freq'] = hist['freq'].astype('int64')
+    hist['swaps_count'] = hist['swaps_count'].astype('int64')
+
+    grouped = hist.groupby('swap_station_id')
+    n = grouped['freq'].transform('sum')
+    cum = grouped['freq'].cumsum()
+
+    def value_at_rank(rank):
+        # Primeiro valor cuja frequência acumulada ultrapassa o rank (0-based)
+        return hist[cum > rank].groupby('swap_station_id')['swaps_count'].first()
+
+    total = (hist['swaps_count'] * hist['freq']).groupby(hist['swap_station_id']).sum()
+    n_days = grouped['freq'].sum()
+    stats = pd.DataFrame({
+        f'{prefix}_mean': total / n_days,
+        f'{prefix}_median': (value_at_rank((n - 1) // 2) + value_at_rank(n // 2)) / 2,
+        f'{prefix}_max': grouped['swaps_count'].max()
+    })
+    return stats.rename_axis('swap_station_id').reset_index()
+
+
+def state_station_metrics(state):
+    # Mesmas tabelas que merge_data_v2 calcula a partir do histórico completo
+    cabinet_counts = (
+        state['recent_cabinets'].groupby('swap_station_id')['cabinet_id'].nunique()
+        .reset_index().rename(columns={'cabinet_id': 'cabinet_number'})
+    )
+    daily_stats = histogram_stats(state['daily_hist'], state['daily_open'], 'swaps_per_day')
+    hourly_stats = histogram_stats(state['hourly_hist'], state['hourly_open'], 'swaps_per_hour')
+    return cabinet_counts, daily_stats, hourly_stats, state['week_swaps']
+
+
+def load_state(state_dir):
+    path = os.path.join(state_dir, 'watermark.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = {'watermark': pd.Timestamp(json.load(f)['created_at'])}
+    for name in STATE_FILES:
+        path = os.path.join(state_dir, f'{name}.parquet')
+        if name == 'open_rows' and not os.path.exists(path):
+            # Estado gravado antes de open_rows existir
+            state[name] = pd.DataFrame({'row_hash': np.array([], dtype='uint64')})
+            continue
+        state[name] = pd.read_parquet(path, engine='pyarrow')
+    return state
+
+
+def save_state(state, state_dir):
+    # Grava num diretório temporário e troca no final, para não deixar um estado parcial
+    tmp_dir = state_dir.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in STATE_FILES:
+        state[name].to_parquet(os.path.join(tmp_dir, f'{name}.parquet'), index=False, engine='pyarrow')
+    with open(os.path.join(tmp_dir, 'watermark.json'), 'w') as f:
+        json.dump({'created_at': state['watermark'].isoformat()}, f)
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.replace(tmp_dir, state_dir)
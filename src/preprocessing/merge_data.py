@@ -1,39 +1,32 @@
 import pandas as pd
-import ast
 import numpy as np
 
-def merge_data(df_swaps, df_stations, df_traffic):
-    # 1. Get traffic data
-    df_traffic_exploded = df_traffic.explode('nearby_stations')
-    df_traffic_exploded = df_traffic_exploded.rename(columns={'nearby_stations': 'swap_station_id'})
+from preprocessing.incidence import build_incidence, station_traffic_metrics
+from preprocessing.merge_data_v2 import cabinet_counts
+from preprocessing.schema import compact, STATIONS_DTYPES
 
-    traffic_agg = df_traffic_exploded.groupby('swap_station_id').agg({
-        'observations': 'max',
-        'traffic_level': 'max'
-    }).reset_index()
+def merge_data(df_swaps, df_stations, df_traffic, incidence=None, radius_km=0.3, cache_dir=None):
+    # 1. Get traffic data (matriz de incidência estações x pontos de tráfego)
+    if incidence is None:
+        incidence = build_incidence(df_stations, df_traffic, radius_km, cache_dir=cache_dir)
+    if incidence.shape != (len(df_stations), len(df_traffic)):
+        raise ValueError(
+            f"Incidence matrix shape {incidence.shape} does not match "
+            f"{len(df_stations)} stations x {len(df_traffic)} traffic points"
+        )
+
+    traffic_agg = station_traffic_metrics(incidence, df_traffic)
+    traffic_agg.insert(0, 'swap_station_id', df_stations['swap_station_id'].to_numpy())
 
     df_stations = df_stations.merge(
-        df_traffic_exploded.groupby('swap_station_id').agg({
-            'observations': 'max',
-            'traffic_level': 'max'       
-        }).reset_index(),
-        left_on='swap_station_id',
-        right_on='swap_station_id',
+        traffic_agg,
+        on='swap_station_id',
         how='left'
     )
 
-    # 2. Get cabinet counts (recent)
-    last_week = df_swaps['created_at'].dt.isocalendar().week.max()
-    last_year = df_swaps['created_at'].dt.isocalendar().year.max()
-    df_swaps_recent = df_swaps[
-        (df_swaps['created_at'].dt.isocalendar().year == last_year) &
-        (df_swaps['created_at'].dt.isocalendar().week == last_week)
-    ]
-    cabinet_counts = df_swaps_recent.groupby('swap_station_id')['cabinet_id'].nunique().reset_index()
-    cabinet_counts = cabinet_counts.rename(columns={'cabinet_id': 'cabinet_number'})
-
+    # 2. Get cabinet counts (recent): semana ISO mais recente pelo par (ano, semana), como no merge_data_v2
     df_stations = df_stations.merge(
-        cabinet_counts,
+        cabinet_counts(df_swaps),
         on='swap_station_id',
         how='left'
     )
@@ -85,13 +78,6 @@ def merge_data(df_swaps, df_stations, df_traffic):
         df_stations['swaps_per_day_mean'] / df_stations['cabinet_number'].replace(0, np.nan)
     )
 
-    df_stations = df_stations.fillna(0)
+    df_stations = compact(df_stations.fillna(0), STATIONS_DTYPES)
         
-    # 5. Merge all the data
-    df_final = df_stations.merge(
-        df_swaps,
-        on='swap_station_id',
-        how='left'
-    )
-
-    return df_final, df_stations
\ No newline at end of file
+    return df_stations
@@ -1,40 +1,25 @@
 import pandas as pd
-import ast
 import numpy as np
-from scipy.spatial import cKDTree
-from tqdm import tqdm
-
-# -----------------------
-# Função: converter lat/lon para coordenadas cartesianas
-# -----------------------
-def latlng_to_xyz(lat, lon):
-    earth_radius = 6371.0
-    lat_r = np.radians(lat)
-    lon_r = np.radians(lon)
-    x = earth_radius * np.cos(lat_r) * np.cos(lon_r)
-    y = earth_radius * np.cos(lat_r) * np.sin(lon_r)
-    z = earth_radius * np.sin(lat_r)
-    return np.vstack([x, y, z]).T
-
-def merge_data(df_swaps, df_stations, df_traffic, radius_km = 0.3):
-    # 2. Get cabinet counts (recent)
-    last_week = df_swaps['created_at'].dt.isocalendar().week.max()
-    last_year = df_swaps['created_at'].dt.isocalendar().year.max()
-    df_swaps_recent = df_swaps[
-        (df_swaps['created_at'].dt.isocalendar().year == last_year) &
-        (df_swaps['created_at'].dt.isocalendar().week == last_week)
-    ]
-    cabinet_counts = df_swaps_recent.groupby('swap_station_id')['cabinet_id'].nunique().reset_index()
-    cabinet_counts = cabinet_counts.rename(columns={'cabinet_id': 'cabinet_number'})
 
-    df_stations = df_stations.merge(
-        cabinet_counts,
-        on='swap_station_id',
-        how='left'
-    )
-    df_stations['cabinet_number'] = df_stations['cabinet_number'].fillna(0).astype(int)
+from preprocessing.incidence import build_incidence
+from preprocessing.schema import compact, STATIONS_DTYPES
+from preprocessing.spatial_index import build_tree, query_radius
 
-    # 3. Get swaps statistics
+# Janela fixa da semana de observação do tráfego
+OBS_WEEK_START = pd.Timestamp('2025-02-10')
+OBS_WEEK_END = pd.Timestamp('2025-02-16')
+
+def cabinet_counts(df_swaps):
+    # Cabinets ativos na semana ISO mais recente: o maior par (ano, semana), não o maior ano e a maior semana
+    # separados (com o histórico cruzando a virada do ano, esses combinariam a semana 52 com o ano seguinte).
+    # Mesma regra no merge em lotes, no backend DuckDB e no estado do modo incremental
+    iso = df_swaps['created_at'].dt.isocalendar()
+    week_key = iso.year * 100 + iso.week
+    df_swaps_recent = df_swaps[(week_key == week_key.max()).fillna(False).to_numpy()]
+    counts = df_swaps_recent.groupby('swap_station_id')['cabinet_id'].nunique().reset_index()
+    return counts.rename(columns={'cabinet_id': 'cabinet_number'})
+
+def swaps_stats(df_swaps):
     daily_counts = df_swaps.groupby(['swap_station_id', 'day']).size().reset_index(name='swaps_count')
     daily_stats = daily_counts.groupby('swap_station_id')['swaps_count'].agg(
         swaps_per_day_mean='mean',
@@ -43,91 +28,156 @@ def merge_data(df_swaps, df_stations, df_traffic, radius_km = 0.3):
     ).reset_index()
 
     hourly_counts = df_swaps.groupby(['swap_station_id', 'day', 'hour']).size().reset_index(name='swaps_count')
-    
+
     hourly_stats = hourly_counts.groupby('swap_station_id')['swaps_count'].agg(
         swaps_per_hour_mean='mean',
         swaps_per_hour_median='median',
         swaps_per_hour_max='max'
     ).reset_index()
 
-    df_stations = df_stations.merge(daily_stats, on='swap_station_id', how='left')
-    df_stations = df_stations.merge(hourly_stats, on='swap_station_id', how='left')
+    return daily_stats, hourly_stats
+
+def week_swaps_count(df_swaps):
+    swaps_week = df_swaps[(df_swaps['created_at'] >= OBS_WEEK_START) &
+                          (df_swaps['created_at'] <= OBS_WEEK_END)]
+    return swaps_week.groupby('swap_station_id').size().reset_index(name='swaps_count')
 
+def neighborhood_features(indptr, indices, observations, point_ids, top_k=5):
+    # Vizinhanças em formato CSR: os pontos da estação i são indices[indptr[i]:indptr[i+1]]
+    counts = np.diff(indptr)
+    n_stations = len(counts)
+    group = np.repeat(np.arange(n_stations), counts)
+    values = observations[indices].astype('float64')
 
+    # 1. Ordena cada vizinhança por observações (maior primeiro) e mantém os top_k
+    order = np.lexsort((-values, group))
+    values, points = values[order], indices[order]
+    rank = np.arange(len(values)) - indptr[group]
+    keep = rank < top_k
+    values, points, group = values[keep], points[keep], group[keep]
+
+    # 2. Reduções por grupo sobre os top_k
+    m = np.minimum(counts, top_k)
+    top_ptr = np.concatenate([[0], np.cumsum(m)])
+    has = m > 0
+    first, last = top_ptr[:-1][has], top_ptr[1:][has] - 1
+
+    obs_max = np.full(n_stations, np.nan)
+    obs_min = np.full(n_stations, np.nan)
+    obs_sum = np.zeros(n_stations)
+    obs_q75 = np.full(n_stations, np.nan)
+    obs_max[has] = values[first]
+    obs_min[has] = values[last]
+    if has.any():
+        obs_sum[has] = np.add.reduceat(values, first)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        obs_mean = np.where(has, obs_sum / m, np.nan)
+
+    # Quantil 0.75 com interpolação linear (como pandas), lendo a ordem decrescente ao contrário
+    pos = 0.75 * (m[has] - 1)
+    lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+    v_lo, v_hi = values[last - lo], values[last - hi]
+    obs_q75[has] = v_lo + (v_hi - v_lo) * (pos - lo)
+
+    # 3. Ids dos pontos de máximo (primeiro do grupo) e de mínimo (primeira ocorrência do mínimo)
+    id_max = np.full(n_stations, np.nan)
+    id_min = np.full(n_stations, np.nan)
+    id_max[has] = point_ids[points[first]]
+    min_pos = np.flatnonzero(values == obs_min[group])
+    min_groups, first_min = np.unique(group[min_pos], return_index=True)
+    id_min[min_groups] = point_ids[points[min_pos[first_min]]]
+    if has.all():
+        id_max, id_min = id_max.astype(point_ids.dtype), id_min.astype(point_ids.dtype)
+
+    return pd.DataFrame({
+        'obs_max': obs_max,
+        'obs_min': obs_min,
+        'obs_mean': obs_mean,
+        'obs_sum': obs_sum,
+        'obs_q75': obs_q75,
+        'id_max': id_max,
+        'id_min': id_min,
+        'n_points_in_radius': counts
+    })
+
+def radius_suffix(radius_km):
+    return f'_r{int(round(radius_km * 1000))}'
+
+def multi_radius_summary(df_stations, df_traffic, radii_km, top_k=5, cache_dir=None):
     # -----------------------
-    # Pré-processamento
+    # Uma única consulta no maior raio, com distâncias; cada raio menor é um prefixo
+    # da vizinhança ordenada por distância
     # -----------------------
-    traffic_xyz = latlng_to_xyz(df_traffic['lat'].values, df_traffic['lng'].values)
-    stations_xyz = latlng_to_xyz(df_stations['lat'].values, df_stations['lng'].values)
-    
-    tree = cKDTree(traffic_xyz)
-    
+    tree = build_tree(df_traffic['lat'].values, df_traffic['lng'].values, cache_dir)
+    indptr, indices, dist_km = query_radius(
+        tree, df_stations['lat'].values, df_stations['lng'].values, max(radii_km), return_distance=True
+    )
+    n_stations = len(indptr) - 1
+    group = np.repeat(np.arange(n_stations), np.diff(indptr))
+    order = np.lexsort((dist_km, group))
+    indices, dist_km, group = indices[order], dist_km[order], group[order]
+
+    observations = df_traffic['observations'].to_numpy()
+    point_ids = df_traffic['traffic_point_id'].to_numpy()
+
+    frames = []
+    for radius_km in sorted(radii_km):
+        keep = dist_km <= radius_km
+        indptr_r = np.concatenate([[0], np.cumsum(np.bincount(group[keep], minlength=n_stations))])
+        df_r = neighborhood_features(indptr_r, indices[keep], observations, point_ids, top_k)
+        frames.append(df_r.add_suffix(radius_suffix(radius_km)))
+
+    df_summary = pd.concat(frames, axis=1)
+    df_summary.insert(0, 'swap_station_id', df_stations['swap_station_id'].to_numpy())
+    return df_summary
+
+def traffic_summary(df_stations, df_traffic, radius_km=0.3, top_k=5, cache_dir=None, radii_km=None):
+    if radii_km:
+        # Features para todos os raios; as colunas sem sufixo são as do raio principal
+        radii_km = sorted(set(radii_km) | {radius_km})
+        df_summary = multi_radius_summary(df_stations, df_traffic, radii_km, top_k, cache_dir)
+        suffix = radius_suffix(radius_km)
+        main_cols = [c for c in df_summary.columns if c.endswith(suffix)]
+        df_main = df_summary[main_cols].rename(columns=lambda c: c[:-len(suffix)])
+        return pd.concat([df_summary[['swap_station_id']], df_main, df_summary.drop(columns='swap_station_id')], axis=1)
+
     # -----------------------
-    # Iterar sobre as estações
+    # Uma única consulta para todas as estações: matriz de incidência esparsa (CSR)
     # -----------------------
+    incidence = build_incidence(df_stations, df_traffic, radius_km, cache_dir=cache_dir)
+    indptr, indices = incidence.indptr, incidence.indices
+
+    df_summary = neighborhood_features(
+        indptr,
+        indices,
+        df_traffic['observations'].to_numpy(),
+        df_traffic['traffic_point_id'].to_numpy(),
+        top_k
+    )
+    df_summary.insert(0, 'swap_station_id', df_stations['swap_station_id'].to_numpy())
+    return df_summary
+
+def add_station_metrics(df_stations, df_cabinet_counts, daily_stats, hourly_stats, df_traffic_summary, df_swaps_count_week):
+    # 2. Get cabinet counts (recent)
+    df_stations = df_stations.merge(
+        df_cabinet_counts,
+        on='swap_station_id',
+        how='left'
+    )
+    df_stations['cabinet_number'] = df_stations['cabinet_number'].fillna(0).astype(int)
+
+    # 3. Get swaps statistics
+    df_stations = df_stations.merge(daily_stats, on='swap_station_id', how='left')
+    df_stations = df_stations.merge(hourly_stats, on='swap_station_id', how='left')
 
-    results = []
-    
-    for i in tqdm(range(len(df_stations)), desc="Processing stations"):
-        station_point = stations_xyz[i]
-    
-        # Encontrar pontos de tráfego dentro do raio
-        idxs = tree.query_ball_point(station_point, r=radius_km)
-    
-        if idxs:  # se encontrou pontos
-            nearby_points = (
-                df_traffic.iloc[idxs]
-                .sort_values('observations', ascending=False)
-                .head(5)            # pega os 20 maiores
-            )
-        
-            nearby_obs = nearby_points['observations']
-    
-            max_idx = nearby_obs.idxmax()
-            min_idx = nearby_obs.idxmin()
-    
-            results.append({
-                'swap_station_id': df_stations.iloc[i]['swap_station_id'],
-                'obs_max': nearby_obs.max(),
-                'obs_min': nearby_obs.min(),
-                'obs_mean': nearby_obs.mean(),
-                'obs_sum': nearby_obs.sum(),
-                'obs_q75': nearby_obs.quantile(0.75),
-                'id_max': df_traffic.loc[max_idx, 'traffic_point_id'],
-                'id_min': df_traffic.loc[min_idx, 'traffic_point_id'],
-                'n_points_in_radius': len(idxs)
-            })
-        else:  # sem pontos no raio
-            results.append({
-                'swap_station_id': df_stations.iloc[i]['swap_station_id'],
-                'obs_max': np.nan,
-                'obs_min': np.nan,
-                'obs_mean': np.nan,
-                'obs_sum': nearby_obs.sum(),
-                'obs_q75': nearby_obs.quantile(0.75),
-                'id_max': None,
-                'id_min': None,
-                'n_points_in_radius': 0
-            })
-    
-    df_station_traffic_summary = pd.DataFrame(results)
-    
     # -----------------------
     # Unir com df_stations
     # -----------------------
-    df_stations = df_stations.merge(df_station_traffic_summary, on='swap_station_id', how='left')
+    df_stations = df_stations.merge(df_traffic_summary, on='swap_station_id', how='left')
 
     # 4. Get swaps/observations calculations
-    start_week = pd.Timestamp('2025-02-10')
-    end_week = pd.Timestamp('2025-02-16')
-
-    swaps_week = df_swaps[(df_swaps['created_at'] >= start_week) & 
-                          (df_swaps['created_at'] <= end_week)]
-    
-    swaps_count_week = swaps_week.groupby('swap_station_id').size().reset_index(name='swaps_count')
-
     df_stations = df_stations.merge(
-        swaps_count_week,
+        df_swaps_count_week,
         on='swap_station_id',
         how='left'
     )
@@ -144,13 +194,17 @@ def merge_data(df_swaps, df_stations, df_traffic, radius_km = 0.3):
         df_stations['swaps_per_day_mean'] / df_stations['cabinet_number'].replace(0, np.nan)
     )
 
-    df_stations = df_stations.fillna(0)
-        
-    # 5. Merge all the data
-    df_final = df_stations.merge(
-        df_swaps,
-        on='swap_station_id',
-        how='left'
+    return compact(df_stations.fillna(0), STATIONS_DTYPES)
+
+def merge_data(df_swaps, df_stations, df_traffic, radius_km = 0.3, cache_dir=None, radii_km=None):
+    daily_stats, hourly_stats = swaps_stats(df_swaps)
+    df_stations = add_station_metrics(
+        df_stations,
+        cabinet_counts(df_swaps),
+        daily_stats,
+        hourly_stats,
+        traffic_summary(df_stations, df_traffic, radius_km, cache_dir=cache_dir, radii_km=radii_km),
+        week_swaps_count(df_swaps)
     )
 
-    return df_final, df_stations
\ No newline at end of file
+    return df_stations
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from preprocessing.incremental import histogram_stats, DAILY_KEYS, HOURLY_KEYS
+from preprocessing.merge_data_v2 import OBS_WEEK_START, OBS_WEEK_END, add_station_metrics, traffic_summary
+from preprocessing.storage import iter_dataset
+
+# -----------------------
+# Merge fora da memória: as métricas de swaps por estação (mesmas de merge_data_v2) saem de agregados
+# parciais por lote. Contagens horárias parciais vão para disco em buckets por estação e cada bucket é
+# reduzido sozinho; a memória fica limitada pelo lote (batch_size) e pelo tamanho de um bucket (n_buckets).
+# -----------------------
+SWAPS_COLUMNS = ['swap_station_id', 'cabinet_id', 'created_at', 'day', 'hour']
+
+
+def _iso_year_week(created_at):
+    # Ano e semana ISO direto dos dias desde a época (isocalendar() é lento e aloca muito por lote)
+    ts = created_at.to_numpy(dtype='datetime64[ns]')
+    nat = np.isnat(ts)
+    days = ts.astype('datetime64[D]').astype(np.int64)
+    thursday = days - (days + 3) % 7 + 3  # quinta-feira da semana: define o ano ISO
+    year = thursday.astype('datetime64[D]').astype('datetime64[Y]')
+    week = (thursday - year.astype('datetime64[D]').astype(np.int64)) // 7 + 1
+    year = year.astype(np.int64) + 1970
+    return np.where(nat, np.nan, year), np.where(nat, np.nan, week)
+
+
+def _recent_cabinets(recent, df, max_key):
+    # Pares (estação, cabinet) candidatos à semana mais recente: como em cabinet_counts, o maior par (ano, semana),
+    # comparado como ano*100 + semana; o que não bate com o máximo corrente nunca vai bater com o final
+    year, week = _iso_year_week(df['created_at'])
+    batch = pd.DataFrame({
+        'swap_station_id': df['swap_station_id'].to_numpy(),
+        'cabinet_id': df['cabinet_id'].to_numpy(),
+        'week_key': year * 100 + week
+    })
+    max_key = np.nanmax([max_key, batch['week_key'].max()])
+    batch = batch[batch['week_key'] == max_key].drop_duplicates()
+    recent = batch if recent is None else pd.concat([recent, batch])
+    recent = recent[recent['week_key'] == max_key].drop_duplicates()
+    return recent, max_key
+
+
+def _bucket_stats(path):
+    # Contagens exatas por (estação, dia, hora) de um bucket e as estatísticas diárias/horárias das suas estações
+    partial = pq.read_table(path).to_pandas()
+    hourly_counts = partial.groupby(HOURLY_KEYS, as_index=False)['swaps_count'].sum()
+    daily_counts = hourly_counts.groupby(DAILY_KEYS, as_index=False)['swaps_count'].sum()
+    return histogram_stats(None, daily_counts, 'swaps_per_day'), histogram_stats(None, hourly_counts, 'swaps_per_hour')
+
+
+def swaps_stats_stream(swaps_path, batch_size=250_000, n_buckets=16, spill_dir=None):
+    # Equivalente a (cabinet_counts, *swaps_stats, week_swaps_count) lendo o dataset de swaps em lotes
+    recent = None
+    max_key = np.nan
+    week_counts = []
+
+    tmp_dir = tempfile.mkdtemp(prefix='merge_spill_', dir=spill_dir)
+    writers = {}
+    schema = None
+    try:
+        # Passo 1: um lote por vez; contagens parciais por hora vão para o bucket da estação
+        for df in iter_dataset(swaps_path, SWAPS_COLUMNS, batch_size):
+            df = df.dropna(subset=['swap_station_id'])
+            recent, max_key = _recent_cabinets(recent, df, max_key)
+
+            in_week = (df['created_at'] >= OBS_WEEK_START) & (df['created_at'] <= OBS_WEEK_END)
+            week_counts.append(df[in_week].groupby('swap_station_id').size())
+
+            partial = df.assign(day=pd.to_datetime(df['day'], cache=False)).groupby(HOURLY_KEYS).size().reset_index(name='swaps_count')
+            table = pa.Table.from_pandas(partial, preserve_index=False)
+            if schema is None:
+                schema = table.schema
+            table = table.cast(schema)
+            buckets = partial['swap_station_id'].to_numpy(dtype='int64') % n_buckets
+            for b in np.unique(buckets):
+                if b not in writers:
+                    writers[b] = pq.ParquetWriter(os.path.join(tmp_dir, f'bucket_{b:05d}.parquet'), schema)
+                writers[b].write_table(table.filter(pa.array(buckets == b)))
+        for writer in writers.values():
+            writer.close()
+
+        # Passo 2: cada bucket tem estações completas, então suas estatísticas já são finais
+        daily, hourly = [], []
+        for b in sorted(writers):
+            daily_b, hourly_b = _bucket_stats(os.path.join(tmp_dir, f'bucket_{b:05d}.parquet'))
+            daily.append(daily_b)
+            hourly.append(hourly_b)
+    finally:
+        for writer in writers.values():
+            if writer.is_open:
+                writer.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def by_station(frames, columns):
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames).sort_values('swap_station_id').reset_index(drop=True)
+
+    daily_stats = by_station(daily, ['swap_station_id', 'swaps_per_day_mean', 'swaps_per_day_median', 'swaps_per_day_max'])
+    hourly_stats = by_station(hourly, ['swap_station_id', 'swaps_per_hour_mean', 'swaps_per_hour_median', 'swaps_per_hour_max'])
+    if recent is None:
+        recent = pd.DataFrame(columns=['swap_station_id', 'cabinet_id'])
+    cabinet_counts = (
+        recent.groupby('swap_station_id')['cabinet_id'].nunique()
+        .reset_index().rename(columns={'cabinet_id': 'cabinet_number'})
+    )
+    swaps_count_week = (
+        pd.concat(week_counts).groupby(level=0).sum() if week_counts else pd.Series(dtype='int64')
+    ).rename_axis('swap_station_id').reset_index(name='swaps_count')
+    return cabinet_counts, daily_stats, hourly_stats, swaps_count_week
+
+
+def merge_data_stream(swaps_path, df_stations, df_traffic, radius_km=0.3, cache_dir=None, radii_km=None,
+                      batch_size=250_000, n_buckets=16, spill_dir=None):
+    # Mesmo resultado de merge_data_v2.merge_data, sem carregar os swaps (swaps_path: dataset ou parquet)
+    cabinet_counts, daily_stats, hourly_stats, swaps_count_week = swaps_stats_stream(swaps_path, batch_size, n_buckets, spill_dir)
+    return add_station_metrics(
+        df_stations,
+        cabinet_counts,
+        daily_stats,
+        hourly_stats,
+        traffic_summary(df_stations, df_traffic, radius_km, cache_dir=cache_dir, radii_km=radii_km),
+        swaps_count_week
+    )
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+INT_DTYPES = ['int8', 'int16', 'int32', 'int64']
+
+# Inteiro com sinal opcional e até 18 dígitos (cabe em int64)
+INT_PATTERN = r'^-?[0-9]{1,18}$'
+
+# Caches string -> timestamp por arquivo, lidos do disco uma vez por processo. Entradas novas ficam pendentes
+# até save_datetime_caches (chamada no fim de cada transform), em vez de regravar o arquivo a cada chamada
+_DATETIME_CACHES = {}
+_PENDING_CACHES = set()
+
+
+def smallest_int_dtype(vmin, vmax, min_dtype):
+    for dtype in INT_DTYPES[INT_DTYPES.index(min_dtype):]:
+        info = np.iinfo(dtype)
+        if info.min <= vmin and vmax <= info.max:
+            return dtype
+    return 'int64'
+
+
+def _to_arrow_strings(values):
+    try:
+        arr = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Colunas object com tipos misturados (ex.: int e str)
+        arr = pa.array(pd.Series(values).astype(str).mask(pd.isna(values)), from_pandas=True)
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        arr = arr.cast(pa.string())
+    return arr
+
+
+def _parse_ints(values):
+    # Colunas já numéricas: só valida e converte
+    if not isinstance(values, (pa.Array, pa.ChunkedArray)) and pd.api.types.is_numeric_dtype(values.dtype):
+        if pd.api.types.is_integer_dtype(values.dtype) and not values.hasnans:
+            return values.to_numpy(dtype='int64'), np.zeros(len(values), dtype=bool)
+        floats = values.to_numpy(dtype='float64', na_value=np.nan)
+        bad = ~(np.isfinite(floats) & (floats == np.floor(floats)))
+        return np.where(bad, 0, floats).astype('int64'), bad
+
+    # Colunas de texto: remove separadores de milhar e converte direto nos buffers do Arrow
+    arr = pc.utf8_trim_whitespace(pc.replace_substring(_to_arrow_strings(values), ',', ''))
+    ok = pc.fill_null(pc.match_substring_regex(arr, INT_PATTERN), False)
+    ints = pc.cast(pc.if_else(ok, arr, pa.scalar(None, arr.type)), pa.int64())
+    bad = ~ok.to_numpy(zero_copy_only=False)
+    return pc.fill_null(ints, 0).to_numpy(zero_copy_only=False), bad
+
+
+def invalid_int_rows(values):
+    # Linhas que não podem ser convertidas para inteiro (inclui nulos)
+    _, bad = _parse_ints(values)
+    if isinstance(values, pd.Series):
+        return values[bad]
+    return pd.Series(pa.array(values).to_pandas())[bad]
+
+
+def parse_int_column(values, min_dtype='int8', errors='report'):
+    ints, bad = _parse_ints(values)
+
+    if isinstance(values, pd.Series):
+        index, name = values.index, values.name
+    else:
+        index, name = pd.RangeIndex(len(ints)), None
+
+    n_bad = int(bad.sum())
+    if n_bad:
+        examples = invalid_int_rows(values).head(5).tolist()
+        message = f"{name}: {n_bad} rows failed to parse as integers (e.g. {examples})"
+        if errors == 'raise':
+            raise ValueError(message)
+        if errors == 'report':
+            logging.warning(message)
+
+    valid = ints[~bad]
+    dtype = smallest_int_dtype(valid.min(), valid.max(), min_dtype) if len(valid) else min_dtype
+    if not n_bad:
+        return pd.Series(ints.astype(dtype), index=index, name=name)
+
+    # Linhas inválidas viram <NA> num inteiro anulável
+    parsed = pd.array(ints.astype(dtype), dtype=dtype.capitalize())
+    parsed[bad] = pd.NA
+    return pd.Series(parsed, index=index, name=name)
+
+
+def _datetime_cache_path(cache_dir, format):
+    key = hashlib.sha1(format.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f'datetime_{key}.parquet')
+
+
+def _load_datetime_cache(path):
+    if path not in _DATETIME_CACHES:
+        if os.path.exists(path):
+            cache = pd.read_parquet(path, engine='pyarrow')
+            _DATETIME_CACHES[path] = pd.Series(cache['parsed'].to_numpy(), index=pd.Index(cache['value']))
+        else:
+            _DATETIME_CACHES[path] = pd.Series(dtype='datetime64[ns]', index=pd.Index([], dtype=object))
+    return _DATETIME_CACHES[path]
+
+
+def _parse_uniques(uniques, format, cache_dir):
+    if cache_dir is None:
+        return pd.to_datetime(uniques, format=format, cache=False)
+
+    # Cache persistente string -> timestamp (um arquivo por formato)
+    path = _datetime_cache_path(cache_dir, format)
+    cached = _load_datetime_cache(path)
+
+    parsed = cached.reindex(uniques)
+    missing = ~uniques.isin(cached.index)
+    if missing.any():
+        new_values = uniques[missing]
+        parsed[missing] = pd.to_datetime(new_values, format=format, cache=False).to_numpy()
+        _DATETIME_CACHES[path] = pd.concat([cached, pd.Series(parsed[missing].to_numpy(), index=new_values)])
+        _PENDING_CACHES.add(path)
+    return pd.DatetimeIndex(parsed.to_numpy())
+
+
+def save_datetime_caches():
+    # Grava os caches com entradas novas desde a última gravação (uma escrita por arquivo)
+    for path in sorted(_PENDING_CACHES):
+        cached = _DATETIME_CACHES[path]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.DataFrame({'value': cached.index.astype(str), 'parsed': cached.to_numpy()}).to_parquet(path, index=False, engine='pyarrow')
+    _PENDING_CACHES.clear()
+
+
+def parse_datetime_column(values, format, cache_dir=None):
+    # Parseia cada string distinta uma única vez e propaga pelos códigos
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Index(uniques, dtype=object)
+    parsed = _parse_uniques(uniques, format, cache_dir).to_numpy()
+
+    result = np.full(len(codes), np.datetime64('NaT'), dtype=parsed.dtype if len(parsed) else 'datetime64[ns]')
+    valid = codes >= 0
+    result[valid] = parsed[codes[valid]]
+
+    index = values.index if isinstance(values, pd.Series) else None
+    name = values.name if isinstance(values, pd.Series) else None
+    return pd.Series(result, index=index, name=name)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# -----------------------
+# Camada processada em esquema estrela: swaps (fato) + stations (dimensão), ligadas por swap_station_id.
+# Schema compacto das tabelas processadas (dtypes pandas; o tipo Arrow equivalente
+# é derivado na escrita: category -> dictionary, datetime64 -> timestamp, intN -> intN)
+# -----------------------
+ID_DTYPE = 'int32'
+LEVEL_DTYPE = 'int16'
+
+SWAPS_DTYPES = {
+    'created_at': 'datetime64[ns]',
+    'ended_at': 'datetime64[ns]',
+    'cabinet_id': ID_DTYPE,
+    'swap_station_id': ID_DTYPE,
+    'rider_id': ID_DTYPE,
+    'status': 'category',
+    'battery_in_level': LEVEL_DTYPE,
+    'battery_out_level': LEVEL_DTYPE,
+    'battery_charged': LEVEL_DTYPE,
+    'day': 'datetime64[ns]',
+    'month': 'int8',
+    'hour': 'int8',
+    'day_period': 'category',
+    'charging_duration_min': 'float32',
+    'day_of_week': 'category',
+    'is_weekend': 'int8',
+    'rush_period': 'category'
+}
+
+STATIONS_DTYPES = {
+    'swap_station_id': ID_DTYPE,
+    'nearest_station_id': ID_DTYPE,
+    'cabinet_number': LEVEL_DTYPE,
+    'n_points_in_radius': ID_DTYPE,
+    'id_max': ID_DTYPE,
+    'id_min': ID_DTYPE,
+    'swaps_count': ID_DTYPE
+}
+
+
+def compact(df, dtypes):
+    # Aplica os dtypes compactos às colunas presentes; inteiros com nulos viram inteiros anuláveis e
+    # inteiros fora da faixa do dtype compacto mantêm o dtype atual (astype daria a volta em silêncio)
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype.startswith('int') and pd.api.types.is_integer_dtype(df[col].dtype) and df[col].notna().any():
+            info = np.iinfo(dtype)
+            if df[col].min() < info.min or df[col].max() > info.max:
+                continue
+        if dtype.startswith('int') and df[col].hasnans:
+            dtype = dtype.capitalize()
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def write_parquet(df, path, dtypes=None):
+    # Escreve com os tipos Arrow correspondentes ao schema compacto
+    if dtypes is not None:
+        df = compact(df.copy(), dtypes)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, compression='snappy')
+
+
+def memory_report(df_before, df_after):
+    before = df_before.memory_usage(deep=True)
+    after = df_after.memory_usage(deep=True)
+    report = pd.DataFrame({
+        'dtype_before': df_before.dtypes.astype(str),
+        'dtype_after': df_after.dtypes.astype(str),
+        'mb_before': before.drop('Index') / 2**20,
+        'mb_after': after.drop('Index') / 2**20
+    })
+    report.loc['total'] = ['', '', before.sum() / 2**20, after.sum() / 2**20]
+    return report
+
+
+def join_stations(df_swaps, df_stations, columns=None):
+    # Junta atributos da dimensão aos swaps pela chave, apenas quando o consumidor precisa deles
+    if columns is not None:
+        df_stations = df_stations[['swap_station_id'] + [c for c in columns if c != 'swap_station_id']]
+    return df_swaps.merge(df_stations, on='swap_station_id', how='left')
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+# Árvores já carregadas nesta sessão (pipeline ou notebook), por fingerprint
+_TREES = {}
+
+
+def latlng_to_xyz(lat, lng, R=EARTH_RADIUS_KM):
+    # Coordenadas cartesianas centradas na Terra (esfera de raio R, em km)
+    lat_r = np.radians(np.asarray(lat, dtype='float64'))
+    lng_r = np.radians(np.asarray(lng, dtype='float64'))
+    x = R * np.cos(lat_r) * np.cos(lng_r)
+    y = R * np.cos(lat_r) * np.sin(lng_r)
+    z = R * np.sin(lat_r)
+    return np.vstack([x, y, z]).T
+
+
+def chord_to_km(chord, R=EARTH_RADIUS_KM):
+    # Distância em linha reta (corda) -> distância do grande círculo
+    return 2 * R * np.arcsin(np.clip(np.asarray(chord) / (2 * R), 0, 1))
+
+
+def km_to_chord(km, R=EARTH_RADIUS_KM):
+    return 2 * R * np.sin(np.minimum(np.asarray(km) / (2 * R), np.pi / 2))
+
+
+def coords_fingerprint(lat, lng):
+    coords = np.ascontiguousarray(np.column_stack([lat, lng]), dtype='float64')
+    return hashlib.sha1(coords.tobytes()).hexdigest()[:16]
+
+
+def build_tree(lat, lng, cache_dir=None):
+    fingerprint = coords_fingerprint(lat, lng)
+    if fingerprint in _TREES:
+        return _TREES[fingerprint]
+
+    path = os.path.join(cache_dir, 'spatial', f'tree_{fingerprint}.pkl') if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            tree = pickle.load(f)
+    else:
+        tree = cKDTree(latlng_to_xyz(lat, lng))
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                pickle.dump(tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    _TREES[fingerprint] = tree
+    return tree
+
+
+def query_knn(tree, lat, lng, k=1):
+    # k vizinhos mais próximos, com distâncias em km do grande círculo
+    chord, idx = tree.query(latlng_to_xyz(lat, lng), k=k, workers=-1)
+    return chord_to_km(chord), idx
+
+
+def query_radius(tree, lat, lng, radius_km, return_distance=False):
+    # Vizinhos dentro do raio (km do grande círculo) em formato CSR:
+    # os vizinhos do ponto i são indices[indptr[i]:indptr[i+1]]
+    xyz = latlng_to_xyz(lat, lng)
+    neighbors = tree.query_ball_point(xyz, r=km_to_chord(radius_km), workers=-1)
+    counts = np.fromiter(map(len, neighbors), dtype=np.int64, count=len(neighbors))
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    indices = np.concatenate([np.asarray(n, dtype=np.int64) for n in neighbors]) if len(neighbors) else np.empty(0, np.int64)
+    if not return_distance:
+        return indptr, indices
+
+    group = np.repeat(np.arange(len(counts)), counts)
+    dist_km = chord_to_km(np.linalg.norm(tree.data[indices] - xyz[group], axis=1))
+    return indptr, indices, dist_km
+
+
+def grid_keys(lat, lng, cell_m):
+    # Célula de uma grade de cell_m metros (equiretangular na latitude média, suficiente na escala de uma cidade)
+    lat = np.asarray(lat, dtype='float64')
+    lng = np.asarray(lng, dtype='float64')
+    dlat = np.degrees(cell_m / (EARTH_RADIUS_KM * 1000))
+    dlng = dlat / np.cos(np.radians(np.nanmean(lat))) if len(lat) else dlat
+    i = np.floor(lat / dlat).astype(np.int64)
+    j = np.floor(lng / dlng).astype(np.int64)
+    return i * (1 << 32) + (j + (1 << 31))
+
+
+def dedup_points(df, value_col, cell_m=None, lat_col='lat', lng_col='lng'):
+    # Um ponto por coordenada (cell_m=None) ou por célula da grade: fica o de maior value_col
+    # (primeira ocorrência em empates). Tudo em O(n): hash das chaves e reduções por grupo, sem ordenar
+    if cell_m:
+        key = grid_keys(df[lat_col], df[lng_col], cell_m)
+    else:
+        # Par (lat, lng) exato como um único complexo
+        key = df[lat_col].to_numpy(dtype='float64') + 1j * df[lng_col].to_numpy(dtype='float64')
+    codes, uniques = pd.factorize(key, use_na_sentinel=False)
+
+    values = df[value_col].to_numpy(dtype='float64', na_value=-np.inf)
+    best_value = np.full(len(uniques), -np.inf)
+    np.maximum.at(best_value, codes, values)
+    candidates = np.flatnonzero(values == best_value[codes])
+    first = np.full(len(uniques), len(values))
+    np.minimum.at(first, codes[candidates], candidates)
+
+    # Sobreviventes na ordem de entrada
+    keep = np.zeros(len(values), dtype=bool)
+    keep[first] = True
+    return df[keep].reset_index(drop=True)
@@ -1,7 +1,9 @@
 import pandas as pd
-from scipy.spatial import cKDTree
 
-def transform_stations_data(df):
+from preprocessing.parsing import parse_int_column
+from preprocessing.spatial_index import build_tree, query_knn
+
+def transform_stations_data(df, cache_dir=None):
     # 1. Remove duplicates
     df = df.drop_duplicates()
 
@@ -15,7 +17,7 @@ def transform_stations_data(df):
     )
     
     # 3. Adjust ID
-    df['swap_station_id'] = df['swap_station_id'].astype(str).str.replace(',', '').astype(int)
+    df['swap_station_id'] = parse_int_column(df['swap_station_id'], min_dtype='int32')
     
     # 4. Neighborhood name extraction
     df = df[~df['address'].str.contains('Santiago Metropolitan Region')]
@@ -31,13 +33,11 @@ def transform_stations_data(df):
     df = df.drop(columns=['number'])
 
     # 6. Geospatial features
-    coords = df[['lat', 'lng']].to_numpy()
-
-    tree = cKDTree(coords)
+    tree = build_tree(df['lat'].values, df['lng'].values, cache_dir)
 
-    distances, indices = tree.query(coords, k=2)
+    distances, indices = query_knn(tree, df['lat'].values, df['lng'].values, k=2)
 
-    df['nearest_station_distance_km'] = (distances[:,1] * 111).round(4)  # ~111 km/degree
+    df['nearest_station_distance_km'] = distances[:,1].round(4)  # distância do grande círculo
     df['nearest_station_id'] = df.iloc[indices[:,1]].swap_station_id.values
     df['nearest_station_name'] = df.iloc[indices[:,1]].swap_station_name.values
     
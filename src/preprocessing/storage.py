@@ -0,0 +1,185 @@
+import os
+import shutil
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from preprocessing.schema import compact
+
+# -----------------------
+# Datasets particionados por mês (hive: <path>/period=YYYY-MM/part-*.parquet), ordenados por id
+# dentro de cada partição. As estatísticas min/max de cada row group permitem que filtros por
+# estação ou janela de tempo leiam apenas os row groups correspondentes.
+# -----------------------
+PARTITION_COL = 'period'
+ROW_GROUP_SIZE = 64_000
+
+
+def month_keys(ts):
+    # 'YYYY-MM' por linha (NaT -> 'NaT')
+    return np.datetime_as_string(np.asarray(ts, dtype='datetime64[ns]').astype('datetime64[M]'), unit='M')
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def partition_path(path, month, part_name='part-0'):
+    return os.path.join(path, f'{PARTITION_COL}={month}', f'{part_name}.parquet')
+
+
+def write_dataset(df, path, time_col='created_at', sort_columns=None, dtypes=None, part_name='part-0',
+                  overwrite=True, row_group_size=ROW_GROUP_SIZE):
+    if dtypes is not None:
+        df = compact(df.copy(), dtypes)
+
+    # overwrite: escreve num diretório temporário e troca no final (leitores nunca veem metade do dataset)
+    target = f'{path}.tmp' if overwrite else path
+    if overwrite:
+        remove_path(target)
+    elif os.path.isfile(path):
+        raise ValueError(f"{path} is a single parquet file; rewrite it as a dataset before appending")
+
+    months = month_keys(df[time_col])
+    if not overwrite:
+        # Append: um part existente nunca é substituído (cada append precisa de um part_name próprio)
+        existing = [partition_path(target, month, part_name) for month in np.unique(months)]
+        existing = [file_path for file_path in existing if os.path.exists(file_path)]
+        if existing:
+            raise ValueError(f"{path}: refusing to overwrite existing parts {existing}; use a new part_name")
+    for month in np.unique(months):
+        part = df[months == month]
+        if sort_columns:
+            part = part.sort_values(sort_columns, kind='stable')
+        file_path = partition_path(target, month, part_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        pq.write_table(
+            pa.Table.from_pandas(part, preserve_index=False), file_path,
+            row_group_size=row_group_size, compression='snappy', write_statistics=True
+        )
+
+    if overwrite:
+        remove_path(path)
+        if os.path.exists(target):
+            os.replace(target, path)
+        else:
+            os.makedirs(path)
+
+
+@contextmanager
+def dataset_writer(path, time_col='created_at', part_name='part-0', row_group_size=ROW_GROUP_SIZE):
+    # Versão incremental de write_dataset: `with dataset_writer(path) as append: append(df) ...`.
+    # Os DataFrames são convertidos para Arrow em blocos de ~row_group_size linhas e cada bloco vai para os
+    # ParquetWriters das partições dos seus meses, sem reordenar (para o mesmo layout de write_dataset com
+    # sort_columns, os appends devem vir nessa ordem). Em memória fica no máximo um bloco e, por partição,
+    # menos de um row group; a troca para o caminho final só acontece se o bloco `with` terminar sem erro
+    target = f'{path}.tmp'
+    remove_path(target)
+    writers, pending, frames = {}, {}, []
+    state = {'schema': None, 'rows': 0}
+
+    def write(month, final=False):
+        table = pa.concat_tables(pending.pop(month))
+        n_full = table.num_rows if final else table.num_rows - table.num_rows % row_group_size
+        if n_full:
+            if month not in writers:
+                file_path = partition_path(target, month, part_name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                writers[month] = pq.ParquetWriter(file_path, state['schema'], compression='snappy', write_statistics=True)
+            writers[month].write_table(table.slice(0, n_full), row_group_size=row_group_size)
+        if n_full < table.num_rows:
+            pending[month] = [table.slice(n_full)]
+
+    def flush():
+        df = pd.concat(frames, ignore_index=True)
+        frames.clear()
+        state['rows'] = 0
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if state['schema'] is None:
+            state['schema'] = table.schema
+        table = table.cast(state['schema'])
+        months = month_keys(df[time_col])
+        for month in np.unique(months):
+            pending.setdefault(month, []).append(table.filter(pa.array(months == month)))
+            if sum(t.num_rows for t in pending[month]) >= row_group_size:
+                write(month)
+
+    def append(df):
+        frames.append(df)
+        state['rows'] += len(df)
+        if state['rows'] >= row_group_size:
+            flush()
+
+    try:
+        yield append
+        if frames:
+            flush()
+        for month in list(pending):
+            write(month, final=True)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    remove_path(path)
+    if os.path.exists(target):
+        os.replace(target, path)
+    else:
+        os.makedirs(path)
+
+
+def _timestamp(value):
+    return pa.scalar(pd.Timestamp(value).as_unit('ns'), type=pa.timestamp('ns'))
+
+
+def read_dataset(path, columns=None, ids=None, id_col='swap_station_id', start=None, end=None, time_col='created_at'):
+    # Lê um dataset particionado (ou um parquet único) aplicando os filtros no scan do Arrow
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    partitioned = PARTITION_COL in dataset.schema.names
+
+    conditions = []
+    if ids is not None:
+        conditions.append(ds.field(id_col).isin(pa.array(np.asarray(ids)).cast(dataset.schema.field(id_col).type)))
+    if start is not None:
+        conditions.append(ds.field(time_col) >= _timestamp(start))
+        if partitioned:
+            conditions.append(ds.field(PARTITION_COL) >= str(month_keys([pd.Timestamp(start)])[0]))
+    if end is not None:
+        conditions.append(ds.field(time_col) <= _timestamp(end))
+        if partitioned:
+            conditions.append(ds.field(PARTITION_COL) <= str(month_keys([pd.Timestamp(end)])[0]))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c != PARTITION_COL]
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def iter_dataset(path, columns=None, batch_size=1_000_000):
+    # Lê o dataset (ou parquet único) em DataFrames de até batch_size linhas. Scanner sem threads, sem
+    # pre-buffer e com readahead de um lote: senão o Arrow lê adiante row groups/arquivos inteiros
+    # e a memória cresce com o tamanho das partições
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c != PARTITION_COL]
+    batches = dataset.to_batches(
+        columns=columns, batch_size=min(batch_size, 1 << 17), batch_readahead=1, fragment_readahead=1,
+        use_threads=False, fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False)
+    )
+    pending, n_pending = [], 0
+    for batch in batches:
+        pending.append(batch)
+        n_pending += batch.num_rows
+        if n_pending >= batch_size:
+            yield pa.Table.from_batches(pending).to_pandas()
+            pending, n_pending = [], 0
+    if n_pending:
+        yield pa.Table.from_batches(pending).to_pandas()
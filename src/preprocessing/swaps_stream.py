@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from preprocessing.parsing import parse_int_column, save_datetime_caches, smallest_int_dtype
+from preprocessing.schema import compact, SWAPS_DTYPES
+from preprocessing.storage import month_keys, partition_path, remove_path, ROW_GROUP_SIZE
+from preprocessing.swaps_transform import transform_swaps_rows, drop_invalid_keys, SORT_COLUMNS, DROP_COLUMNS, KEY_COLUMNS
+
+
+def _station_buckets(pf, batch_size, rows_per_bucket):
+    # Passo 1: contagem de linhas por estação lendo apenas a coluna de id
+    counts = pd.Series(dtype='int64')
+    for batch in pf.iter_batches(batch_size=batch_size, columns=['swap_station_id']):
+        ids = batch.column(0).drop_null()
+        if len(ids) == 0:
+            continue
+        batch_counts = parse_int_column(ids, min_dtype='int32', errors='coerce').value_counts()
+        counts = counts.add(batch_counts, fill_value=0)
+
+    # Faixas contíguas de estações (em ordem) com ~rows_per_bucket linhas cada
+    counts = counts.sort_index().astype('int64')
+    starts = counts.cumsum() - counts
+    return pd.Series((starts // rows_per_bucket).to_numpy(), index=counts.index)
+
+
+def _to_table(df, schema):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is not None:
+        table = table.cast(schema)
+    return table
+
+
+def _spill_schema(schema):
+    # Inteiros em int64 no spill: um batch posterior cujos ids/níveis alargam (parse_int_column) sempre cabe
+    return pa.schema([
+        field.with_type(pa.int64()) if pa.types.is_integer(field.type) else field for field in schema
+    ])
+
+
+def _update_ranges(ranges, df):
+    # Mínimo/máximo de cada coluna inteira do schema compacto, acumulados entre os batches
+    for col, dtype in SWAPS_DTYPES.items():
+        if col in df.columns and dtype.startswith('int') and df[col].notna().any():
+            vmin, vmax = df[col].min(), df[col].max()
+            if col in ranges:
+                vmin, vmax = min(vmin, ranges[col][0]), max(vmax, ranges[col][1])
+            ranges[col] = (vmin, vmax)
+
+
+def _output_dtypes(ranges):
+    # Schema compacto, alargando as colunas cujos valores (no arquivo todo) não cabem, como compact em memória
+    return {
+        col: smallest_int_dtype(*ranges[col], dtype) if col in ranges else dtype
+        for col, dtype in SWAPS_DTYPES.items()
+    }
+
+
+def transform_swaps_stream(src_path, dst_path, batch_size=250_000, rows_per_bucket=2_000_000, spill_dir=None, cache_dir=None,
+                           row_group_size=ROW_GROUP_SIZE):
+    # Saída: dataset particionado por mês e ordenado por estação (ver preprocessing.storage)
+    pf = pq.ParquetFile(src_path)
+    bucket_of = _station_buckets(pf, batch_size, rows_per_bucket)
+
+    tmp_dir = tempfile.mkdtemp(prefix='swaps_spill_', dir=spill_dir)
+    writers = {}
+    out_writers = {}
+    out_dir = f'{dst_path}.tmp'
+    remove_path(out_dir)
+    schema = None
+    ranges = {}
+    try:
+        # Passo 2: etapas linha a linha por batch, com spill por faixa de estação
+        for batch in pf.iter_batches(batch_size=batch_size):
+            df = batch.to_pandas()
+            df = df.dropna(subset=KEY_COLUMNS)
+            if df.empty:
+                continue
+            df = drop_invalid_keys(transform_swaps_rows(df.copy(), cache_dir))
+            if df.empty:
+                continue
+            buckets = bucket_of.reindex(df['swap_station_id']).to_numpy(dtype='int64')
+            _update_ranges(ranges, df)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if schema is None:
+                schema = _spill_schema(table.schema)
+            table = table.cast(schema)
+            for b in np.unique(buckets):
+                if b not in writers:
+                    writers[b] = pq.ParquetWriter(os.path.join(tmp_dir, f'bucket_{b:05d}.parquet'), schema)
+                writers[b].write_table(table.filter(pa.array(buckets == b)))
+        for writer in writers.values():
+            writer.close()
+        # Cache de datas gravado uma vez, depois de todos os batches
+        save_datetime_caches()
+
+        # Passo 3: etapas globais (dedup e ordenação) um bucket por vez, em ordem de estação;
+        # cada bucket é dividido por mês, então cada partição fica ordenada por estação. Todos os buckets saem
+        # com os mesmos dtypes, definidos pelas faixas de valores do arquivo inteiro
+        out_dtypes = _output_dtypes(ranges)
+        out_schema = None
+        for b in sorted(writers):
+            df = pq.read_table(os.path.join(tmp_dir, f'bucket_{b:05d}.parquet')).to_pandas()
+            df = df.drop_duplicates()
+            df = df.drop(columns=DROP_COLUMNS)
+            df = df.sort_values(SORT_COLUMNS)[:].reset_index(drop=True)
+            table = _to_table(compact(df, out_dtypes), out_schema)
+            out_schema = table.schema
+            months = month_keys(df['created_at'])
+            for month in np.unique(months):
+                if month not in out_writers:
+                    file_path = partition_path(out_dir, month)
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    out_writers[month] = pq.ParquetWriter(file_path, out_schema, compression='snappy')
+                out_writers[month].write_table(table.filter(pa.array(months == month)), row_group_size=row_group_size)
+        for writer in out_writers.values():
+            writer.close()
+
+        # Troca o dataset anterior pelo novo apenas no final
+        remove_path(dst_path)
+        if out_writers:
+            os.replace(out_dir, dst_path)
+        else:
+            os.makedirs(dst_path)
+    finally:
+        for writer in list(writers.values()) + list(out_writers.values()):
+            if writer.is_open:
+                writer.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        remove_path(out_dir)
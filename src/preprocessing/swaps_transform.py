@@ -1,6 +1,9 @@
-import pandas as pd
 
-# Funções auxiliares
+from preprocessing.parsing import parse_int_column, parse_datetime_column, save_datetime_caches
+from preprocessing.time_features import add_time_features
+from preprocessing.schema import ID_DTYPE, LEVEL_DTYPE
+
+# Funções auxiliares (versão escalar, mantida como referência para o benchmark)
 def get_period(h):
     if 5 <= h < 12:
         return 'morning'
@@ -14,43 +17,61 @@ def get_period(h):
 def rush_hour(h):
     return 'rush' if h in [8,9,17,18,19] else 'off_peak'
 
+DATETIME_FORMAT = '%B %d, %Y, %I:%M %p'
+ID_COLUMNS = ['cabinet_id', 'swap_station_id', 'rider_id']
+LEVEL_COLUMNS = ['battery_in_level', 'battery_out_level']
+SORT_COLUMNS = ['swap_station_id', 'created_at']
+KEY_COLUMNS = ['swap_station_id', 'cabinet_id']
+DROP_COLUMNS = ['battery_in_id', 'battery_out_id']
+
+# Etapas linha a linha (parsing, casting e features), sem dependência entre linhas
+def transform_swaps_rows(df, cache_dir=None):
+    # 1. Process date columns
+    df['created_at'] = parse_datetime_column(df['created_at'], DATETIME_FORMAT, cache_dir)
+    df['ended_at'] = parse_datetime_column(df['ended_at'], DATETIME_FORMAT, cache_dir)
+
+    # 2. Process numeric columns
+    for col in ID_COLUMNS:
+        df[col] = parse_int_column(df[col], min_dtype=ID_DTYPE)
+    for col in LEVEL_COLUMNS:
+        df[col] = parse_int_column(df[col], min_dtype=LEVEL_DTYPE)
+
+    # 3. Normalize status column
+    df['status'] = df['status'].str.lower().astype('category')
+
+    # 4. Create "battery charged" feature (<NA> se algum nível não foi parseado; o mesmo ajuste de
+    # dtype do parsing, então valores fora de int16 alargam a coluna em vez de dar a volta)
+    charged = df['battery_out_level'].astype('Int64') - df['battery_in_level'].astype('Int64')
+    df['battery_charged'] = parse_int_column(charged, min_dtype=LEVEL_DTYPE, errors='coerce').rename('battery_charged')
+
+    # 5. Create time features
+    df = add_time_features(df)
+
+    return df
+
+def drop_invalid_keys(df):
+    # Ids que não puderam ser convertidos viram <NA> no parsing: sem estação/cabinet, a linha sai
+    # (como as nulas na origem) e as chaves voltam a inteiros não anuláveis
+    df = df.dropna(subset=KEY_COLUMNS)
+    return df.astype({col: getattr(df[col].dtype, 'numpy_dtype', df[col].dtype) for col in KEY_COLUMNS})
+
 # Função de processamento
-def transform_swaps_data(df):
+def transform_swaps_data(df, cache_dir=None):
     # 1. Remove duplicates
     df = df.drop_duplicates()
 
     # 2. Remove null data
-    df = df.dropna(subset=['swap_station_id', 'cabinet_id'])
+    df = df.dropna(subset=KEY_COLUMNS)
 
     # 3. Drop columns
-    df = df.drop(columns=['battery_in_id', 'battery_out_id'])
-    
-    # 4. Process date columns
-    df['created_at'] = pd.to_datetime(df['created_at'], format='%B %d, %Y, %I:%M %p')
-    df['ended_at'] = pd.to_datetime(df['ended_at'], format='%B %d, %Y, %I:%M %p')
+    df = df.drop(columns=DROP_COLUMNS)
+
+    # 4. Parse, cast and create features
+    df = transform_swaps_rows(df, cache_dir)
+    df = drop_invalid_keys(df)
+    save_datetime_caches()
 
     # 5. Sort Values
-    df = df.sort_values(['swap_station_id', 'created_at'])[:].reset_index(drop=True)
-
-    # 6. Process numeric columns
-    num_cols = ['cabinet_id', 'swap_station_id', 'rider_id', 'battery_in_level', 'battery_out_level']	
-    for col in num_cols:
-        df[col] = df[col].astype(str).str.replace(',', '').astype(int)
-
-    # 7. Normalize status column
-    df['status'] = df['status'].str.lower()
-
-    # 8. Create "battery charged" feature
-    df['battery_charged'] = df['battery_out_level'] - df['battery_in_level']
-
-    # 9. Create time features
-    df['day'] = df['created_at'].dt.date
-    df['month'] = df['created_at'].dt.month
-    df['hour'] = df['created_at'].dt.hour
-    df['day_period'] = df['hour'].apply(get_period)
-    df['charging_duration_min'] = (df['ended_at'] - df['created_at']).dt.total_seconds() / 60
-    df['day_of_week'] = df['created_at'].dt.strftime('%a').str.lower()
-    df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
-    df['rush_period'] = df['hour'].apply(rush_hour)
-
-    return df
\ No newline at end of file
+    df = df.sort_values(SORT_COLUMNS)[:].reset_index(drop=True)
+
+    return df
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+# Períodos do dia: night (0-5h), morning (5-12h), afternoon (12-18h), evening (18-24h)
+PERIOD_LABELS = ['night', 'morning', 'afternoon', 'evening']
+PERIOD_BINS = np.array([5, 12, 18])
+
+# Horários de pico
+RUSH_LABELS = ['off_peak', 'rush']
+RUSH_HOURS = [8, 9, 17, 18, 19]
+
+DAY_LABELS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# Tabelas de lookup hora -> código (uma entrada por hora do dia)
+PERIOD_BY_HOUR = np.searchsorted(PERIOD_BINS, np.arange(24), side='right').astype(np.int8)
+RUSH_BY_HOUR = np.isin(np.arange(24), RUSH_HOURS).astype(np.int8)
+
+
+def _categorical(codes, labels, index):
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=index)
+
+
+def _with_nat(values, nat, index):
+    # Mantém o comportamento do acessor .dt: NaT vira NaN
+    s = pd.Series(values, index=index)
+    if nat.any():
+        s = s.where(~nat)
+    return s
+
+
+def add_time_features(df, time_col='created_at', end_col='ended_at'):
+    index = df.index
+
+    # 1. Uma única leitura dos timestamps como inteiros (ns desde a época)
+    ts = df[time_col].to_numpy(dtype='datetime64[ns]')
+    nat = np.isnat(ts)
+    ns = np.where(nat, 0, ts.view('i8'))
+
+    days = ns // NS_PER_DAY
+    hour = ((ns // NS_PER_HOUR) % 24).astype(np.int8)
+    dow = ((days + 3) % 7).astype(np.int8)  # 1970-01-01 foi uma quinta-feira
+    day = days.astype('datetime64[D]')
+    month = (day.astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+
+    # 2. Features categóricas via lookup no array de horas
+    period_codes = PERIOD_BY_HOUR[hour]
+    rush_codes = RUSH_BY_HOUR[hour]
+    if nat.any():
+        period_codes = np.where(nat, -1, period_codes)
+        rush_codes = np.where(nat, -1, rush_codes)
+        dow = np.where(nat, -1, dow)
+
+    day = day.astype('datetime64[ns]')
+    day[nat] = np.datetime64('NaT')
+
+    # 3. Atribuição das colunas (mesma ordem do pipeline original)
+    df['day'] = day
+    df['month'] = _with_nat(month, nat, index)
+    df['hour'] = _with_nat(hour, nat, index)
+    df['day_period'] = _categorical(period_codes, PERIOD_LABELS, index)
+    df['charging_duration_min'] = ((df[end_col] - df[time_col]).dt.total_seconds() / 60).astype('float32')
+    df['day_of_week'] = _categorical(dow, DAY_LABELS, index)
+    df['is_weekend'] = ((dow >= 5) & ~nat).astype(np.int8)
+    df['rush_period'] = _categorical(rush_codes, RUSH_LABELS, index)
+
+    return df
@@ -1,25 +1,9 @@
-import pandas as pd
-from scipy.spatial import cKDTree
-import numpy as np
-from tqdm import tqdm
+from preprocessing.parsing import parse_int_column, parse_datetime_column, save_datetime_caches
+from preprocessing.spatial_index import build_tree, query_knn, dedup_points
     
-def latlng_to_xyz(lat, lng, R = 6371.0): # R: Earth radius
-    lat_r = np.radians(lat)
-    lng_r = np.radians(lng)
-    x = R * np.cos(lat_r) * np.cos(lng_r)
-    y = R * np.cos(lat_r) * np.sin(lng_r)
-    z = R * np.sin(lat_r)
-    return np.vstack([x, y, z]).T
-    
-def transform_traffic_data(df, df_stations, radius_km=2.0): 
+def transform_traffic_data(df, df_stations, radius_km=2.0, cache_dir=None, cell_m=None):
     # 2. Normalize observations column
-    df['observations'] = (
-        df['observations']
-        .astype(str)
-        .str
-        .replace(',', '')
-        .astype(int)
-        )
+    df['observations'] = parse_int_column(df['observations'], min_dtype='int32')
 
     # 2. Create labels for traffic level
     df['traffic_level'] = 'low'
@@ -28,21 +12,18 @@ def transform_traffic_data(df, df_stations, radius_km=2.0):
     df.loc[df['observations']>=1000, 'traffic_level'] = 'intense'
     df.loc[df['observations']>=3000, 'traffic_level'] = 'very_intense'
 
-    df = df.sort_values('observations', ascending=False)  # coloca o maior primeiro
-    df = df.drop_duplicates(subset=['lat', 'lng'], keep='first')[:].reset_index(drop=True)
+    # Um ponto por coordenada (ou por célula de cell_m metros), o de maior observations
+    df = dedup_points(df, 'observations', cell_m)
     
     # 3. Process date (week_observed) column
-    df['week_observed'] = pd.to_datetime(df['week_observed'], format='%B %d, %Y')
-    
-    # Converte para coordenadas 3D
-    traffic_xyz = latlng_to_xyz(df['lat'].values, df['lng'].values)
-    stations_xyz = latlng_to_xyz(df_stations['lat'].values, df_stations['lng'].values)
+    df['week_observed'] = parse_datetime_column(df['week_observed'], '%B %d, %Y', cache_dir)
+    save_datetime_caches()
     
-    # Árvore com os pontos de tráfego
-    tree = cKDTree(traffic_xyz)
+    # Árvore com os pontos de tráfego (coordenadas 3D)
+    tree = build_tree(df['lat'].values, df['lng'].values, cache_dir)
     
     # Para cada estação, encontrar o ponto de tráfego mais próximo
-    distances, indices = tree.query(stations_xyz, k=1)  # k=1 → mais próximo
+    distances, indices = query_knn(tree, df_stations['lat'].values, df_stations['lng'].values, k=1)
     
     # Recuperar as informações do ponto de tráfego mais próximo
     df_stations['nearest_traffic_distance_km'] = distances      # distância em km
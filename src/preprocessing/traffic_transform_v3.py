@@ -1,17 +1,11 @@
-import pandas as pd
-from scipy.spatial import cKDTree
 import numpy as np
-from tqdm import tqdm
+
+from preprocessing.parsing import parse_int_column, parse_datetime_column, save_datetime_caches
+from preprocessing.spatial_index import dedup_points
     
-def transform_traffic_data(df): 
+def transform_traffic_data(df, cache_dir=None, cell_m=None):
     # 2. Normalize observations column
-    df['observations'] = (
-        df['observations']
-        .astype(str)
-        .str
-        .replace(',', '')
-        .astype(int)
-        )
+    df['observations'] = parse_int_column(df['observations'], min_dtype='int32')
 
     # 2. Create labels for traffic level
     df['traffic_level'] = 'low'
@@ -20,11 +14,12 @@ def transform_traffic_data(df):
     df.loc[df['observations']>=1000, 'traffic_level'] = 'intense'
     df.loc[df['observations']>=3000, 'traffic_level'] = 'very_intense'
 
-    df = df.sort_values('observations', ascending=False)  # coloca o maior primeiro
-    df = df.drop_duplicates(subset=['lat', 'lng'], keep='first')[:].reset_index(drop=True)
+    # Um ponto por coordenada (ou por célula de cell_m metros), o de maior observations
+    df = dedup_points(df, 'observations', cell_m)
     
     # 3. Process date (week_observed) column
-    df['week_observed'] = pd.to_datetime(df['week_observed'], format='%B %d, %Y')
+    df['week_observed'] = parse_datetime_column(df['week_observed'], '%B %d, %Y', cache_dir)
+    save_datetime_caches()
 
     df['traffic_point_id'] = np.arange(len(df))
 
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from preprocessing.parsing import parse_int_column
+from preprocessing.swaps_transform import DATETIME_FORMAT
+
+# -----------------------
+# Validação dos arquivos brutos numa única passada por row group: nulos por coluna, duplicatas
+# (linha inteira e chave), cardinalidades e regras de domínio. Cada coluna é codificada uma vez
+# (dicionário do Arrow); duplicatas e cardinalidades usam hashes de 64 bits dos valores distintos
+# propagados pelos códigos, e as regras compartilham os valores parseados do row group.
+# Regras 'error' quebrariam o pipeline (com fail_fast, a validação para no primeiro row group com erro);
+# regras 'warning' só vão para o relatório.
+# -----------------------
+# Região metropolitana de São Paulo (com folga)
+CITY_BBOX = {'lat': (-24.1, -23.3), 'lng': (-47.0, -46.3)}
+BATTERY_RANGE = (0, 100)
+TRAFFIC_WEEK_FORMAT = '%B %d, %Y'
+N_EXAMPLES = 5
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+HASH_MULTIPLIER = 0x100000001B3
+
+
+def _encoded(table, col, cache):
+    # Códigos (-1 = nulo) e valores distintos da coluna no row group, via dicionário do Arrow
+    key = ('encoded', col)
+    if key not in cache:
+        encoded = pc.dictionary_encode(table.column(col)).combine_chunks()
+        codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False).astype(np.int64)
+        cache[key] = codes, pd.Index(encoded.dictionary.to_pandas())
+    return cache[key]
+
+
+def _hashes(table, col, cache):
+    # Hash de 64 bits por linha: hash dos valores distintos, propagado pelos códigos
+    codes, uniques = _encoded(table, col, cache)
+    unique_hashes = pd.util.hash_array(uniques.to_numpy())
+    return np.where(codes >= 0, unique_hashes[codes], NULL_HASH), unique_hashes
+
+
+def _combine(hashes):
+    combined = np.zeros(len(hashes[0]), dtype=np.uint64)
+    for h in hashes:
+        combined = combined * np.uint64(HASH_MULTIPLIER) ^ h
+    return combined
+
+
+def _valid(table, col):
+    return table.column(col).is_valid().to_numpy(zero_copy_only=False)
+
+
+def _dates(table, col, format, cache):
+    # Parse só das strings distintas ainda não vistas no arquivo (cache['memo'] vale para todos os row groups)
+    key = ('dates', col)
+    if key not in cache:
+        codes, uniques = _encoded(table, col, cache)
+        known = cache['memo'].get(format)
+        if known is None:
+            known = pd.Series(dtype='datetime64[ns]', index=pd.Index([], dtype=object))
+        new = uniques[~uniques.isin(known.index)]
+        if len(new):
+            parsed = pd.to_datetime(pd.Index(new, dtype=object), format=format, errors='coerce')
+            known = pd.concat([known, pd.Series(parsed.to_numpy(), index=new)])
+            cache['memo'][format] = known
+        values = known.reindex(uniques).to_numpy(dtype='datetime64[ns]')
+        cache[key] = np.where(codes >= 0, values[np.maximum(codes, 0)], np.datetime64('NaT'))
+    return cache[key]
+
+
+def _ints(table, col, cache):
+    # Inteiros (NaN = nulo ou inválido) parseados só nos valores distintos do row group
+    key = ('ints', col)
+    if key not in cache:
+        codes, uniques = _encoded(table, col, cache)
+        values = parse_int_column(pd.Series(uniques), min_dtype='int64', errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        cache[key] = np.where(codes >= 0, values[np.maximum(codes, 0)] if len(values) else np.nan, np.nan)
+    return cache[key]
+
+
+def unparseable_ints(col):
+    # Valores presentes que não são inteiros (nulos são contados à parte)
+    return lambda table, cache: np.isnan(_ints(table, col, cache)) & _valid(table, col)
+
+
+def unparseable_dates(col, format):
+    return lambda table, cache: np.isnat(_dates(table, col, format, cache)) & _valid(table, col)
+
+
+def out_of_range(col, bounds):
+    def rule(table, cache):
+        values = _ints(table, col, cache)
+        with np.errstate(invalid='ignore'):
+            return (values < bounds[0]) | (values > bounds[1])
+    return rule
+
+
+def ended_before_created(table, cache):
+    return _dates(table, 'ended_at', DATETIME_FORMAT, cache) < _dates(table, 'created_at', DATETIME_FORMAT, cache)
+
+
+def outside_city(lat_col, lng_col):
+    def rule(table, cache):
+        lat = pd.to_numeric(table.column(lat_col).to_pandas(), errors='coerce').to_numpy(dtype='float64')
+        lng = pd.to_numeric(table.column(lng_col).to_pandas(), errors='coerce').to_numpy(dtype='float64')
+        inside = (lat >= CITY_BBOX['lat'][0]) & (lat <= CITY_BBOX['lat'][1]) & (lng >= CITY_BBOX['lng'][0]) & (lng <= CITY_BBOX['lng'][1])
+        return ~inside & ~np.isnan(lat) & ~np.isnan(lng)
+    return rule
+
+
+def negative(col):
+    def rule(table, cache):
+        with np.errstate(invalid='ignore'):
+            return _ints(table, col, cache) < 0
+    return rule
+
+
+# Especificação de cada arquivo bruto: colunas obrigatórias, chave (duplicatas) e regras (nome, severidade, máscara)
+SPECS = {
+    'swaps': {
+        'required': ['created_at', 'ended_at', 'cabinet_id', 'swap_station_id', 'rider_id', 'status',
+                     'battery_in_level', 'battery_out_level'],
+        # Um rider não troca duas baterias no mesmo minuto
+        'key': ['rider_id', 'created_at'],
+        'rules': [
+            ('created_at_unparseable', 'error', unparseable_dates('created_at', DATETIME_FORMAT)),
+            ('ended_at_unparseable', 'error', unparseable_dates('ended_at', DATETIME_FORMAT)),
+            ('ended_before_created', 'warning', ended_before_created),
+            ('swap_station_id_unparseable', 'warning', unparseable_ints('swap_station_id')),
+            ('cabinet_id_unparseable', 'warning', unparseable_ints('cabinet_id')),
+            ('rider_id_unparseable', 'warning', unparseable_ints('rider_id')),
+            ('battery_in_level_unparseable', 'warning', unparseable_ints('battery_in_level')),
+            ('battery_out_level_unparseable', 'warning', unparseable_ints('battery_out_level')),
+            ('battery_in_level_out_of_range', 'warning', out_of_range('battery_in_level', BATTERY_RANGE)),
+            ('battery_out_level_out_of_range', 'warning', out_of_range('battery_out_level', BATTERY_RANGE))
+        ]
+    },
+    'stations': {
+        'required': ['swap_station_id', 'Endereço', 'latitude', 'longitude'],
+        'key': ['swap_station_id'],
+        'rules': [
+            ('swap_station_id_unparseable', 'error', unparseable_ints('swap_station_id')),
+            ('coordinates_outside_city', 'warning', outside_city('latitude', 'longitude'))
+        ]
+    },
+    'traffic': {
+        'required': ['lat', 'lng', 'week_observed', 'observations'],
+        'key': ['lat', 'lng'],
+        'rules': [
+            ('week_observed_unparseable', 'error', unparseable_dates('week_observed', TRAFFIC_WEEK_FORMAT)),
+            ('observations_unparseable', 'warning', unparseable_ints('observations')),
+            ('observations_negative', 'warning', negative('observations')),
+            ('coordinates_outside_city', 'warning', outside_city('lat', 'lng'))
+        ]
+    }
+}
+
+
+def _n_duplicates(hashes):
+    if not hashes:
+        return 0
+    values = np.concatenate(hashes)
+    return int(len(values) - len(pd.unique(values)))
+
+
+def validate_file(path, name, fail_fast=False, report_path=None, fingerprint=None):
+    # Uma passada por row group; retorna o relatório (dict) e, se report_path, grava como JSON
+    # fingerprint: identifica o arquivo/código validados, para quem reaproveita o relatório (cached_report)
+    spec = SPECS[name]
+    pf = pq.ParquetFile(path)
+    columns = pf.schema_arrow.names
+    missing = [c for c in spec['required'] if c not in columns]
+    if missing:
+        raise ValueError(f"{name}: missing required columns {missing} in {path}")
+
+    n_rows = 0
+    nulls = dict.fromkeys(columns, 0)
+    distinct = {c: [] for c in columns}
+    row_hashes, key_hashes = [], []
+    violations = {rule: {'severity': severity, 'count': 0, 'examples': []} for rule, severity, _ in spec['rules']}
+
+    memo = {}
+    for i in range(pf.num_row_groups):
+        table = pf.read_row_group(i)
+        n_rows += table.num_rows
+        cache = {'memo': memo}
+
+        # Duplicatas e cardinalidades: só os hashes distintos de cada row group seguem para o final
+        hashes = {}
+        for col in columns:
+            nulls[col] += table.column(col).null_count
+            hashes[col], unique_hashes = _hashes(table, col, cache)
+            distinct[col].append(unique_hashes)
+        row_hashes.append(_combine([hashes[c] for c in columns]))
+        key_hashes.append(_combine([hashes[c] for c in spec['key']]))
+
+        errors = []
+        for rule, severity, fn in spec['rules']:
+            mask = np.asarray(fn(table, cache), dtype=bool)
+            count = int(mask.sum())
+            if not count:
+                continue
+            v = violations[rule]
+            v['count'] += count
+            if len(v['examples']) < N_EXAMPLES:
+                rows = np.flatnonzero(mask)[:N_EXAMPLES - len(v['examples'])]
+                v['examples'] += table.take(rows).to_pandas().astype(str).to_dict('records')
+            if severity == 'error':
+                errors.append(f'{rule} ({count} rows)')
+        if fail_fast and errors:
+            raise ValueError(f"{name}: validation failed in row group {i} of {path}: {', '.join(errors)}")
+
+    # Duplicatas de linha entre row groups: hashes repetidos no total
+    report = {
+        'dataset': name,
+        'path': path,
+        'rows': n_rows,
+        'row_groups': pf.num_row_groups,
+        'duplicate_rows': _n_duplicates(row_hashes),
+        'duplicate_keys': _n_duplicates(key_hashes),
+        'key': spec['key'],
+        'columns': {
+            col: {
+                'type': str(pf.schema_arrow.field(col).type),
+                'nulls': nulls[col],
+                'null_rate': round(nulls[col] / n_rows, 6) if n_rows else 0.0,
+                'distinct': int(len(pd.unique(np.concatenate(distinct[col])))) if distinct[col] else 0
+            }
+            for col in columns
+        },
+        'rules': {
+            rule: {**v, 'rate': round(v['count'] / n_rows, 6) if n_rows else 0.0}
+            for rule, v in violations.items()
+        }
+    }
+    report['errors'] = [rule for rule, v in report['rules'].items() if v['severity'] == 'error' and v['count']]
+    if fingerprint is not None:
+        report['fingerprint'] = fingerprint
+    log_report(report)
+
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    if fail_fast and report['errors']:
+        raise ValueError(f"{name}: validation failed: {report['errors']}")
+    return report
+
+
+def cached_report(report_path, fingerprint, fail_fast=False):
+    # Relatório gravado com o mesmo fingerprint (None se não existe ou mudou)
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path) as f:
+        report = json.load(f)
+    if report.get('fingerprint') != fingerprint:
+        return None
+    logging.info(f"✓ Validation {report['dataset']}: unchanged since {report_path}")
+    if fail_fast and report['errors']:
+        raise ValueError(f"{report['dataset']}: validation failed: {report['errors']}")
+    return report
+
+
+def report_table(report):
+    # Uma linha por coluna: tipo, nulos e cardinalidade
+    return pd.DataFrame.from_dict(report['columns'], orient='index')
+
+
+def log_report(report):
+    logging.info(
+        f"Validation {report['dataset']}: {report['rows']:,} rows, {report['duplicate_rows']:,} duplicate rows, "
+        f"{report['duplicate_keys']:,} duplicate keys {tuple(report['key'])}\n" + report_table(report).to_string()
+    )
+    for rule, v in report['rules'].items():
+        if v['count']:
+            log = logging.error if v['severity'] == 'error' else logging.warning
+            log(f"Validation {report['dataset']}: {rule}: {v['count']:,} rows ({v['rate']:.4%}), e.g. {v['examples'][:2]}")
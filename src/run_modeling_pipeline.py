@@ -1,28 +1,93 @@
-import pandas as pd
+import argparse
 import logging
+import os
 logging.basicConfig(level=logging.INFO)
 
-from modeling.transform_model_data import transform_model_data
+from modeling.transform_model_data import transform_model_data, MODEL_COLUMNS
 from modeling.make_predictions import predict_ids
+from modeling.model_store import evict
+from modeling.reconciliation import METHODS
+from preprocessing.storage import read_dataset, write_dataset
+from dag import run_dag, step
+from instrumentation import start_run, log_summary
 
-def main():
-    logging.info("Starting modeling pipeline...")
-    logging.info('↓ Loading processed dataset...')
-    df = pd.read_parquet('../data/processed/merged_data.parquet', engine='pyarrow')
+SWAPS_PROCESSED_PATH = '../data/processed/swaps_processed.parquet'
+MODEL_DIR = '../data/model'
+CACHE_DIR = '../data/cache'
+METRICS_PATH = '../data/metrics/modeling.jsonl'
+MODEL_STORE_DIR = '../data/model_store'
+STORE_MAX_MB = 1024
 
-    logging.info('☼ Transforming processed dataset...')
-    df_cabinets_hourly, df_cabinets_daily, df_stations_hourly, df_stations_daily = transform_model_data(df)
-    
-    logging.info('☼ Making predictions...')
-    pred_cabinets_hourly, pred_cabinets_daily, pred_stations_hourly, pred_stations_daily = predict_ids(df_cabinets_hourly, df_cabinets_daily, df_stations_hourly, df_stations_daily)
+def read_model_swaps(path):
+    # Apenas as colunas usadas pela modelagem, direto da tabela fato de swaps
+    return read_dataset(path, columns=MODEL_COLUMNS)
 
-    logging.info('↑ Saving model datasets to disk...')
-    pred_cabinets_hourly.to_parquet('../data/model/pred_cabinets_hourly.parquet', index=False, engine='pyarrow', compression='snappy')
-    pred_cabinets_daily.to_parquet('../data/model/pred_cabinets_daily.parquet', index=False, engine='pyarrow', compression='snappy')
-    pred_stations_hourly.to_parquet('../data/model/pred_stations_hourly.parquet', index=False, engine='pyarrow', compression='snappy')
-    pred_stations_daily.to_parquet('../data/model/pred_stations_daily.parquet', index=False, engine='pyarrow', compression='snappy')
+def write_predictions(pred_cabinets_hourly, pred_cabinets_daily, pred_stations_hourly, pred_stations_daily, model_dir=MODEL_DIR):
+    # Datasets particionados por mês de ds e ordenados por id (leitura filtrada por id/janela)
+    for name, df_pred in [
+        ('pred_cabinets_hourly', pred_cabinets_hourly),
+        ('pred_cabinets_daily', pred_cabinets_daily),
+        ('pred_stations_hourly', pred_stations_hourly),
+        ('pred_stations_daily', pred_stations_daily)
+    ]:
+        write_dataset(df_pred, os.path.join(model_dir, f'{name}.parquet'), time_col='ds', sort_columns=['id', 'ds'])
+
+def main(force=False, profile=(), workers=1, top_stations=5, stream=False, engine='prophet', model_store=False, store_max_mb=STORE_MAX_MB,
+         reconciliation=None):
+    logging.info("Starting modeling pipeline...")
+    start_run(METRICS_PATH, profile=profile)
+    series = ['cabinets_hourly', 'cabinets_daily', 'stations_hourly', 'stations_daily']
+    preds = [f'pred_{name}' for name in series]
+    pred_files = [os.path.join(MODEL_DIR, f'{name}.parquet') for name in preds]
+    # workers > 1: um ajuste do Prophet por processo, com BLAS/Stan limitados a uma thread cada
+    # (no motor global, threads do LightGBM). Com o store (opcional), só as séries que mudaram são reajustadas,
+    # partindo dos parâmetros do ajuste anterior
+    predict_params = {'workers': workers, 'engine': engine}
+    if model_store:
+        predict_params.update({'store_dir': MODEL_STORE_DIR, 'store_max_mb': store_max_mb})
+        if force:
+            # --force reajusta do zero: sem previsões reaproveitadas nem warm start dos modelos guardados
+            logging.info(f'☼ Clearing {evict(MODEL_STORE_DIR, max_models=0)} stored models (--force)')
+    predict_inputs, transform_params = series, {'top_stations': top_stations}
+    if reconciliation is not None:
+        # Previsões coerentes entre cabinets e estações (bottom_up/top_down ajustam um nível só); a hierarquia
+        # sai do mesmo step que monta as séries
+        predict_inputs = series + ['hierarchy']
+        transform_params['hierarchy'] = True
+        predict_params['reconciliation'] = reconciliation
+    steps = [step('transform_model_data', transform_model_data, ['swaps_processed'], predict_inputs, transform_params)]
+    if stream:
+        # Cada previsão vai direto para os datasets (nem o step nem o cache guardam as previsões em memória)
+        steps.append(step('predict_ids', predict_ids, predict_inputs, params={**predict_params, 'model_dir': MODEL_DIR}, files=pred_files))
+    else:
+        steps += [
+            step('predict_ids', predict_ids, predict_inputs, preds, predict_params),
+            step('write_predictions', write_predictions, preds, params={'model_dir': MODEL_DIR}, files=pred_files)
+        ]
+    # Os modelos só são reajustados se os swaps processados (ou o código) mudarem
+    ran = run_dag(steps, {'swaps_processed': (SWAPS_PROCESSED_PATH, read_model_swaps)}, CACHE_DIR, force=force)
+    log_summary()
 
-    logging.info('✓ Modeling pipeline completed successfully. Predictions files stored in: data/modeling/')
+    logging.info(f'✓ Modeling pipeline completed successfully ({len(ran)} steps run). Predictions files stored in: data/model/')
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--force', action='store_true', help='ignore cached step outputs and refit every model from scratch (clears the model store)')
+    parser.add_argument('--profile', nargs='+', default=(), help='dump a cProfile of these steps (e.g. predict_ids, prophet_fit) next to the metrics file')
+    parser.add_argument('--workers', type=int, default=1, help='fit the per-id Prophet models in this many processes')
+    parser.add_argument('--top-stations', type=int, default=5, help='forecast only the N stations with most swaps (0 = all stations)')
+    parser.add_argument('--stream', action='store_true', help='write each forecast straight to the prediction datasets instead of collecting them in memory')
+    parser.add_argument('--engine', choices=['prophet', 'global'], default='prophet',
+                        help="'prophet': one model per id; 'global': one LightGBM model across all ids (requires lightgbm)")
+    parser.add_argument('--model-store', action='store_true',
+                        help='keep fitted Prophet models between runs: unchanged series reuse their forecast, changed ones warm-start from the stored fit')
+    parser.add_argument('--store-max-mb', type=float, default=STORE_MAX_MB, help='evict the least recently used stored models beyond this size')
+    parser.add_argument('--reconciliation', choices=METHODS, default=None,
+                        help="make station forecasts the sum of their cabinets': 'bottom_up' fits cabinets only, 'top_down' stations only "
+                             "(split by recent cabinet shares), 'ols'/'mint' fit both levels and reconcile them")
+    args = parser.parse_args()
+    main(
+        force=args.force, profile=args.profile, workers=args.workers, top_stations=args.top_stations, stream=args.stream,
+        engine=args.engine, model_store=args.model_store, store_max_mb=args.store_max_mb,
+        reconciliation=args.reconciliation
+    )
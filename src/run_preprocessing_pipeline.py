@@ -1,11 +1,25 @@
+import os
 import pandas as pd
+import argparse
 import logging
 logging.basicConfig(level=logging.INFO)
 
-from preprocessing.swaps_transform import transform_swaps_data
+from preprocessing.swaps_transform import transform_swaps_data, DATETIME_FORMAT, SORT_COLUMNS
+from preprocessing.swaps_stream import transform_swaps_stream
 from preprocessing.stations_transform import transform_stations_data
 from preprocessing.traffic_transform_v3 import transform_traffic_data
-from preprocessing.merge_data_v2 import merge_data
+from preprocessing.merge_data_v2 import merge_data, add_station_metrics, traffic_summary
+from preprocessing.duckdb_backend import transform_swaps_duckdb, merge_data_duckdb
+from preprocessing.merge_stream import merge_data_stream
+from preprocessing.incremental import (
+    build_swaps_state, merge_swaps_state, state_station_metrics, load_state, save_state, new_swaps, track_open_rows, part_name
+)
+from preprocessing.parsing import parse_datetime_column
+from preprocessing.schema import write_parquet, SWAPS_DTYPES, STATIONS_DTYPES
+from preprocessing.storage import write_dataset
+from preprocessing.validation import validate_file, cached_report
+from dag import run_dag, step, files_fingerprint, code_fingerprint
+from instrumentation import start_run, measure, log_summary
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,29 +27,223 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
-def main():
+SWAPS_RAW_PATH = '../data/raw/case_data_science_charging_ops___battery_swap_2025-09-26T17_45_41.358859844Z.parquet'
+STATIONS_RAW_PATH = '../data/raw/case_data_science_charging_ops___swap_stations_info_2025-09-26T13_21_20.332938629Z.parquet'
+TRAFFIC_RAW_PATH = '../data/raw/ds_case_data_2025-09-29T23_51_12.68945565Z.parquet'
+SWAPS_PROCESSED_PATH = '../data/processed/swaps_processed.parquet'
+STATIONS_PROCESSED_PATH = '../data/processed/stations_processed.parquet'
+TRAFFIC_PROCESSED_PATH = '../data/processed/traffic_processed.parquet'
+CACHE_DIR = '../data/cache'
+STATE_DIR = '../data/state'
+METRICS_PATH = '../data/metrics/preprocessing.jsonl'
+VALIDATION_DIR = '../data/metrics/validation'
+RAW_FILES = {'swaps': SWAPS_RAW_PATH, 'stations': STATIONS_RAW_PATH, 'traffic': TRAFFIC_RAW_PATH}
+
+def stream_swaps_dataset(src_path, dst_path, cache_dir=None, batch_size=250_000, spill_dir=None):
+    # Processa os swaps em batches e grava o dataset incrementalmente; a saída do step é o caminho
+    # do dataset (o merge também lê em lotes, então os swaps nunca ficam inteiros em memória)
+    transform_swaps_stream(src_path, dst_path, batch_size=batch_size, spill_dir=spill_dir, cache_dir=cache_dir)
+    return dst_path
+
+def validation_steps(fail_fast=False):
+    # Um relatório por arquivo bruto em data/metrics/validation/ (só roda de novo se o arquivo mudar)
+    steps = []
+    for name in RAW_FILES:
+        report_path = os.path.join(VALIDATION_DIR, f'{name}.json')
+        steps.append(step(
+            f'validate_{name}', validate_file, [f'{name}_file'], [f'{name}_report'],
+            {'name': name, 'fail_fast': fail_fast, 'report_path': report_path}, files=[report_path]
+        ))
+    return steps
+
+def validate_raw_files(fail_fast=False):
+    # Fora do DAG (--incremental): só revalida arquivos brutos ou código de validação alterados desde o último relatório
+    for name, path in RAW_FILES.items():
+        report_path = os.path.join(VALIDATION_DIR, f'{name}.json')
+        fingerprint = f'{files_fingerprint([path])}:{code_fingerprint(validate_file)}'
+        with measure(f'validate_{name}', kind='step'):
+            if cached_report(report_path, fingerprint, fail_fast) is None:
+                validate_file(path, name, fail_fast, report_path, fingerprint)
+
+def pipeline_steps(stream_swaps=False, radii_km=None, parallel_writes=False, backend='pandas', traffic_cell_m=None,
+                   batch_size=250_000, spill_dir=None, validate=True, fail_fast=False):
+    if backend == 'duckdb':
+        # Lê o parquet bruto direto no DuckDB (projeção e filtros na leitura, execução multi-thread)
+        swaps_step = step('transform_swaps_duckdb', transform_swaps_duckdb, ['raw_swaps'], ['swaps_processed'])
+    elif stream_swaps:
+        swaps_step = step(
+            'transform_swaps_stream', stream_swaps_dataset, ['raw_swaps'], ['swaps_processed'],
+            {'dst_path': SWAPS_PROCESSED_PATH, 'cache_dir': CACHE_DIR, 'batch_size': batch_size, 'spill_dir': spill_dir},
+            files=[SWAPS_PROCESSED_PATH]
+        )
+    else:
+        swaps_step = step('transform_swaps_data', transform_swaps_data, ['raw_swaps'], ['swaps_processed'], {'cache_dir': CACHE_DIR})
+
+    merge_params = {'cache_dir': CACHE_DIR, 'radii_km': radii_km}
+    if backend == 'duckdb':
+        merge_name, merge_fn = 'merge_data_duckdb', merge_data_duckdb
+    elif stream_swaps:
+        # swaps_processed é o caminho do dataset: métricas por agregados parciais em lotes, com spill em disco
+        merge_name, merge_fn = 'merge_data_stream', merge_data_stream
+        merge_params.update({'batch_size': batch_size, 'spill_dir': spill_dir})
+    else:
+        merge_name, merge_fn = 'merge_data', merge_data
+
+    steps = [
+        swaps_step,
+        step('transform_stations_data', transform_stations_data, ['raw_stations'], ['stations_processed'], {'cache_dir': CACHE_DIR}),
+        step(
+            'transform_traffic_data', transform_traffic_data, ['raw_traffic'], ['traffic_processed'],
+            {'cache_dir': CACHE_DIR, 'cell_m': traffic_cell_m}
+        ),
+        step(
+            merge_name, merge_fn, ['swaps_processed', 'stations_processed', 'traffic_processed'], ['stations_final'], merge_params
+        )
+    ]
+    writes = []
+    if not stream_swaps:
+        writes.append(step(
+            'write_swaps', write_dataset, ['swaps_processed'],
+            params={'path': SWAPS_PROCESSED_PATH, 'sort_columns': SORT_COLUMNS, 'dtypes': SWAPS_DTYPES}, files=[SWAPS_PROCESSED_PATH]
+        ))
+    writes += [
+        step('write_stations', write_parquet, ['stations_final'], params={'path': STATIONS_PROCESSED_PATH, 'dtypes': STATIONS_DTYPES}, files=[STATIONS_PROCESSED_PATH]),
+        step('write_traffic', write_parquet, ['traffic_processed'], params={'path': TRAFFIC_PROCESSED_PATH}, files=[TRAFFIC_PROCESSED_PATH])
+    ]
+    if not parallel_writes:
+        # Gravações em sequência, depois do merge (como no pipeline original)
+        previous = steps[-1]['name']
+        for w in writes:
+            w['after'].append(previous)
+            previous = w['name']
+    if not validate:
+        return steps + writes
+
+    # Cada transform espera a validação do seu arquivo (com fail_fast, um erro interrompe o pipeline antes dele)
+    validations = validation_steps(fail_fast)
+    for transform, validation in zip(steps[:3], validations):
+        transform['after'].append(validation['name'])
+    return validations + steps + writes
+
+def main(stream_swaps=False, radii_km=None, force=False, workers=1, executor='thread', parallel_writes=False, profile=(), backend='pandas', traffic_cell_m=None,
+         batch_size=250_000, spill_dir=None, validate=True, fail_fast=False):
     logging.info("Starting data pipeline...")
+    start_run(METRICS_PATH, profile=profile)
+    # Fontes só são lidas se algum step que depende delas precisar rodar
+    sources = {
+        'raw_swaps': (SWAPS_RAW_PATH, str) if stream_swaps or backend == 'duckdb' else SWAPS_RAW_PATH,
+        'raw_stations': STATIONS_RAW_PATH,
+        'raw_traffic': TRAFFIC_RAW_PATH,
+        **{f'{name}_file': (path, str) for name, path in RAW_FILES.items()}
+    }
+    # workers > 1: leitura + transformação de swaps, estações e tráfego em paralelo; o merge começa quando os três terminam
+    steps = pipeline_steps(stream_swaps, radii_km, parallel_writes, backend, traffic_cell_m, batch_size, spill_dir, validate, fail_fast)
+    ran = run_dag(steps, sources, CACHE_DIR, force=force, workers=workers, executor=executor)
+    log_summary()
+
+    logging.info(f"✓ Pipeline completed successfully ({len(ran)} steps run). Processed files stored in: data/processed/")
+    
+def _write_incremental(df_swaps_processed, df_stations_final, df_traffic_processed, state, first_run, run_id):
+    if not df_swaps_processed.empty:
+        # Novos swaps entram como arquivos extras nas partições mensais do dataset
+        write_dataset(
+            df_swaps_processed, SWAPS_PROCESSED_PATH, sort_columns=SORT_COLUMNS, dtypes=SWAPS_DTYPES,
+            part_name=part_name(state, run_id), overwrite=first_run
+        )
+    write_parquet(df_stations_final, STATIONS_PROCESSED_PATH, STATIONS_DTYPES)
+    write_parquet(df_traffic_processed, TRAFFIC_PROCESSED_PATH)
+    save_state(state, STATE_DIR)
+
+def main_incremental(radii_km=None, profile=(), traffic_cell_m=None, validate=True, fail_fast=False):
+    logging.info("Starting incremental data pipeline...")
+    run_id = start_run(METRICS_PATH, profile=profile)
+    state = load_state(STATE_DIR)
+    first_run = state is None
+
+    if validate:
+        logging.info('☼ Validating raw datasets...')
+        validate_raw_files(fail_fast)
+
     logging.info('↓ Loading raw datasets...')
-    df_swaps = pd.read_parquet('../data/raw/case_data_science_charging_ops___battery_swap_2025-09-26T17_45_41.358859844Z.parquet', engine='pyarrow')
-    df_stations = pd.read_parquet('../data/raw/case_data_science_charging_ops___swap_stations_info_2025-09-26T13_21_20.332938629Z.parquet', engine='pyarrow')
-    df_traffic = pd.read_parquet('../data/raw/ds_case_data_2025-09-29T23_51_12.68945565Z.parquet', engine='pyarrow')
+    with measure('load_raw', kind='load') as m:
+        df_swaps = pd.read_parquet(SWAPS_RAW_PATH, engine='pyarrow')
+        df_stations = pd.read_parquet(STATIONS_RAW_PATH, engine='pyarrow')
+        df_traffic = pd.read_parquet(TRAFFIC_RAW_PATH, engine='pyarrow')
+        m['outputs'] = (df_swaps, df_stations, df_traffic)
+
+    # Apenas swaps a partir do minuto do watermark que ainda não foram processados (sem estado: histórico completo)
+    created_at = parse_datetime_column(df_swaps['created_at'], DATETIME_FORMAT, CACHE_DIR)
+    df_swaps, created_at = new_swaps(df_swaps, created_at, state)
+    if state is not None:
+        logging.info(f"☼ Watermark: {state['watermark']} ({len(df_swaps)} new swaps)")
+    previous = state
 
-    logging.info('☼ Step 1/4: Transforming swaps dataset...')
-    df_swaps_processed = transform_swaps_data(df_swaps)
+    logging.info('☼ Step 1/4: Transforming new swaps...')
+    with measure('transform_swaps_data', inputs=df_swaps, kind='step') as m:
+        df_swaps_processed = transform_swaps_data(df_swaps, cache_dir=CACHE_DIR)
+        m['outputs'] = df_swaps_processed
+    with measure('merge_swaps_state', inputs=df_swaps_processed, kind='step'):
+        if not df_swaps_processed.empty:
+            state = merge_swaps_state(state, build_swaps_state(df_swaps_processed))
+    if state is None:
+        raise ValueError('No swaps available to initialize the incremental state.')
+    state = track_open_rows(state, previous, df_swaps, created_at)
     logging.info('☼ Step 2/4: Transforming stations dataset...')
-    df_stations_processed = transform_stations_data(df_stations)
+    with measure('transform_stations_data', inputs=df_stations, kind='step') as m:
+        df_stations_processed = transform_stations_data(df_stations, cache_dir=CACHE_DIR)
+        m['outputs'] = df_stations_processed
     logging.info('☼ Step 3/4: Transforming traffic dataset...')
-    df_traffic_processed = transform_traffic_data(df_traffic)
-    logging.info('☼ Step 4/4: Merging datasets and computing final metrics...')
-    df_final, df_stations_final = merge_data(df_swaps_processed, df_stations_processed, df_traffic_processed)
-    
-    logging.info('↑ Saving processed datasets to disk...')
-    df_swaps_processed.to_parquet('../data/processed/swaps_processed.parquet', index=False, engine='pyarrow', compression='snappy')
-    df_stations_final.to_parquet('../data/processed/stations_processed.parquet', index=False, engine='pyarrow', compression='snappy')
-    df_traffic_processed.to_parquet('../data/processed/traffic_processed.parquet', index=False, engine='pyarrow', compression='snappy')
-    df_final.to_parquet('../data/processed/merged_data.parquet', index=False, engine='pyarrow', compression='snappy')
+    with measure('transform_traffic_data', inputs=df_traffic, kind='step') as m:
+        df_traffic_processed = transform_traffic_data(df_traffic, cache_dir=CACHE_DIR, cell_m=traffic_cell_m)
+        m['outputs'] = df_traffic_processed
+    logging.info('☼ Step 4/4: Updating station metrics from the aggregate state...')
+    with measure('add_station_metrics', inputs=df_stations_processed, kind='step') as m:
+        cabinet_counts, daily_stats, hourly_stats, swaps_count_week = state_station_metrics(state)
+        df_stations_final = add_station_metrics(
+            df_stations_processed,
+            cabinet_counts,
+            daily_stats,
+            hourly_stats,
+            traffic_summary(df_stations_processed, df_traffic_processed, cache_dir=CACHE_DIR, radii_km=radii_km),
+            swaps_count_week
+        )
+        m['outputs'] = df_stations_final
+
+    logging.info('↑ Saving processed datasets and state to disk...')
+    with measure('write_outputs', kind='step'):
+        _write_incremental(df_swaps_processed, df_stations_final, df_traffic_processed, state, first_run, run_id)
+    log_summary()
+
+    logging.info('✓ Incremental pipeline completed successfully. Processed files stored in: data/processed/')
 
-    logging.info('✓ Pipeline completed successfully. Processed files stored in: data/processed/')
-    
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stream', action='store_true', help='process the swaps dataset in bounded-memory batches')
+    parser.add_argument('--incremental', action='store_true', help='process only swaps newer than the stored watermark')
+    parser.add_argument('--radii', type=float, nargs='+', help='extra traffic catchment radii in km (adds obs_*_r<meters> columns)')
+    parser.add_argument('--force', action='store_true', help='ignore cached step outputs and rerun every step')
+    parser.add_argument('--workers', type=int, default=1, help='run independent steps concurrently with this many workers')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread', help='worker pool used when --workers > 1')
+    parser.add_argument('--profile', nargs='+', default=(), help='dump a cProfile of these steps next to the metrics file')
+    parser.add_argument('--parallel-writes', action='store_true', help='write each output as soon as it is ready, concurrently with other steps')
+    parser.add_argument('--backend', choices=['pandas', 'duckdb'], default='pandas', help='engine for the swaps transform and merge aggregations (duckdb is optional)')
+    parser.add_argument('--traffic-cell', type=float, help='merge traffic points within the same grid cell of this size in meters (default: exact coordinates)')
+    parser.add_argument('--batch-size', type=int, default=250_000, help='rows per batch with --stream (bounds memory use)')
+    parser.add_argument('--spill-dir', help='directory for the --stream spill files (default: system temp dir)')
+    parser.add_argument('--skip-validation', action='store_true', help='do not validate the raw files before transforming them')
+    parser.add_argument('--fail-fast', action='store_true', help='stop at the first row group with a validation error')
+    args = parser.parse_args()
+    if args.backend == 'duckdb' and (args.stream or args.incremental):
+        parser.error('--backend duckdb cannot be combined with --stream or --incremental')
+    if args.incremental:
+        main_incremental(
+            radii_km=args.radii, profile=args.profile, traffic_cell_m=args.traffic_cell,
+            validate=not args.skip_validation, fail_fast=args.fail_fast
+        )
+    else:
+        main(
+            stream_swaps=args.stream, radii_km=args.radii, force=args.force,
+            workers=args.workers, executor=args.executor, parallel_writes=args.parallel_writes, profile=args.profile,
+            backend=args.backend, traffic_cell_m=args.traffic_cell, batch_size=args.batch_size, spill_dir=args.spill_dir,
+            validate=not args.skip_validation, fail_fast=args.fail_fast
+        )
\ No newline at end of file